@@ -28,13 +28,10 @@ st.sidebar.success("Select a page from the menu above ↑")
 
 # Optional fun touch: show how many tickers are in the portfolio right on the homepage
 try:
-    from data_layer import engine, Ticker
-    from sqlalchemy.orm import sessionmaker
+    from page_cache import cached_ticker_count
 
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    ticker_count = session.query(Ticker).count()
-    session.close()
+    # Cached per data generation: reruns don't query the DB
+    ticker_count = cached_ticker_count()
 
     if ticker_count > 0:
         st.sidebar.metric("Tickers in Portfolio", ticker_count)
@@ -60,6 +57,16 @@ with st.sidebar.expander("Diagnostics"):
     except importlib.metadata.PackageNotFoundError:
         st.error("plotly is NOT installed in this environment.")
 
+    # Connection pool health
+    try:
+        from data_layer import pool_stats
+        stats = pool_stats()
+        st.write(f"DB connections opened: {stats['connects']} — checkouts: {stats['checkouts']} "
+                 f"(in use: {stats['in_use']}, held {stats['checkout_seconds']:.2f}s total)")
+        st.caption(stats['pool'])
+    except Exception:
+        pass
+
     # Show requirements.txt if present
     try:
         with open('requirements.txt', 'r') as f:
@@ -1,34 +1,22 @@
 import streamlit as st
-import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 from datetime import datetime, timedelta
-from sqlalchemy.orm import sessionmaker
 
-from data_layer import engine, Ticker, Price, fetch_and_store, remove_ticker
-from trading_bot import run_simulation, trades_to_df, calculate_final_value
+from data_layer import fetch_and_store, remove_ticker, get_all_tickers, load_prices
+from trading_bot import run_simulation, calculate_final_value
 
 
 st.set_page_config(page_title="Portfolio Analytics", layout="wide")
 st.title("📊 Portfolio Analytics Dashboard")
 
-Session = sessionmaker(bind=engine)
-
 # === SIDEBAR ===
 with st.sidebar:
     st.header("Portfolio Management")
     action = st.radio("Action", ["View Portfolio", "Trading Simulation", "Add Ticker", "Remove Ticker"]) 
 
 
-def get_all_tickers():
-    session = Session()
-    try:
-        tickers = session.query(Ticker).order_by(Ticker.symbol).all()
-        return tickers
-    finally:
-        session.close()
-
-
 if action == "View Portfolio":
     st.subheader("Price History")
 
@@ -51,38 +39,20 @@ if action == "View Portfolio":
 
         if selected_tickers:
             ids = [symbol_to_id[s] for s in selected_tickers]
-            session = Session()
-            try:
-                prices = session.query(Price).filter(
-                    Price.ticker_id.in_(ids),
-                    Price.date >= start_date,
-                    Price.date <= end_date
-                ).order_by(Price.date).all()
-            finally:
-                session.close()
-
-            if not prices:
+            prices = load_prices(ids, start_date, end_date, columns=('open', 'high', 'low', 'close', 'volume'))
+
+            if prices.empty:
                 st.info("No data for selected date range")
             else:
-                # Group by ticker_id
-                grouped = {}
-                for p in prices:
-                    grouped.setdefault(p.ticker_id, []).append(p)
-
                 fig = go.Figure()
                 colors = px.colors.qualitative.Plotly
-                for idx, (tid, plist) in enumerate(grouped.items()):
+                for idx, (tid, pdf) in enumerate(prices.groupby('ticker_id', sort=False)):
                     symbol = ticker_map.get(tid, str(tid))
-                    dates = [p.date for p in plist]
-                    closes = [p.close for p in plist]
-                    opens = [p.open_price or 0 for p in plist]
-                    highs = [p.high or 0 for p in plist]
-                    lows = [p.low or 0 for p in plist]
-                    vols = [p.volume or 0 for p in plist]
+                    ohl = pdf[['open', 'high', 'low']].fillna(0).to_numpy()
 
                     fig.add_trace(go.Scatter(
-                        x=dates,
-                        y=closes,
+                        x=pdf['date'],
+                        y=pdf['close'],
                         mode='lines',
                         name=symbol,
                         line=dict(width=2, color=colors[idx % len(colors)]),
@@ -91,7 +61,7 @@ if action == "View Portfolio":
                                       'High: $%{customdata[1]:.2f}<br>' +
                                       'Low: $%{customdata[2]:.2f}<br>' +
                                       'Volume: %{customdata[3]:,d}<extra></extra>',
-                        customdata=list(zip(opens, highs, lows, vols))
+                        customdata=np.column_stack([ohl, pdf['volume'].to_numpy()])
                     ))
 
                 fig.update_layout(
@@ -166,13 +136,13 @@ elif action == "Trading Simulation": # NEW SECTION
                     monthly_investment=float(monthly_investment)
                 )
             
-            if "error" in results:
-                st.error(results["error"])
+            if results.error:
+                st.error(results.error)
             else:
-                history_df = results['history_df']
-                trades_list = results['trades']
-                final_cash = results['final_cash']
-                final_shares = results['final_shares']
+                history_df = results.history_df
+                trades_df = results.trades_df
+                final_cash = results.final_cash
+                final_shares = results.final_shares
                 
                 final_value = calculate_final_value(history_df, final_cash, final_shares)
 
@@ -191,11 +161,8 @@ elif action == "Trading Simulation": # NEW SECTION
                 summary_cols[2].metric("Final Cash Balance", f"${final_cash:,.2f}") # <--- NEW
                 final_asset_value = final_value - final_cash
                 summary_cols[3].metric("Final Stock Value", f"${final_asset_value:,.2f}") # <--- NEW
-                summary_cols[4].metric("Total Trades", len(trades_list))
-                # total deposits
-                trades_df = trades_to_df(trades_list)
-                deposits_df = trades_df[trades_df['Action'] == 'DEPOSIT'] if not trades_df.empty else pd.DataFrame()
-                total_deposits = deposits_df['Cash Change'].sum() if not deposits_df.empty else 0.0
+                summary_cols[4].metric("Total Trades", len(trades_df))
+                total_deposits = results.total_deposits
                 st.markdown(f"**Monthly deposit:** ${monthly_investment:,.2f} — Total deposited: ${total_deposits:,.2f}")
                 
                 # --- Price History & Trades Graph ---
@@ -220,10 +187,9 @@ elif action == "Trading Simulation": # NEW SECTION
                 ))
 
                 # Add trade markers
-                trades_df = trades_to_df(trades_list)
                 if not trades_df.empty:
-                    buy_trades = trades_df[trades_df['Action'] == 'BUY']
-                    sell_trades = trades_df[trades_df['Action'] == 'SELL']
+                    buy_trades = trades_df[results.is_buy]
+                    sell_trades = trades_df[results.is_sell]
 
                     # Buy markers (Green Up Arrow)
                     fig.add_trace(go.Scatter(
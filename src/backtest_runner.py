@@ -0,0 +1,176 @@
+import os
+import math
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from sweep import sweep_arrays, SWEEP_PARAMS
+from price_matrix import get_price_matrix
+
+logger = logging.getLogger(__name__)
+
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", "0")) or os.cpu_count() or 1
+# Pools are started from the (multi-threaded) Streamlit server, where fork can copy locks
+# other threads hold into the children; forkserver/spawn children start clean
+POOL_START_METHOD = os.getenv("POOL_START_METHOD") or (
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+# Set in each pool process by _attach_prices: numpy views over the parent's shared memory.
+# Only pool processes use it; in-process runs pass their arrays explicitly.
+_worker = {}
+
+
+def pool_context():
+    """multiprocessing context for worker pools (POOL_START_METHOD)."""
+    return multiprocessing.get_context(POOL_START_METHOD)
+
+
+def share_array(array: np.ndarray):
+    """
+    Copy `array` into a new shared-memory block; returns (block, (name, shape, dtype) spec for
+    workers). The caller closes and unlinks the block once the workers are done.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, order='F')
+    view[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach_prices(close_spec, present_spec, dates):
+    blocks, arrays = [], []
+    for name, shape, dtype in (close_spec, present_spec):
+        shm = shared_memory.SharedMemory(name=name)
+        blocks.append(shm)  # keep the mapping alive for the worker's lifetime
+        arrays.append(np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, order='F'))
+    _worker.update(blocks=blocks, close=arrays[0], present=arrays[1], dates=dates)
+
+
+def _run_job(job, series):
+    """One ticker x one chunk of parameter sets, evaluated as a single batched sweep."""
+    col, param_index, params, initial_cash, monthly_investment = job
+    present = series['present'][:, col]
+    close = series['close'][:, col][present]
+    if len(close) == 0:
+        return col, param_index, None
+    dates = series['dates'][present]
+    out = sweep_arrays(np.ascontiguousarray(close), dates, initial_cash,
+                       monthly_investment=monthly_investment, **params)
+    return col, param_index, out
+
+
+def _run_pooled_job(job):
+    return _run_job(job, _worker)
+
+
+def run_universe_backtest(
+    param_sets: pd.DataFrame,
+    ticker_ids: Optional[Sequence[int]] = None,
+    start_date=None,
+    end_date=None,
+    initial_cash: float = 10000.0,
+    monthly_investment: float = 0.0,
+    workers: Optional[int] = None,
+    chunksize: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Backtest every parameter set on every ticker using a process pool.
+
+    `param_sets` has one row per rule set with the SWEEP_PARAMS columns (see
+    sweep.parameter_grid). Close prices come from the shared PriceMatrix and are placed in
+    shared memory once, so jobs only carry a column index and their parameter chunk. Each
+    job runs up to `chunksize` parameter sets for one ticker through sweep_arrays.
+    workers=0 runs everything in this process.
+
+    Returns one row per (ticker, parameter set): ticker_id, the parameters, final_value,
+    final_cash, final_shares, trades and max_drawdown. Tickers without data are left out.
+    """
+    missing = [n for n in SWEEP_PARAMS if n not in param_sets.columns]
+    if missing:
+        raise ValueError(f"param_sets is missing columns: {missing}")
+    workers = BACKTEST_WORKERS if workers is None else workers
+
+    matrix = get_price_matrix()
+    if ticker_ids is not None:
+        ticker_ids = [t for t in ticker_ids if t in matrix.ticker_ids]
+    matrix = matrix.slice(start_date, end_date, ticker_ids)
+    n_tickers, n_params = len(matrix.ticker_ids), len(param_sets)
+    if n_tickers == 0 or n_params == 0:
+        return pd.DataFrame(columns=['ticker_id', *SWEEP_PARAMS])
+
+    if chunksize is None:
+        # Enough jobs to keep every worker busy, but as few (large, vectorised) ones as possible
+        jobs_per_ticker = max(1, math.ceil(4 * max(1, workers) / n_tickers))
+        chunksize = math.ceil(n_params / jobs_per_ticker)
+    param_arrays = {n: param_sets[n].to_numpy(dtype=float) for n in SWEEP_PARAMS}
+    jobs = [
+        (col, np.arange(lo, min(lo + chunksize, n_params)),
+         {n: a[lo:lo + chunksize] for n, a in param_arrays.items()},
+         initial_cash, monthly_investment)
+        for col in range(n_tickers)
+        for lo in range(0, n_params, chunksize)
+    ]
+
+    t0 = time.perf_counter()
+    close = np.asfortranarray(matrix.fields['close'], dtype=np.float64)
+    present = np.asfortranarray(matrix.present)
+    if workers == 0:
+        series = {'close': close, 'present': present, 'dates': matrix.dates}
+        results = [_run_job(job, series) for job in jobs]
+    else:
+        close_shm, close_spec = share_array(close)
+        present_shm, present_spec = share_array(present)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(), initializer=_attach_prices,
+                                     initargs=(close_spec, present_spec, matrix.dates)) as pool:
+                results = list(pool.map(_run_pooled_job, jobs, chunksize=max(1, len(jobs) // (workers * 8))))
+        finally:
+            for shm in (close_shm, present_shm):
+                shm.close()
+                shm.unlink()
+
+    frames = []
+    for col, param_index, out in results:
+        if out is None:
+            continue
+        frame = param_sets.iloc[param_index].reset_index(drop=True)
+        frame.insert(0, 'ticker_id', int(matrix.ticker_ids[col]))
+        for name, values in out.items():
+            frame[name] = values
+        frames.append(frame)
+    logger.info(f"Backtested {n_tickers} tickers x {n_params} parameter sets in {len(jobs)} jobs "
+                f"on {workers or 1} processes: {time.perf_counter() - t0:.2f}s")
+    if not frames:
+        return pd.DataFrame(columns=['ticker_id', *SWEEP_PARAMS])
+    return pd.concat(frames, ignore_index=True)
+
+
+# === BENCHMARK ===
+if __name__ == "__main__":
+    import sys
+    import price_matrix
+    from sweep import parameter_grid
+
+    logging.basicConfig(level=logging.INFO)
+    n_tickers = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = np.random.default_rng(1)
+    dates = np.arange(np.datetime64('2014-01-01'), np.datetime64('2024-01-01'))
+    dates = dates[np.is_busday(dates)]
+    arrays = {
+        'ticker_id': np.repeat(np.arange(1, n_tickers + 1), len(dates)),
+        'date': np.tile(dates, n_tickers),
+        'close': (100 * np.exp(rng.normal(0, 0.02, (n_tickers, len(dates))).cumsum(axis=1))).ravel(),
+    }
+    price_matrix._shared = price_matrix.PriceMatrix.from_arrays(arrays)
+
+    grid = parameter_grid(buy_threshold=np.linspace(0.5, 5, 10), sell_threshold=np.linspace(-5, -0.5, 10),
+                          trade_percent=[0.25, 0.5], buy_slippage=[1.0], sell_slippage=[1.0])
+    for workers in sorted({0, 1, 2, os.cpu_count() or 1}):
+        t0 = time.perf_counter()
+        df = run_universe_backtest(grid, monthly_investment=100.0, workers=workers)
+        print(f"workers={workers}: {len(df)} results in {time.perf_counter() - t0:.2f}s")
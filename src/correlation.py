@@ -0,0 +1,222 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from analytics import simple_returns
+from data_layer import on_prices_changed
+from price_matrix import get_price_matrix
+
+CORR_BLOCK = int(os.getenv("CORR_BLOCK", "256"))             # columns per block when accumulating
+CORR_CACHE_ENTRIES = int(os.getenv("CORR_CACHE_ENTRIES", "32"))
+
+
+class PairwiseStats:
+    """
+    Sufficient statistics for pairwise-complete covariance/correlation of N return series.
+
+    For every pair (i, j), over the rows where both have a return: count n, sums of x_i
+    (S[i, j]; S.T gives x_j), sums of x_i * x_j (P) and of x_i ** 2 (Q). Rows are added or
+    removed as (rows x N) blocks of returns with NaN for "no return", so a rolling window
+    moves forward by adding the new rows and removing the ones that fell out, in
+    O(k * N^2) for k rows rather than O(window * N^2). Accumulation runs CORR_BLOCK
+    columns at a time, so temporaries stay at (block x N).
+    """
+
+    def __init__(self, n_assets: int):
+        shape = (n_assets, n_assets)
+        self.n = np.zeros(shape)
+        self.S = np.zeros(shape)
+        self.P = np.zeros(shape)
+        self.Q = np.zeros(shape)
+
+    def _accumulate(self, returns: np.ndarray, sign: float):
+        if len(returns) == 0:
+            return
+        valid = ~np.isnan(returns)
+        m = valid.astype(np.float64)
+        x = np.where(valid, returns, 0.0)
+        for lo in range(0, x.shape[1], CORR_BLOCK):
+            cols = slice(lo, lo + CORR_BLOCK)
+            xa, ma = x[:, cols], m[:, cols]
+            self.n[cols] += sign * (ma.T @ m)
+            self.S[cols] += sign * (xa.T @ m)
+            self.P[cols] += sign * (xa.T @ x)
+            self.Q[cols] += sign * ((xa * xa).T @ m)
+
+    def add(self, returns: np.ndarray):
+        self._accumulate(returns, 1.0)
+
+    def remove(self, returns: np.ndarray):
+        self._accumulate(returns, -1.0)
+
+    def covariance(self, min_periods: int = 2) -> np.ndarray:
+        """Pairwise-complete sample covariance (ddof=1); NaN where a pair has < min_periods rows."""
+        n = self.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = (self.P - self.S * self.S.T / n) / (n - 1)
+        cov[n < max(min_periods, 2)] = np.nan
+        return cov
+
+    def correlation(self, min_periods: int = 2) -> np.ndarray:
+        """Pairwise-complete Pearson correlation, as DataFrame.corr() computes it."""
+        n = self.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var_i = self.Q - self.S * self.S / n  # x_i's spread over the rows shared with j
+            var_j = var_i.T
+            corr = (self.P - self.S * self.S.T / n) / np.sqrt(var_i * var_j)
+        np.clip(corr, -1.0, 1.0, out=corr)
+        corr[n < max(min_periods, 2)] = np.nan
+        return corr
+
+
+# === CACHED SERVICE ===
+# (universe, window) -> (stats, last date); a later end date slides the cached window
+# forward instead of recomputing it. Entries for tickers whose prices change are dropped.
+_windows = OrderedDict()
+_windows_lock = threading.Lock()
+
+
+def _universe_prices(ticker_ids, end):
+    """Closes for the universe on its own calendar (days where any of them has a bar)."""
+    view = get_price_matrix().slice(None, end, ticker_ids)
+    rows = view.present.any(axis=1)
+    return view.dates[rows], view.fields['close'][rows], view.present[rows]
+
+
+def _returns(close, present, lo, hi):
+    """simple_returns(close)[lo:hi], without computing the rows before lo."""
+    if lo == 0:
+        return simple_returns(close[:hi])
+    seen = present[:lo]
+    last = lo - 1 - seen[::-1].argmax(axis=0)  # each column's last bar before lo
+    prev = np.where(seen.any(axis=0), close[last, np.arange(close.shape[1])], np.nan)
+    return simple_returns(np.vstack([prev, close[lo:hi]]))[1:]
+
+
+def _window_stats(ticker_ids, end, window):
+    """(sorted ticker ids, PairwiseStats) for the window, reusing or sliding a cached one."""
+    matrix = get_price_matrix()
+    if ticker_ids is None:
+        ticker_ids = matrix.ticker_ids.tolist()
+    ticker_ids = sorted({int(t) for t in ticker_ids if t in matrix.ticker_ids})
+    if not ticker_ids:
+        return ticker_ids, PairwiseStats(0)
+
+    dates, close, present = _universe_prices(ticker_ids, end)
+    # Versions in the key: columns reloaded after another process's write start afresh
+    key = (tuple(ticker_ids), window, tuple(matrix.version(t) for t in ticker_ids))
+    with _windows_lock:
+        cached = _windows.get(key)
+        if cached is not None:
+            _windows.move_to_end(key)
+
+    hi = len(dates)
+    lo = max(0, hi - window)
+    stats = None
+    if cached is not None:
+        stats, last_date = cached
+        prev_hi = int(np.searchsorted(dates, last_date, side='right'))
+        if prev_hi == 0 or dates[prev_hi - 1] != last_date or prev_hi > hi or hi - prev_hi >= window:
+            stats = None  # calendar moved under us, an earlier end, or nothing left to reuse
+        elif prev_hi < hi:
+            # Slide: add the new rows, remove those that left the window
+            new_stats = PairwiseStats(len(ticker_ids))
+            for name in ('n', 'S', 'P', 'Q'):
+                setattr(new_stats, name, getattr(stats, name).copy())
+            new_stats.add(_returns(close, present, prev_hi, hi))
+            new_stats.remove(_returns(close, present, max(0, prev_hi - window), lo))
+            stats = new_stats
+    if stats is None:
+        stats = PairwiseStats(len(ticker_ids))
+        stats.add(_returns(close, present, lo, hi))
+
+    if hi:
+        with _windows_lock:
+            _windows[key] = (stats, dates[hi - 1])
+            _windows.move_to_end(key)
+            while len(_windows) > CORR_CACHE_ENTRIES:
+                _windows.popitem(last=False)
+    return ticker_ids, stats
+
+
+def correlation_matrix(ticker_ids: Optional[Sequence[int]] = None, end=None, window: int = 252,
+                       min_periods: int = 20, kind: str = 'correlation') -> pd.DataFrame:
+    """
+    Correlation (or kind='covariance') of daily returns over the last `window` trading days
+    up to `end`, for `ticker_ids` (None = every ticker in the PriceMatrix). Pairs with
+    fewer than `min_periods` shared days are NaN. Returns a ticker_id x ticker_id DataFrame.
+    """
+    ticker_ids, stats = _window_stats(ticker_ids, end, window)
+    index = pd.Index(ticker_ids, name='ticker_id')
+    values = stats.covariance(min_periods) if kind == 'covariance' else stats.correlation(min_periods)
+    return pd.DataFrame(values, index=index, columns=index)
+
+
+def return_moments(ticker_ids: Optional[Sequence[int]] = None, end=None, window: int = 252,
+                   min_periods: int = 20):
+    """
+    (ticker_ids, mean daily return per ticker, daily covariance matrix) over the same cached
+    window as correlation_matrix. Means with fewer than `min_periods` returns are NaN.
+    """
+    ticker_ids, stats = _window_stats(ticker_ids, end, window)
+    count = np.diag(stats.n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.diag(stats.S) / count
+    mean[count < max(min_periods, 2)] = np.nan
+    return np.array(ticker_ids, dtype=np.int64), mean, stats.covariance(min_periods)
+
+
+def clear_correlation_cache():
+    with _windows_lock:
+        _windows.clear()
+
+
+@on_prices_changed
+def _drop_changed_windows(changes: dict):
+    changed = set(changes)
+    with _windows_lock:
+        for key in [k for k in _windows if changed.intersection(k[0])]:
+            del _windows[key]
+
+
+# === CHECK / BENCHMARK ===
+if __name__ == "__main__":
+    import sys
+    import time
+    import price_matrix
+
+    n_tickers = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rng = np.random.default_rng(5)
+    dates = np.arange(np.datetime64('2014-01-01'), np.datetime64('2024-01-01'))
+    dates = dates[np.is_busday(dates)]
+    market = rng.normal(0, 0.01, len(dates))
+    rets = market[:, None] * rng.uniform(0.2, 1.5, n_tickers) + rng.normal(0, 0.015, (len(dates), n_tickers))
+    close = 100 * np.exp(rets.cumsum(axis=0))
+    close[rng.random(close.shape) < 0.02] = np.nan  # scattered missing bars
+    close[:-100, :10] = np.nan  # a few recent listings
+    present = ~np.isnan(close)
+    rows, cols = np.nonzero(present)
+    price_matrix._shared = price_matrix.PriceMatrix.from_arrays(
+        {'ticker_id': cols + 1, 'date': dates[rows], 'close': close[rows, cols]})
+
+    t0 = time.perf_counter()
+    corr = correlation_matrix(window=252)
+    cold = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    ref = pd.DataFrame(simple_returns(close)[-252:]).corr(min_periods=20).to_numpy()
+    pandas_seconds = time.perf_counter() - t0
+    assert np.allclose(corr.to_numpy(), ref, equal_nan=True, atol=1e-10)
+    print(f"{n_tickers} tickers, 252-day window: {cold * 1000:.0f} ms "
+          f"(pandas DataFrame.corr on ready returns: {pandas_seconds * 1000:.0f} ms); matches pandas")
+
+    # Slide the cached window forward by 5 days
+    correlation_matrix(window=252, end=dates[-6])
+    t0 = time.perf_counter()
+    slid = correlation_matrix(window=252, end=dates[-1])
+    print(f"slide by 5 days: {(time.perf_counter() - t0) * 1000:.0f} ms")
+    assert np.allclose(slid.to_numpy(), ref, equal_nan=True, atol=1e-9)
+    print("check passed: slid window matches a fresh computation")
@@ -1,10 +1,21 @@
-import yfinance as yf
 import pandas as pd
-from datetime import date
-from sqlalchemy import create_engine, Column, Integer, String, Date, Float, ForeignKey
+import numpy as np
+import time
+from datetime import date, timedelta
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Date, Float, ForeignKey, select, update
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import sqlite, postgresql
 import logging
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+
+from analytics import simple_returns, rolling_volatility
+from ingest import fetch_concurrently
+from migrations import migrate, tune_sqlite
+from providers import PriceProvider, get_default_provider
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,14 +26,96 @@ import os
 # Read database connection from env so deployed apps can use a managed DB (Postgres, etc.).
 # Example for Streamlit Cloud / Supabase: set `DATABASE_URL` as a secret.
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///portfolio_data.db")
-engine = create_engine(DATABASE_URL, echo=False, future=True)
+
+# Pool settings for server databases (Postgres etc.). Streamlit serves each browser
+# session on its own thread, so keep enough connections for a handful of concurrent users;
+# pre-ping/recycle drop connections a managed DB has silently closed.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+def _make_engine(url):
+    if url.startswith("sqlite"):
+        # Connections are shared between Streamlit's script threads; the pool hands each
+        # one to a single thread at a time. `timeout` waits out a concurrent writer.
+        connect_args = {"check_same_thread": False, "timeout": 30}
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # In-memory DB only exists on its one connection
+            return create_engine(url, future=True, connect_args=connect_args, poolclass=StaticPool)
+        return create_engine(url, future=True, connect_args=connect_args,
+                             pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    return create_engine(url, future=True, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                         pool_pre_ping=True, pool_recycle=DB_POOL_RECYCLE, pool_timeout=DB_POOL_TIMEOUT)
+
+# The one engine for the whole process: every page and module goes through it.
+engine = _make_engine(DATABASE_URL)
+tune_sqlite(engine)
+
+# expire_on_commit=False so objects returned from a closed session stay readable
+Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+_pool_metrics = {"connects": 0, "checkouts": 0, "checkins": 0, "checkout_seconds": 0.0}
+_pool_metrics_lock = threading.Lock()
+
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_conn, record):
+    with _pool_metrics_lock:
+        _pool_metrics["connects"] += 1
+
+@event.listens_for(engine, "checkout")
+def _on_checkout(dbapi_conn, record, proxy):
+    record.info["checked_out_at"] = time.perf_counter()
+    with _pool_metrics_lock:
+        _pool_metrics["checkouts"] += 1
+
+@event.listens_for(engine, "checkin")
+def _on_checkin(dbapi_conn, record):
+    started = record.info.pop("checked_out_at", None)
+    with _pool_metrics_lock:
+        _pool_metrics["checkins"] += 1
+        if started is not None:
+            _pool_metrics["checkout_seconds"] += time.perf_counter() - started
+
+def pool_stats() -> dict:
+    """Connection pool counters: new connections, checkouts/checkins, time held, and pool status."""
+    with _pool_metrics_lock:
+        stats = dict(_pool_metrics)
+    stats["in_use"] = stats["checkouts"] - stats["checkins"]
+    stats["pool"] = engine.pool.status()
+    return stats
+
+@contextmanager
+def session_scope():
+    """Session that commits on success, rolls back on error and always closes."""
+    session = Session()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
 Base = declarative_base()
 
 class Ticker(Base):
     __tablename__ = 'tickers'
     id = Column(Integer, primary_key=True)
     symbol = Column(String(20), unique=True, nullable=False, index=True)
-    prices = relationship("Price", back_populates="ticker", cascade="all, delete-orphan")
+    # Bumped (to a fresh time_ns value) whenever this ticker's prices are written, so
+    # caches keyed on it never confuse old and new data, even if an id is reused.
+    data_version = Column(BigInteger, nullable=False, default=0, server_default='0')
+    # data_version the derived_prices rows were computed from; -1 = never built
+    derived_version = Column(BigInteger, nullable=False, default=-1, server_default='-1')
+    # Dates already requested from the provider, [fetched_from, fetched_until): a sync never
+    # asks for a gap inside it again (pre-listing history, long market closures)
+    fetched_from = Column(Date)
+    fetched_until = Column(Date)
+    # passive_deletes: let the DB's ON DELETE CASCADE remove prices instead of loading them
+    prices = relationship("Price", back_populates="ticker", cascade="all, delete-orphan",
+                          passive_deletes=True)
 
 class Price(Base):
     __tablename__ = 'prices'
@@ -35,15 +128,273 @@ class Price(Base):
     volume = Column(Integer)
     ticker = relationship("Ticker", back_populates="prices")
 
-# Create tables if not exist
-Base.metadata.create_all(engine)
+# Returns and rolling statistics materialized per ticker and day (see DERIVED SERIES)
+class DerivedPrice(Base):
+    __tablename__ = 'derived_prices'
+    ticker_id = Column(Integer, ForeignKey('tickers.id', ondelete='CASCADE'), primary_key=True)
+    date = Column(Date, primary_key=True)
+    ret = Column(Float)       # simple return since the previous bar (NULL on the first)
+    log_ret = Column(Float)
+    vol_21 = Column(Float)    # annualised rolling volatility of ret, NULL until the window is full
+    vol_63 = Column(Float)
+    vol_252 = Column(Float)
+    peak = Column(Float)      # running max close over the whole history
+    drawdown = Column(Float)  # close / peak - 1
+
+# Create tables / apply pending schema migrations (see migrations.MIGRATIONS).
+# Runs once per process: Streamlit reruns reuse the imported module.
+migrate(engine, Base.metadata)
+
+# === CHANGE NOTIFICATIONS ===
+# In-process caches built on the prices table (e.g. price_matrix) register here to be
+# told when fetch_and_store / remove_ticker change it.
+_price_listeners = []
+
+def on_prices_changed(callback):
+    """
+    Register `callback(changes)` to run after prices are committed; usable as a decorator.
+
+    `changes` maps ticker_id -> earliest date written, or None if the ticker was removed.
+    """
+    _price_listeners.append(callback)
+    return callback
+
+# Data generations: an in-process write counter, bumped (globally and for each changed
+# ticker) before the listeners run. Caches that key on it (e.g. page_cache) see this
+# process's writes at once without a query to check.
+_generation_lock = threading.Lock()
+_data_generation = 0
+_ticker_generations = {}
+
+def data_generation(ticker_ids=None):
+    """
+    The current data generation, or with `ticker_ids` a tuple of each ticker's generation
+    (the global generation at its last change; 0 if unchanged since the process started).
+    """
+    with _generation_lock:
+        if ticker_ids is None:
+            return _data_generation
+        return tuple(_ticker_generations.get(int(t), 0) for t in ticker_ids)
+
+def _bump_data_generation(ticker_ids) -> int:
+    global _data_generation
+    with _generation_lock:
+        _data_generation += 1
+        for ticker_id in ticker_ids:
+            _ticker_generations[int(ticker_id)] = _data_generation
+        return _data_generation
+
+def _notify_prices_changed(changes: dict):
+    _bump_data_generation(changes)
+    for callback in list(_price_listeners):
+        try:
+            callback(changes)
+        except Exception as e:
+            logger.error(f"Price change listener {callback} failed: {e}")
+
+def get_all_tickers():
+    """All tickers, ordered by symbol."""
+    with session_scope() as session:
+        return session.query(Ticker).order_by(Ticker.symbol).all()
+
+def get_data_version(ticker_id: int):
+    """Current data_version of a ticker, or None if it doesn't exist."""
+    with engine.connect() as conn:
+        return conn.execute(select(Ticker.data_version).where(Ticker.id == ticker_id)).scalar()
+
+def get_data_versions(ticker_ids=None) -> dict:
+    """{ticker_id: data_version} for `ticker_ids` (all tickers by default), in one query."""
+    stmt = select(Ticker.id, Ticker.data_version)
+    if ticker_ids is not None:
+        stmt = stmt.where(Ticker.id.in_(list(ticker_ids)))
+    with engine.connect() as conn:
+        return dict(conn.execute(stmt).all())
+
+def count_tickers() -> int:
+    with session_scope() as session:
+        return session.query(Ticker).count()
+
+# === BULK UPSERT ===
+# Rows per INSERT ... ON CONFLICT statement. Large enough to amortise round trips,
+# small enough to keep a single statement's parameter list reasonable.
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "5000"))
+
+PRICE_COLUMNS = ['date', 'ticker_id', 'close', 'open_price', 'high', 'low', 'volume']
+
+# Dialects with a native INSERT ... ON CONFLICT DO UPDATE; others fall back to session.merge().
+_UPSERT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+def history_to_rows(hist: pd.DataFrame, ticker_id: int) -> list:
+    """Convert a yfinance history frame into `prices` row dicts via whole-column arrays."""
+    n = len(hist)
+    if n == 0:
+        return []
+
+    dates = hist.index.date
+    close = hist['Close'].to_numpy(dtype=float).tolist()
+    opens = hist['Open'].to_numpy(dtype=float).tolist()
+    high = hist['High'].to_numpy(dtype=float).tolist()
+    low = hist['Low'].to_numpy(dtype=float).tolist()
+    volume_arr = hist['Volume'].to_numpy(dtype=float)
+    volume_ok = ~np.isnan(volume_arr)
+    volume = [int(v) if ok else None for v, ok in zip(volume_arr.tolist(), volume_ok.tolist())]
+
+    ticker_ids = [ticker_id] * n
+    return [dict(zip(PRICE_COLUMNS, values))
+            for values in zip(dates, ticker_ids, close, opens, high, low, volume)]
+
+def upsert_prices(session, rows: list, batch_size: int = None) -> int:
+    """
+    Write price rows with batched INSERT ... ON CONFLICT (date, ticker_id) DO UPDATE.
+
+    The latest write wins for every non-key column, matching the old session.merge() behaviour.
+    Does not commit; the caller owns the transaction. Returns the number of rows written.
+    """
+    if not rows:
+        return 0
+    batch_size = batch_size or UPSERT_BATCH_SIZE
+
+    make_insert = _UPSERT_INSERTS.get(session.get_bind().dialect.name)
+    if make_insert is None:
+        # Unknown dialect: keep the portable (slow) per-row merge.
+        for row in rows:
+            session.merge(Price(**row))
+        return len(rows)
+
+    table = Price.__table__
+    stmt = make_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.date, table.c.ticker_id],
+        set_={c: stmt.excluded[c] for c in PRICE_COLUMNS if c not in ('date', 'ticker_id')},
+    )
+    for start in range(0, len(rows), batch_size):
+        session.execute(stmt, rows[start:start + batch_size])
+    return len(rows)
+
+# === DELTA SYNC ===
+# Re-download this many calendar days before the last stored bar to pick up revised bars.
+SYNC_OVERLAP_DAYS = int(os.getenv("SYNC_OVERLAP_DAYS", "5"))
+# Stored bars further apart than this (calendar days) are treated as a hole to back-fill.
+# Weekends plus a holiday never exceed 4 days.
+SYNC_MAX_GAP_DAYS = 5
+
+def _to_date(value):
+    return None if value is None else pd.Timestamp(value).date()
+
+def _outside(gap, covered):
+    """Parts of the [start, end) `gap` (end None = open) not inside the `covered` range."""
+    lo, hi = gap
+    c_lo, c_hi = covered
+    if c_lo is None or c_hi is None:
+        return [gap]
+    parts = []
+    if lo < c_lo:
+        parts.append((lo, c_lo if hi is None else min(hi, c_lo)))
+    if hi is None or hi > c_hi:
+        parts.append((max(lo, c_hi), hi))
+    return parts
+
+def _merge_coverage(covered, start, end):
+    """
+    (fetched_from, fetched_until) after the whole [start, end) window has been requested:
+    the union with the recorded range when they touch, else just the new window.
+    """
+    c_lo, c_hi = covered
+    if c_lo is None or c_hi is None or start > c_hi or end < c_lo:
+        return start, end
+    return min(c_lo, start), max(c_hi, end)
+
+def plan_missing_ranges(session, ticker_ids: list, start_date, end_date=None,
+                        overlap_days: int = None) -> dict:
+    """
+    Work out which date ranges still need downloading for each ticker.
+
+    Returns {ticker_id: [(start, end), ...]} where `end` is exclusive (as yfinance expects)
+    and may be None for "up to today". Tickers with no stored bars get the full window;
+    otherwise the plan covers any head/interior holes plus the tail after the last stored
+    bar, reaching back `overlap_days` so revised bars are re-fetched. Holes inside the
+    ticker's recorded fetched_from..fetched_until range were already asked for and came
+    back empty (before listing, market closures), so they are skipped.
+    """
+    if overlap_days is None:
+        overlap_days = SYNC_OVERLAP_DAYS
+    start = _to_date(start_date)
+    end = _to_date(end_date)
+    max_gap = timedelta(days=SYNC_MAX_GAP_DAYS)
+
+    query = select(Price.ticker_id, Price.date).where(
+        Price.ticker_id.in_(ticker_ids), Price.date >= start)
+    if end is not None:
+        query = query.where(Price.date < end)
+    stored = {}
+    for ticker_id, d in session.execute(query.order_by(Price.ticker_id, Price.date)):
+        stored.setdefault(ticker_id, []).append(d)
+    coverage = {r[0]: (r[1], r[2]) for r in session.execute(
+        select(Ticker.id, Ticker.fetched_from, Ticker.fetched_until).where(Ticker.id.in_(ticker_ids)))}
 
-def fetch_and_store(tickers, start_date='2022-01-01', end_date=None):
+    plan = {}
+    for ticker_id in ticker_ids:
+        dates = stored.get(ticker_id)
+        covered = coverage.get(ticker_id, (None, None))
+        if not dates:
+            plan[ticker_id] = _outside((start, end), covered)
+            continue
+
+        holes = []
+        if dates[0] - start > max_gap:
+            holes.append((start, dates[0]))
+        for prev, cur in zip(dates, dates[1:]):
+            if cur - prev > max_gap:
+                holes.append((prev + timedelta(days=1), cur))
+        ranges = [part for hole in holes for part in _outside(hole, covered)]
+        tail_start = max(start, dates[-1] - timedelta(days=overlap_days))
+        if end is None or tail_start < end:
+            ranges.append((tail_start, end))
+        plan[ticker_id] = ranges
+    return plan
+
+def _record_coverage(session, ticker_ids: list, start_date, end_date=None) -> bool:
+    """Merge a fully requested window into each ticker's fetched range. Does not commit."""
+    start, end = _to_date(start_date), _to_date(end_date) or date.today()
+    if start is None or not ticker_ids:
+        return False
+    rows = session.execute(select(Ticker.id, Ticker.fetched_from, Ticker.fetched_until)
+                           .where(Ticker.id.in_(ticker_ids))).all()
+    for ticker_id, fetched_from, fetched_until in rows:
+        lo, hi = _merge_coverage((fetched_from, fetched_until), start, end)
+        if (lo, hi) != (fetched_from, fetched_until):
+            session.execute(update(Ticker).where(Ticker.id == ticker_id)
+                            .values(fetched_from=lo, fetched_until=hi))
+    return bool(rows)
+
+# === CONCURRENT FETCH ===
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+FETCH_RATE_PER_SEC = float(os.getenv("FETCH_RATE_PER_SEC", "5"))
+FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "3"))
+
+def fetch_and_store(tickers, start_date='2022-01-01', end_date=None, batch_size=None,
+                    sync=False, overlap_days=None, workers=None,
+                    provider: PriceProvider = None):
+    """
+    Download daily bars for `tickers` and upsert them into the prices table.
+
+    With sync=True only the ranges missing from the DB (see plan_missing_ranges) are
+    requested, instead of the whole start_date..end_date window. Symbols are downloaded
+    concurrently by `workers` threads from `provider` (default: get_default_provider(),
+    i.e. Yahoo unless PRICE_DATA_DIR / PRICE_CACHE_DIR are set). Symbols that still fail after retries
+    are reported in a RuntimeError once everything else has been stored.
+
+    Each ticker that didn't fail has start_date..end_date recorded as fetched (see
+    plan_missing_ranges), even when the provider had no bars for it.
+    """
     if isinstance(tickers, str):
         tickers = [tickers]
 
-    Session = sessionmaker(bind=engine)
     session = Session()
+    new_ids = set()
 
     try:
         # Ensure tickers exist
@@ -54,66 +405,338 @@ def fetch_and_store(tickers, start_date='2022-01-01', end_date=None):
                 session.add(nt)
                 session.flush()
                 existing[t] = nt.id
+                new_ids.add(nt.id)
 
-        all_prices = []
+        if sync:
+            plan = plan_missing_ranges(session, [existing[t] for t in tickers],
+                                       start_date, end_date, overlap_days)
+        else:
+            plan = {existing[t]: [(start_date, end_date)] for t in tickers}
+
+        jobs = []
         for symbol in tickers:
-            logger.info(f"Fetching {symbol}...")
-            ticker = yf.Ticker(symbol)
-            hist = ticker.history(start=start_date, end=end_date, actions=False, auto_adjust=False)
+            if plan[existing[symbol]]:
+                jobs.append((symbol, plan[existing[symbol]]))
+            else:
+                logger.info(f"{symbol} is up to date.")
+
+        # Downloads run on a thread pool; each finished frame is written here, on the
+        # session's thread, while the remaining symbols are still in flight.
+        stored = 0
+        write_seconds = 0.0
+        failed = {}
+        changed = {}
+        logger.info(f"Fetching {len(jobs)} symbols with {workers or FETCH_WORKERS} workers...")
+        for symbol, hist, error in fetch_concurrently(
+                jobs, provider or get_default_provider(), workers=workers or FETCH_WORKERS,
+                rate=FETCH_RATE_PER_SEC, retries=FETCH_RETRIES):
+            if error is not None:
+                logger.error(f"Failed to fetch {symbol}: {error}")
+                failed[symbol] = error
+                continue
             if hist.empty:
                 logger.warning(f"No data for {symbol}")
                 continue
 
-            for date, row in hist.iterrows():
-                all_prices.append(Price(
-                    date=date.date(),
-                    ticker_id=existing[symbol],
-                    close=row['Close'],           # or row['Close'] if you prefer unadjusted
-                    open_price=row['Open'],
-                    high=row['High'],
-                    low=row['Low'],
-                    volume=int(row['Volume']) if not pd.isna(row['Volume']) else None
-                ))
-
-        if all_prices:
-            # Use merge() for upsert (handles duplicates gracefully)
-            for price in all_prices:
-                session.merge(price)
+            rows = history_to_rows(hist, existing[symbol])
+            t0 = time.perf_counter()
+            stored += upsert_prices(session, rows, batch_size)
+            write_seconds += time.perf_counter() - t0
+            changed[existing[symbol]] = min(r['date'] for r in rows)
+
+        if stored:
+            t0 = time.perf_counter()
+            # Derived rows go in the same transaction: only the changed tail, unless they
+            # were already out of date (then the whole ticker)
+            current = dict(session.execute(select(Ticker.id, Ticker.derived_version == Ticker.data_version)
+                                           .where(Ticker.id.in_(list(changed)))).all())
+            # As when nothing was stored: new tickers that got no bars are not kept
+            empty_new = new_ids - set(changed)
+            if empty_new:
+                session.execute(Ticker.__table__.delete().where(Ticker.__table__.c.id.in_(list(empty_new))))
+            _record_coverage(session, [existing[t] for t in tickers
+                                       if t not in failed and existing[t] not in empty_new], start_date, end_date)
+            for ticker_id, since in changed.items():
+                refresh_derived(session, ticker_id, since if current.get(ticker_id) else None)
+            version = time.time_ns()
+            session.execute(update(Ticker).where(Ticker.id.in_(list(changed)))
+                            .values(data_version=version, derived_version=version))
             session.commit()
-            logger.info(f"Stored/updated {len(all_prices)} price records.")
+            write_seconds += time.perf_counter() - t0
+            rate = stored / write_seconds if write_seconds > 0 else float('inf')
+            logger.info(f"Stored/updated {stored} price records in {write_seconds:.2f}s ({rate:,.0f} rows/sec).")
+            _notify_prices_changed(changed)
         else:
             logger.info("No price records to store.")
+            # New tickers without any bars are not kept; known ones still record the empty range
+            session.rollback()
+            known = [existing[t] for t in tickers if t not in failed and existing[t] not in new_ids]
+            if _record_coverage(session, known, start_date, end_date):
+                session.commit()
+
+        if failed:
+            raise RuntimeError(f"Failed to fetch {', '.join(failed)}: {next(iter(failed.values()))}")
 
     finally:
         session.close()
 
-def remove_ticker(symbols):
-    """Delete one or more tickers and all their associated price records from the database."""
+# Rows per DELETE when removing a ticker in batches (remove_ticker(batch_size=...)).
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "50000"))
+
+def _delete_prices_in_batches(ticker_id: int, batch_size: int, table=None) -> int:
+    """Delete a ticker's prices (or rows of another per-day `table`) oldest-first, one
+    committed batch at a time, so the transaction (and WAL / rollback journal) stays small.
+    Returns rows deleted."""
+    table = Price.__table__ if table is None else table
+    deleted = 0
+    while True:
+        with engine.begin() as conn:
+            cutoff = conn.execute(
+                select(table.c.date).where(table.c.ticker_id == ticker_id)
+                .order_by(table.c.date).offset(batch_size).limit(1)
+            ).scalar()
+            query = table.delete().where(table.c.ticker_id == ticker_id)
+            if cutoff is not None:
+                query = query.where(table.c.date < cutoff)
+            deleted += conn.execute(query).rowcount
+        if cutoff is None:
+            return deleted
+
+def reclaim_space():
+    """
+    Return pages freed by deletes to the OS (SQLite only).
+
+    Runs an incremental vacuum when the file is already in auto_vacuum=INCREMENTAL mode;
+    otherwise a one-off full VACUUM, which also switches the file to incremental mode
+    (see migrations.SQLITE_PRAGMAS) so later calls are cheap.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        t0 = time.perf_counter()
+        if mode == 2:
+            # Frees one page per step; executescript (sqlite3_exec) steps it to completion
+            conn.connection.dbapi_connection.executescript(
+                "PRAGMA incremental_vacuum; PRAGMA wal_checkpoint(TRUNCATE);")
+        else:
+            conn.exec_driver_sql("VACUUM")
+        logger.info(f"Reclaimed free pages ({'incremental' if mode == 2 else 'full'} vacuum) "
+                    f"in {time.perf_counter() - t0:.2f}s")
+
+def remove_ticker(symbols, batch_size=None, reclaim=False):
+    """
+    Delete one or more tickers and all their associated price records from the database.
+
+    Uses set-based DELETEs: the tickers rows are deleted directly and the database's
+    ON DELETE CASCADE removes their prices and derived rows, so nothing is loaded into
+    Python. With batch_size, each ticker's prices and derived rows are first deleted in
+    committed batches of that many rows (for tickers with very long histories).
+    reclaim=True vacuums afterwards.
+    """
     if isinstance(symbols, str):
         symbols = [symbols]
-    
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    
+
+    t0 = time.perf_counter()
     try:
-        tickers = session.query(Ticker).filter(Ticker.symbol.in_(symbols)).all()
-        if tickers:
-            for ticker in tickers:
-                session.delete(ticker)
-            session.commit()
-            deleted_symbols = [t.symbol for t in tickers]
-            logger.info(f"Deleted tickers: {deleted_symbols}")
-        else:
+        with engine.connect() as conn:
+            found = conn.execute(
+                select(Ticker.__table__.c.id, Ticker.__table__.c.symbol)
+                .where(Ticker.__table__.c.symbol.in_(symbols))
+            ).all()
+        if not found:
             logger.warning(f"No tickers found: {symbols}")
+            return
+
+        ids = [r[0] for r in found]
+        if batch_size:
+            for ticker_id in ids:
+                _delete_prices_in_batches(ticker_id, batch_size)
+                _delete_prices_in_batches(ticker_id, batch_size, DerivedPrice.__table__)
+
+        with engine.begin() as conn:
+            conn.execute(Ticker.__table__.delete().where(Ticker.__table__.c.id.in_(ids)))
+
+        deleted_symbols = [r[1] for r in found]
+        logger.info(f"Deleted tickers: {deleted_symbols} in {time.perf_counter() - t0:.3f}s")
     except Exception as e:
-        session.rollback()
         logger.error(f"Error deleting tickers: {e}")
         raise
-    finally:
-        session.close()
+
+    _notify_prices_changed({ticker_id: None for ticker_id in ids})
+
+    if reclaim:
+        reclaim_space()
+
+# === COLUMNAR READS ===
+# Loader column name -> prices table column
+PRICE_FIELDS = {
+    'close': 'close',
+    'open': 'open_price',
+    'high': 'high',
+    'low': 'low',
+    'volume': 'volume',
+}
+
+def load_prices(ticker_ids, start=None, end=None, columns=('close',), as_arrays=False):
+    """
+    Load prices for `ticker_ids` (None = every ticker; inclusive date range) as columns,
+    without ORM objects.
+
+    Runs one Core SELECT of ticker_id, date and the requested `columns` (keys of
+    PRICE_FIELDS), ordered by ticker_id then date, and builds typed arrays straight from
+    the result rows: int64 ticker_id, datetime64[D] date, float64 prices (NaN for NULL) and
+    int64 volume (0 for NULL). Returns a DataFrame, or a dict of NumPy arrays with
+    as_arrays=True.
+    """
+    if isinstance(ticker_ids, int):
+        ticker_ids = [ticker_ids]
+    unknown = set(columns) - set(PRICE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown price columns: {sorted(unknown)}")
+
+    table = Price.__table__
+    stmt = select(table.c.ticker_id, table.c.date, *[table.c[PRICE_FIELDS[c]] for c in columns])
+    if ticker_ids is not None:
+        stmt = stmt.where(table.c.ticker_id.in_(list(ticker_ids)))
+    if start is not None:
+        stmt = stmt.where(table.c.date >= _to_date(start))
+    if end is not None:
+        stmt = stmt.where(table.c.date <= _to_date(end))
+    stmt = stmt.order_by(table.c.ticker_id, table.c.date)
+
+    with engine.connect() as conn:
+        rows = conn.execute(stmt).all()
+
+    values = list(zip(*rows)) if rows else [()] * (2 + len(columns))
+    arrays = {
+        'ticker_id': np.array(values[0], dtype=np.int64),
+        'date': np.array(values[1], dtype='datetime64[D]'),
+    }
+    for name, col in zip(columns, values[2:]):
+        if name == 'volume':
+            arrays[name] = np.array([v or 0 for v in col], dtype=np.int64)
+        else:
+            arrays[name] = np.array(col, dtype=np.float64)
+
+    if as_arrays:
+        return arrays
+    return pd.DataFrame(arrays, copy=False)
+
+# === DERIVED SERIES ===
+# derived_prices holds per-day returns and rolling statistics so readers do a range scan
+# instead of recomputing from raw prices. fetch_and_store rewrites only the tail from the
+# earliest changed date (with enough earlier bars for the longest window); the rows go
+# with the ticker via ON DELETE CASCADE. A ticker whose derived_version lags its
+# data_version is rebuilt in full on the next load_derived.
+DERIVED_WINDOWS = (21, 63, 252)
+DERIVED_FIELDS = ('ret', 'log_ret', *[f'vol_{w}' for w in DERIVED_WINDOWS], 'peak', 'drawdown')
+
+def refresh_derived(session, ticker_id: int, since=None) -> int:
+    """
+    Recompute derived_prices for one ticker from `since` on (None = all of it), in the
+    caller's transaction. Returns the number of rows written.
+    """
+    prices, derived = Price.__table__, DerivedPrice.__table__
+    context, peak = [], None
+    if since is not None:
+        since = _to_date(since)
+        context = session.execute(
+            select(prices.c.date, prices.c.close)
+            .where(prices.c.ticker_id == ticker_id, prices.c.date < since)
+            .order_by(prices.c.date.desc()).limit(max(DERIVED_WINDOWS) + 1)).all()[::-1]
+        peak = session.execute(
+            select(derived.c.peak)
+            .where(derived.c.ticker_id == ticker_id, derived.c.date < since)
+            .order_by(derived.c.date.desc()).limit(1)).scalar()
+        if context and peak is None:  # nothing built before `since`: rebuild everything
+            since, context = None, []
+
+    query = select(prices.c.date, prices.c.close).where(prices.c.ticker_id == ticker_id)
+    delete = derived.delete().where(derived.c.ticker_id == ticker_id)
+    if since is not None:
+        query = query.where(prices.c.date >= since)
+        delete = delete.where(derived.c.date >= since)
+    tail = session.execute(query.order_by(prices.c.date)).all()
+    session.execute(delete)
+    if not tail:
+        return 0
+
+    rows = context + tail
+    close = np.array([r[1] for r in rows], dtype=np.float64)
+    ret = simple_returns(close)
+    columns = {'ret': ret, 'log_ret': np.log1p(ret)}
+    for window in DERIVED_WINDOWS:
+        columns[f'vol_{window}'] = rolling_volatility(ret, window)
+    running = np.fmax.accumulate(close)
+    columns['peak'] = running if peak is None else np.fmax(running, peak)
+    columns['drawdown'] = close / columns['peak'] - 1
+
+    skip = len(context)
+    values = {name: np.where(np.isnan(col[skip:]), None, col[skip:]).tolist() for name, col in columns.items()}
+    records = [{'ticker_id': ticker_id, 'date': r[0]} for r in tail]
+    for i, record in enumerate(records):
+        for name in DERIVED_FIELDS:
+            record[name] = values[name][i]
+    session.execute(derived.insert(), records)
+    return len(records)
+
+def _rebuild_stale_derived(ticker_ids=None):
+    tickers = Ticker.__table__
+    stmt = select(tickers.c.id, tickers.c.data_version).where(tickers.c.derived_version != tickers.c.data_version)
+    if ticker_ids is not None:
+        stmt = stmt.where(tickers.c.id.in_(list(ticker_ids)))
+    with engine.connect() as conn:
+        stale = conn.execute(stmt).all()
+    for ticker_id, version in stale:
+        t0 = time.perf_counter()
+        with session_scope() as session:
+            written = refresh_derived(session, ticker_id)
+            # Guarded on the version we read: a concurrent fetch wins and its rows stand
+            session.execute(update(Ticker).where(Ticker.id == ticker_id, Ticker.data_version == version)
+                            .values(derived_version=version))
+        logger.info(f"Rebuilt {written} derived rows for ticker {ticker_id} in {time.perf_counter() - t0:.2f}s")
+
+def load_derived(ticker_ids, start=None, end=None, columns=('ret',), as_arrays=False):
+    """
+    Like load_prices, for DERIVED_FIELDS columns of derived_prices (NaN where undefined,
+    e.g. the first return or a rolling window that isn't full yet). Tickers whose derived
+    rows are missing or out of date are rebuilt first.
+    """
+    if isinstance(ticker_ids, int):
+        ticker_ids = [ticker_ids]
+    unknown = set(columns) - set(DERIVED_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown derived columns: {sorted(unknown)}")
+    _rebuild_stale_derived(ticker_ids)
+
+    table = DerivedPrice.__table__
+    stmt = select(table.c.ticker_id, table.c.date, *[table.c[c] for c in columns])
+    if ticker_ids is not None:
+        stmt = stmt.where(table.c.ticker_id.in_(list(ticker_ids)))
+    if start is not None:
+        stmt = stmt.where(table.c.date >= _to_date(start))
+    if end is not None:
+        stmt = stmt.where(table.c.date <= _to_date(end))
+    stmt = stmt.order_by(table.c.ticker_id, table.c.date)
+
+    with engine.connect() as conn:
+        rows = conn.execute(stmt).all()
+
+    values = list(zip(*rows)) if rows else [()] * (2 + len(columns))
+    arrays = {
+        'ticker_id': np.array(values[0], dtype=np.int64),
+        'date': np.array(values[1], dtype='datetime64[D]'),
+    }
+    for name, col in zip(columns, values[2:]):
+        arrays[name] = np.array(col, dtype=np.float64)  # None -> nan
+
+    if as_arrays:
+        return arrays
+    return pd.DataFrame(arrays, copy=False)
 
 # === TEST ===
 if __name__ == "__main__":
     test_tickers = ["AAPL", "MSFT", "GOOGL", "SPY", "TLT", "GLD"]
-    fetch_and_store(test_tickers, start_date="2023-01-01")
+    fetch_and_store(test_tickers, start_date="2023-01-01", sync=True)
     print("Data successfully stored in portfolio_data.db")
\ No newline at end of file
@@ -0,0 +1,104 @@
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from providers import PriceProvider, FakeProvider
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: on average `rate` acquisitions per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def call_with_retry(fn: Callable, *args, retries: int = 3, backoff: float = 0.5,
+                    limiter: Optional[TokenBucket] = None, label: str = ""):
+    """Call `fn(*args)`, retrying failures with exponential backoff (plus jitter)."""
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return fn(*args)
+        except LookupError:
+            # Deterministic miss (e.g. an offline cache without this response): retrying won't help
+            raise
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+            logger.warning(f"{label or fn} failed ({e}); retry {attempt + 1}/{retries} in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def fetch_concurrently(
+    jobs: List[Tuple[str, list]],
+    provider: PriceProvider,
+    workers: int = 8,
+    rate: Optional[float] = None,
+    retries: int = 3,
+    backoff: float = 0.5,
+) -> Iterator[Tuple[str, Optional[pd.DataFrame], Optional[Exception]]]:
+    """
+    Download every (symbol, [(start, end), ...]) job on a thread pool.
+
+    Yields (symbol, frame, error) as soon as each symbol finishes, so the caller can write
+    one frame to the DB while the remaining downloads are still in flight. Each range
+    request is rate limited by a shared token bucket and retried independently.
+    """
+    limiter = TokenBucket(rate) if rate else None
+
+    def fetch_symbol(symbol, ranges):
+        frames = [call_with_retry(provider.history, symbol, start, end, retries=retries, backoff=backoff,
+                                  limiter=limiter, label=symbol)
+                  for start, end in ranges]
+        frames = [f for f in frames if f is not None and not f.empty]
+        if not frames:
+            return pd.DataFrame()
+        hist = pd.concat(frames) if len(frames) > 1 else frames[0]
+        # Tail overlap can repeat a bar already covered by a gap range
+        return hist[~hist.index.duplicated(keep='last')]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(fetch_symbol, symbol, ranges): symbol for symbol, ranges in jobs}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                yield symbol, future.result(), None
+            except Exception as e:
+                yield symbol, None, e
+
+
+# === TEST ===
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeProvider(latency=0.1, failure_rate=0.2)
+    jobs = [(f"SYM{i}", [("2023-01-01", "2024-01-01")]) for i in range(40)]
+    t0 = time.perf_counter()
+    ok = sum(1 for _, frame, err in fetch_concurrently(jobs, fake, workers=16, rate=50, backoff=0.05) if err is None)
+    print(f"{ok}/{len(jobs)} symbols in {time.perf_counter() - t0:.2f}s ({fake.calls} calls; serial would be ~{fake.calls * fake.latency:.1f}s)")
@@ -0,0 +1,161 @@
+import os
+import logging
+from sqlalchemy import event, text, inspect, Table, Column, Integer, String, MetaData
+
+logger = logging.getLogger(__name__)
+
+# === SQLITE TUNING ===
+# Applied to every new SQLite connection. Foreign keys are off by default in SQLite and
+# must be on for ON DELETE CASCADE; auto_vacuum only takes effect on a new file (or after
+# one full VACUUM). WAL lets the Streamlit readers run while a fetch is writing; NORMAL
+# sync is safe under WAL; mmap and a bigger page cache keep hot price pages out of read()
+# syscalls.
+SQLITE_PRAGMAS = {
+    'foreign_keys': 'ON',
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    'cache_size': -int(os.getenv("SQLITE_CACHE_KB", str(64 * 1024))),  # negative = KiB
+    'temp_store': 'MEMORY',
+}
+
+def tune_sqlite(engine):
+    """Register a connect hook that sets SQLITE_PRAGMAS on each new connection (no-op for other DBs)."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+# === MIGRATIONS ===
+# Each step runs once, in order, inside its own transaction; the applied version is
+# recorded in schema_version. Append new steps, never edit applied ones.
+
+_version_meta = MetaData()
+schema_version = Table(
+    'schema_version', _version_meta,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200)),
+)
+
+def _create_base_tables(conn, metadata):
+    metadata.create_all(conn)
+
+def _add_ticker_date_index(conn, metadata):
+    # Hot queries filter on ticker_id then a date range; the (date, ticker_id) primary key
+    # can't serve that. Carry the price columns too so those reads never touch the table.
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_prices_ticker_date ON prices (ticker_id, date) "
+            "INCLUDE (close, open_price, high, low, volume)"))
+    else:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_prices_ticker_date "
+            "ON prices (ticker_id, date, close, open_price, high, low, volume)"))
+    if conn.dialect.name == 'sqlite':
+        conn.execute(text("ANALYZE prices"))
+
+def _add_ticker_data_version(conn, metadata):
+    # Databases created after this column joined the model already have it (via step 1)
+    columns = {c['name'] for c in inspect(conn).get_columns('tickers')}
+    if 'data_version' not in columns:
+        conn.execute(text("ALTER TABLE tickers ADD COLUMN data_version BIGINT NOT NULL DEFAULT 0"))
+
+def _add_derived_prices(conn, metadata):
+    # Rows are filled lazily: derived_version -1 marks every existing ticker as not built yet
+    metadata.tables['derived_prices'].create(conn, checkfirst=True)
+    columns = {c['name'] for c in inspect(conn).get_columns('tickers')}
+    if 'derived_version' not in columns:
+        conn.execute(text("ALTER TABLE tickers ADD COLUMN derived_version BIGINT NOT NULL DEFAULT -1"))
+
+def _add_ticker_fetch_coverage(conn, metadata):
+    # NULL = nothing recorded yet: the next sync plans from the stored bars alone
+    columns = {c['name'] for c in inspect(conn).get_columns('tickers')}
+    for name in ('fetched_from', 'fetched_until'):
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE tickers ADD COLUMN {name} DATE"))
+
+MIGRATIONS = [
+    (1, "create base tables", _create_base_tables),
+    (2, "covering (ticker_id, date) index on prices", _add_ticker_date_index),
+    (3, "tickers.data_version for result caching", _add_ticker_data_version),
+    (4, "derived_prices table and tickers.derived_version", _add_derived_prices),
+    (5, "tickers.fetched_from / fetched_until sync coverage", _add_ticker_fetch_coverage),
+]
+
+def current_version(conn) -> int:
+    _version_meta.create_all(conn)
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+def migrate(engine, metadata) -> int:
+    """Apply pending migrations to `engine`; `metadata` is the app's declarative metadata. Returns the new version."""
+    with engine.begin() as conn:
+        version = current_version(conn)
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        logger.info(f"Applying migration {number}: {description}")
+        with engine.begin() as conn:
+            step(conn, metadata)
+            conn.execute(schema_version.insert().values(version=number, description=description))
+        version = number
+    return version
+
+
+# === BENCHMARK ===
+if __name__ == "__main__":
+    import sys
+    import time
+    import tempfile
+    from datetime import date, timedelta
+    from sqlalchemy import create_engine
+
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    from data_layer import Base
+
+    n_tickers = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_days = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    plain = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(plain)
+    start = date(2000, 1, 3)
+    with plain.begin() as conn:
+        conn.execute(text("INSERT INTO tickers (id, symbol) VALUES (:id, :symbol)"),
+                     [{'id': i, 'symbol': f"T{i}"} for i in range(1, n_tickers + 1)])
+        for d in range(n_days):
+            day = start + timedelta(days=d)
+            conn.execute(text("INSERT INTO prices VALUES (:date, :tid, 1.0, 1.0, 1.0, 1.0, 100)"),
+                         [{'date': day, 'tid': t} for t in range(1, n_tickers + 1)])
+    plain.dispose()
+    print(f"{n_tickers * n_days:,} price rows")
+
+    # Simulation / View Portfolio shape: one ticker, a multi-year range, ordered by date
+    query = text("SELECT date, close, open_price, high, low, volume FROM prices "
+                 "WHERE ticker_id = :tid AND date >= :lo AND date <= :hi ORDER BY date")
+    params = [{'tid': t, 'lo': start + timedelta(days=1000), 'hi': start + timedelta(days=3500)}
+              for t in range(1, n_tickers + 1, max(1, n_tickers // 20))]
+
+    def bench(engine, label):
+        with engine.connect() as conn:
+            conn.execute(query, params[0]).fetchall()  # warm cache
+            t0 = time.perf_counter()
+            for p in params:
+                conn.execute(query, p).fetchall()
+            per_query = (time.perf_counter() - t0) / len(params)
+        print(f"{label}: {per_query * 1000:.1f} ms/query")
+
+    before = create_engine(f"sqlite:///{path}")
+    bench(before, "before (PK only, default pragmas)")
+    before.dispose()
+
+    after = create_engine(f"sqlite:///{path}")
+    tune_sqlite(after)
+    migrate(after, Base.metadata)
+    bench(after, "after (covering index, tuned)")
@@ -0,0 +1,341 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from analytics import TRADING_DAYS
+from correlation import return_moments
+from data_layer import on_prices_changed
+from price_matrix import get_price_matrix
+
+Bound = Union[float, Sequence[float], np.ndarray]
+
+FRONTIER_POINTS = int(os.getenv("FRONTIER_POINTS", "25"))
+FRONTIER_CACHE_ENTRIES = int(os.getenv("FRONTIER_CACHE_ENTRIES", "8"))
+OPT_MAX_ITER = int(os.getenv("OPT_MAX_ITER", "5000"))
+OPT_TOL = 1e-8  # largest weight change per iteration at which a point counts as solved
+
+
+# === SOLVER ===
+def _bounds(n: int, min_weight: Bound, max_weight: Bound):
+    lo = np.broadcast_to(np.asarray(min_weight, dtype=np.float64), (n,))
+    hi = np.broadcast_to(np.asarray(max_weight, dtype=np.float64), (n,))
+    if (lo > hi).any() or lo.sum() > 1 + 1e-12 or hi.sum() < 1 - 1e-12:
+        raise ValueError("weight bounds leave no fully invested portfolio (need min <= max, sum(min) <= 1 <= sum(max))")
+    return lo, hi
+
+
+def project_bounded_simplex(V: np.ndarray, lo: np.ndarray, hi: np.ndarray, tol: float = 1e-13) -> np.ndarray:
+    """
+    Euclidean projection of each row of V onto {w : sum(w) = 1, lo <= w <= hi}.
+
+    The projection is clip(v - tau, lo, hi) for the shift tau that makes the row sum to 1;
+    tau is found for all rows at once by Newton steps on that piecewise-linear sum,
+    safeguarded by bisection, which ends in a handful of passes.
+    """
+    V = np.atleast_2d(V)
+    n = V.shape[1]
+    a = (V - hi).min(axis=1)  # sum at tau=a is sum(hi) >= 1
+    b = (V - lo).max(axis=1)  # sum at tau=b is sum(lo) <= 1
+    tau = np.clip((V.sum(axis=1) - 1) / n, a, b)
+    for _ in range(100):
+        x = V - tau[:, None]
+        W = np.clip(x, lo, hi)
+        excess = W.sum(axis=1) - 1
+        if np.abs(excess).max() <= tol:
+            break
+        a = np.where(excess > 0, tau, a)
+        b = np.where(excess < 0, tau, b)
+        free = ((x > lo) & (x < hi)).sum(axis=1)
+        newton = tau + excess / np.maximum(free, 1)
+        tau = np.where((free > 0) & (newton > a) & (newton < b), newton, 0.5 * (a + b))
+    return W
+
+
+def lipschitz_constant(cov: np.ndarray, iters: int = 50) -> float:
+    """Upper estimate of the gradient's Lipschitz constant, 2 * largest |eigenvalue| of cov (power iteration)."""
+    v = np.random.default_rng(0).normal(size=len(cov))
+    norm = 0.0
+    for _ in range(iters):
+        v = cov @ v
+        norm = np.linalg.norm(v)
+        if norm == 0:
+            return 1.0
+        v /= norm
+    return 2 * norm * 1.05  # margin for the unconverged tail
+
+
+def solve_frontier(mean: np.ndarray, cov: np.ndarray, risk_aversion, min_weight: Bound = 0.0,
+                   max_weight: Bound = 1.0, w0: Optional[np.ndarray] = None,
+                   lipschitz: Optional[float] = None, tol: float = OPT_TOL,
+                   max_iter: int = OPT_MAX_ITER):
+    """
+    Minimise w'Cw - lambda * mean'w over {sum(w) = 1, min_weight <= w <= max_weight} for every
+    lambda in `risk_aversion` at once (lambda = 0 is the minimum-variance portfolio).
+
+    Accelerated projected gradient (FISTA with adaptive restart) on the whole (points x assets)
+    batch: one iteration is a single (K x N) @ (N x N) product, so the covariance is read once
+    per iteration for all K points instead of once per point. Rows stop updating as they
+    converge. `w0` (one row, or one per point) warm-starts the solve.
+    Returns (weights K x N, iterations used).
+    """
+    mean = np.asarray(mean, dtype=np.float64)
+    lam = np.atleast_1d(np.asarray(risk_aversion, dtype=np.float64))[:, None]
+    lo, hi = _bounds(len(mean), min_weight, max_weight)
+    step = 1.0 / (lipschitz or lipschitz_constant(cov))
+
+    start = np.full(len(mean), 1.0 / len(mean)) if w0 is None else w0
+    W = project_bounded_simplex(np.broadcast_to(start, (len(lam), len(mean))), lo, hi)
+    Y = W.copy()
+    t = np.ones(len(lam))
+    active = np.arange(len(lam))
+    iteration = 0
+    for iteration in range(1, max_iter + 1):
+        Ya = Y[active]
+        grad = 2 * (Ya @ cov) - lam[active] * mean
+        Wn = project_bounded_simplex(Ya - step * grad, lo, hi)
+        delta = Wn - W[active]
+        # Restart momentum on rows where it now points uphill
+        restart = ((Ya - Wn) * delta).sum(axis=1) > 0
+        tn = np.where(restart, 1.0, 0.5 * (1 + np.sqrt(1 + 4 * t[active] ** 2)))
+        momentum = np.where(restart, 0.0, (t[active] - 1) / tn)
+        W[active] = Wn
+        Y[active] = Wn + momentum[:, None] * delta
+        t[active] = tn
+        done = np.abs(delta).max(axis=1) < tol
+        Y[active[done]] = Wn[done]
+        active = active[~done]
+        if not len(active):
+            break
+    return W, iteration
+
+
+def max_return_weights(mean: np.ndarray, min_weight: Bound = 0.0, max_weight: Bound = 1.0) -> np.ndarray:
+    """The highest-return fully invested portfolio: minimum weights, then fill the best assets to their caps."""
+    lo, hi = _bounds(len(mean), min_weight, max_weight)
+    order = np.argsort(-np.asarray(mean), kind='stable')
+    room = (hi - lo)[order]
+    budget = 1 - lo.sum()
+    w = lo.copy()
+    w[order] += np.clip(budget - (np.cumsum(room) - room), 0.0, room)
+    return w
+
+
+# === FRONTIER ===
+class Frontier:
+    """
+    An efficient frontier over a ticker universe, lowest risk first. Returns and volatility
+    are annualised. The last point is the maximum-return portfolio (risk aversion inf).
+    """
+
+    def __init__(self, ticker_ids, mean, cov, risk_aversion, weights, min_weight, max_weight, lipschitz):
+        self.ticker_ids = np.asarray(ticker_ids)
+        self.mean = mean
+        self.cov = cov
+        self.risk_aversion = risk_aversion
+        self.weights = weights
+        self.min_weight = min_weight
+        self.max_weight = max_weight
+        self.lipschitz = lipschitz
+        self.expected_return = weights @ mean
+        self.volatility = np.sqrt(np.maximum(np.einsum('ki,ij,kj->k', weights, cov, weights), 0.0))
+
+    def to_frame(self, risk_free: float = 0.0) -> pd.DataFrame:
+        """One row per point: Return, Volatility, Sharpe and the point's risk aversion."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sharpe = (self.expected_return - risk_free) / self.volatility
+        return pd.DataFrame({'Return': self.expected_return, 'Volatility': self.volatility,
+                             'Sharpe': sharpe, 'Risk Aversion': self.risk_aversion})
+
+    def weights_frame(self) -> pd.DataFrame:
+        """Points x ticker_id weights."""
+        return pd.DataFrame(self.weights, columns=pd.Index(self.ticker_ids, name='ticker_id'))
+
+    def for_return(self, target: float, tol: float = 1e-5) -> pd.Series:
+        """
+        Lowest-risk weights with expected return `target` (clamped to the frontier's range).
+        Warm-started: the covariance, step size and neighbouring frontier points are reused,
+        so only a few short solves run between the two points around the target.
+        """
+        ret = self.expected_return
+        if target <= ret[0]:
+            w = self.weights[0]
+        elif target >= ret[-1]:
+            w = self.weights[-1]
+        else:
+            k = int(np.searchsorted(ret, target, side='right')) - 1
+            k = min(k, len(ret) - 2)
+            lam_lo, lam_hi = self.risk_aversion[k], self.risk_aversion[k + 1]
+            if not np.isfinite(lam_hi):
+                lam_hi = 2 * lam_lo if lam_lo > 0 else 1.0
+                while solve_frontier(self.mean, self.cov, lam_hi, self.min_weight, self.max_weight,
+                                     w0=self.weights[k], lipschitz=self.lipschitz)[0][0] @ self.mean < target:
+                    lam_hi *= 4
+            r_lo, r_hi = ret[k], ret[k + 1]
+            # Any mix of the two neighbours is feasible, so their interpolation is the first start
+            mix = (target - r_lo) / (r_hi - r_lo) if r_hi > r_lo else 0.0
+            w = (1 - mix) * self.weights[k] + mix * self.weights[k + 1]
+            for _ in range(60):
+                lam = lam_lo + (lam_hi - lam_lo) * mix
+                w = solve_frontier(self.mean, self.cov, lam, self.min_weight, self.max_weight,
+                                   w0=w, lipschitz=self.lipschitz)[0][0]
+                r = w @ self.mean
+                if abs(r - target) <= tol * max(1.0, abs(target)):
+                    break
+                if r < target:
+                    lam_lo, r_lo = lam, r
+                else:
+                    lam_hi, r_hi = lam, r
+                # Return grows with lambda: bisect in lambda, steered by where the target sits
+                mix = float(np.clip((target - r_lo) / (r_hi - r_lo), 0.1, 0.9)) if r_hi > r_lo else 0.5
+        return pd.Series(w, index=pd.Index(self.ticker_ids, name='ticker_id'), name='weight')
+
+
+def _prepare_moments(mean, cov, shrinkage):
+    """Annualise and clean a pairwise covariance: unknown pairs -> 0, shrink toward the diagonal."""
+    cov = np.nan_to_num(cov, nan=0.0) * TRADING_DAYS
+    cov = 0.5 * (cov + cov.T)
+    diag = np.diag(np.diag(cov))
+    return mean * TRADING_DAYS, (1 - shrinkage) * cov + shrinkage * diag
+
+
+def _saturating_risk_aversion(top, mean, cov, min_weight, max_weight) -> float:
+    """Smallest risk aversion at which the max-return portfolio `top` meets the optimality conditions."""
+    lo, hi = _bounds(len(mean), min_weight, max_weight)
+    grad = 2 * cov @ top
+    held, room = top > lo + 1e-12, top < hi - 1e-12
+    # Moving weight from a held asset i to one with room j must not lower the objective:
+    # lambda * (mean_i - mean_j) >= grad_i - grad_j
+    gain = mean[held][:, None] - mean[room][None, :]
+    cost = grad[held][:, None] - grad[room][None, :]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        needed = np.where(gain > 0, cost / gain, 0.0)
+    lam = needed.max(initial=0.0)
+    return lam if lam > 0 else 1.0
+
+
+def frontier_from_moments(ticker_ids, mean, cov, points: int = FRONTIER_POINTS, min_weight: Bound = 0.0,
+                          max_weight: Bound = 1.0) -> Frontier:
+    """Frontier for annualised `mean` / `cov` arrays (already cleaned), in one batched solve."""
+    mean = np.asarray(mean, dtype=np.float64)
+    lipschitz = lipschitz_constant(cov)
+    top = max_return_weights(mean, min_weight, max_weight)
+    # Geometric risk-aversion grid from the minimum-variance end up to where `top` becomes optimal
+    lam_top = _saturating_risk_aversion(top, mean, cov, min_weight, max_weight)
+    risk_aversion = np.concatenate([[0.0], np.geomspace(lam_top * 1e-3, lam_top, max(points - 2, 1))])
+    weights, _ = solve_frontier(mean, cov, risk_aversion, min_weight, max_weight, lipschitz=lipschitz)
+    weights = np.vstack([weights, top])
+    risk_aversion = np.append(risk_aversion, np.inf)
+    # Keep points in increasing return order (points that converged onto the same portfolio collapse)
+    ret = weights @ mean
+    keep = np.concatenate([[True], np.diff(np.maximum.accumulate(ret)) > 1e-10])
+    return Frontier(ticker_ids, mean, cov, risk_aversion[keep], weights[keep],
+                    min_weight, max_weight, lipschitz)
+
+
+# === CACHED SERVICE ===
+# One frontier per (universe, end, window, bounds, ...); the covariance behind it comes from
+# correlation.py's cached window, so a later end date slides that window rather than rebuilding it.
+_frontiers = OrderedDict()
+_frontiers_lock = threading.Lock()
+
+
+def efficient_frontier(ticker_ids: Optional[Sequence[int]] = None, end=None, window: int = 252,
+                       points: int = FRONTIER_POINTS, min_weight: float = 0.0, max_weight: float = 1.0,
+                       shrinkage: float = 0.1, min_periods: int = 20) -> Frontier:
+    """
+    Long-only efficient frontier from the last `window` trading days of returns up to `end`,
+    for `ticker_ids` (None = every ticker in the PriceMatrix). Tickers with fewer than
+    `min_periods` returns in the window are left out. `shrinkage` blends the sample
+    covariance toward its diagonal, which keeps it well conditioned when the window is
+    short relative to the number of assets.
+    """
+    ids, mean, cov = return_moments(ticker_ids, end=end, window=window, min_periods=min_periods)
+    usable = ~np.isnan(mean)
+    ids = ids[usable]
+    matrix = get_price_matrix()
+    key = (tuple(ids.tolist()), tuple(matrix.version(t) for t in ids.tolist()), str(end), window, points,
+           min_weight, max_weight, shrinkage, min_periods)
+    with _frontiers_lock:
+        frontier = _frontiers.get(key)
+        if frontier is not None:
+            _frontiers.move_to_end(key)
+            return frontier
+    if not len(ids):
+        raise ValueError("no ticker has enough return history in the window")
+    mean, cov = _prepare_moments(mean[usable], cov[np.ix_(usable, usable)], shrinkage)
+    frontier = frontier_from_moments(ids, mean, cov, points, min_weight, max_weight)
+    with _frontiers_lock:
+        _frontiers[key] = frontier
+        while len(_frontiers) > FRONTIER_CACHE_ENTRIES:
+            _frontiers.popitem(last=False)
+    return frontier
+
+
+def clear_frontier_cache():
+    with _frontiers_lock:
+        _frontiers.clear()
+
+
+@on_prices_changed
+def _drop_changed_frontiers(changes: dict):
+    changed = set(changes)
+    with _frontiers_lock:
+        for key in [k for k in _frontiers if changed.intersection(k[0])]:
+            del _frontiers[key]
+
+
+# === CHECK / BENCHMARK ===
+if __name__ == "__main__":
+    import time
+
+    def kkt_gap(w, lam, mean, cov, lo, hi):
+        """Largest violation of the optimality conditions for one frontier point."""
+        g = 2 * cov @ w - lam * mean
+        at_lo, at_hi = w <= lo + 1e-7, w >= hi - 1e-7
+        free = ~at_lo & ~at_hi
+        if not free.any():  # any multiplier between the two groups will do
+            return max(g[at_hi].max(initial=-np.inf) - g[at_lo].min(initial=np.inf), 0.0)
+        nu = np.median(g[free])
+        return max(np.abs(g[free] - nu).max(initial=0),
+                   np.maximum(nu - g[at_lo], 0).max(initial=0),
+                   np.maximum(g[at_hi] - nu, 0).max(initial=0))
+
+    rng = np.random.default_rng(21)
+    for n_assets in (50, 200, 1000):
+        # Factor-model daily returns over one year, as return_moments would see them
+        factors = rng.normal(0, 0.01, (252, 5))
+        rets = factors @ rng.uniform(0, 1.2, (5, n_assets)) + rng.normal(0, 0.015, (252, n_assets))
+        mean, cov = _prepare_moments(rets.mean(axis=0), np.cov(rets, rowvar=False), shrinkage=0.1)
+        ids = np.arange(1, n_assets + 1)
+        max_weight = max(0.1, 2 / n_assets)
+
+        t0 = time.perf_counter()
+        frontier = frontier_from_moments(ids, mean, cov, FRONTIER_POINTS, 0.0, max_weight)
+        batched = time.perf_counter() - t0
+
+        # The same points solved one at a time
+        t0 = time.perf_counter()
+        single = [solve_frontier(mean, cov, lam, 0.0, max_weight, lipschitz=frontier.lipschitz)[0][0]
+                  for lam in frontier.risk_aversion[:-1]]
+        one_by_one = time.perf_counter() - t0
+        assert np.allclose(np.array(single), frontier.weights[:-1], atol=1e-5)
+
+        lo, hi = _bounds(n_assets, 0.0, max_weight)
+        gap = max(kkt_gap(w, lam, mean, cov, lo, hi)
+                  for w, lam in zip(frontier.weights[:-1], frontier.risk_aversion[:-1]))
+        assert gap < 1e-4, gap
+        assert np.allclose(frontier.weights.sum(axis=1), 1) and (frontier.weights <= hi + 1e-12).all()
+
+        target = 0.5 * (frontier.expected_return[0] + frontier.expected_return[-1])
+        t0 = time.perf_counter()
+        w = frontier.for_return(target)
+        warm = time.perf_counter() - t0
+        assert abs(w.to_numpy() @ mean - target) < 1e-4
+        print(f"{n_assets:>4} assets, {len(frontier.weights)} points: batched {batched * 1000:.0f} ms, "
+              f"one point at a time {one_by_one * 1000:.0f} ms; warm-started target return {warm * 1000:.0f} ms; "
+              f"KKT gap {gap:.1e}")
+    print("check passed: points satisfy the optimality conditions and match single-point solves")
@@ -0,0 +1,106 @@
+import os
+import logging
+from collections import namedtuple
+
+import streamlit as st
+
+from data_layer import get_all_tickers, load_derived, data_generation, on_prices_changed
+from price_matrix import get_price_matrix
+
+logger = logging.getLogger(__name__)
+
+# Entries are keyed on data_layer.data_generation, so writes made by this process show up at
+# once; the TTL bounds how long writes from other processes (CLI ingest, other replicas) can
+# go unseen. max_entries bounds each cached function.
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "64"))
+
+# What the pages need from a Ticker row, detached from the ORM session (and picklable)
+CachedTicker = namedtuple('CachedTicker', ['id', 'symbol', 'data_version'])
+
+
+# === TICKERS ===
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _ticker_list(generation: int):
+    return [CachedTicker(t.id, t.symbol, t.data_version) for t in get_all_tickers()]
+
+def cached_tickers():
+    """get_all_tickers() as CachedTicker tuples, queried once per data generation (or TTL)."""
+    return _ticker_list(data_generation())
+
+def cached_ticker_count() -> int:
+    return len(cached_tickers())
+
+
+# === PRICE RANGES ===
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _derived(ticker_ids, start, end, columns, as_arrays, generations):
+    return load_derived(list(ticker_ids), start, end, columns=columns, as_arrays=as_arrays)
+
+def cached_derived(ticker_ids, start=None, end=None, columns=('ret',), as_arrays=False):
+    """
+    load_derived, cached per (tickers, range, columns) and the generation of each ticker
+    asked for: a write to one ticker only misses the ranges that include it.
+    """
+    ticker_ids = tuple(int(t) for t in ticker_ids)
+    return _derived(ticker_ids, start, end, tuple(columns), as_arrays, data_generation(ticker_ids))
+
+
+# === SIMULATION RESULTS ===
+# Single and strategy runs are memoized per data_version in sim_cache.simulation_cache (pass
+# run_simulation CachedTicker.data_version to skip the version query). Sweeps and walk-forward
+# runs have no cache of their own, so they are held here, keyed on the data_version of the
+# PriceMatrix column they read. Monte Carlo runs are not cached: each click draws new paths
+# and reports progress as it goes.
+def _params_key(params: dict) -> tuple:
+    return tuple(sorted((name, tuple(v) if hasattr(v, '__len__') and not isinstance(v, str) else v)
+                        for name, v in params.items()))
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _sweep(ticker_id, data_version, params):
+    from sweep import run_sweep
+    return run_sweep(ticker_id, **dict(params))
+
+def cached_sweep(ticker_id: int, **params):
+    """run_sweep, cached; keyword arguments as run_sweep's."""
+    return _sweep(int(ticker_id), get_price_matrix().version(ticker_id), _params_key(params))
+
+@st.cache_resource(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _walk_forward(ticker_id, data_version, params):
+    from walk_forward import run_walk_forward  # pulls in the process-pool code only when used
+    return run_walk_forward(ticker_id, **dict(params))
+
+def cached_walk_forward(ticker_id: int, **params):
+    """run_walk_forward, cached; keyword arguments as run_walk_forward's."""
+    return _walk_forward(int(ticker_id), get_price_matrix().version(ticker_id), _params_key(params))
+
+
+# === INVALIDATION ===
+def clear_page_cache():
+    """Drop every entry (all sessions of this process)."""
+    _ticker_list.clear()
+    _derived.clear()
+    _sweep.clear()
+    _walk_forward.clear()
+
+@on_prices_changed
+def _drop_stale_lists(changes: dict):
+    # The new generation already makes old entries unreachable; this frees the ticker lists
+    # now. Per-ticker entries of unchanged tickers stay valid and are kept.
+    _ticker_list.clear()
+    logger.info(f"Page cache: ticker list invalidated for {len(changes)} changed tickers")
+
+
+# === CHECK ===
+if __name__ == "__main__":
+    from data_layer import _notify_prices_changed, pool_stats
+
+    cached_tickers()
+    before = pool_stats()['checkouts']
+    for _ in range(100):
+        cached_ticker_count()
+    assert pool_stats()['checkouts'] == before, "cached reruns should not touch the DB"
+    _notify_prices_changed({})  # what fetch_and_store / remove_ticker do after a commit
+    tickers = cached_tickers()
+    assert pool_stats()['checkouts'] > before, "a new generation should re-query"
+    print(f"check passed: {len(tickers)} tickers, 100 reruns served from cache, re-queried after a write")
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 try:
     import plotly.graph_objects as go
     import plotly.express as px
@@ -8,10 +9,14 @@ except Exception as e:
     st.error("Plotly is not installed in the environment. Make sure `requirements.txt` contains `plotly` and redeploy.")
     st.stop()
 from datetime import datetime, timedelta
-from sqlalchemy.orm import sessionmaker
 
 # Import your existing modules
-from data_layer import engine, Ticker, Price
+from data_layer import DERIVED_WINDOWS
+from page_cache import cached_tickers, cached_derived
+from price_matrix import get_price_matrix
+from analytics import simple_returns, drawdown, risk_summary
+from correlation import correlation_matrix
+from optimizer import efficient_frontier
 
 # ------------------------------------------------------------------
 # Page config (optional - you can also keep it only in the main app.py)
@@ -24,23 +29,11 @@ st.set_page_config(page_title="View Portfolio", layout="wide")
 st.title("📈 View Portfolio")
 st.markdown("### Price History of Your Tickers")
 
-# ------------------------------------------------------------------
-# Database session helper
-# ------------------------------------------------------------------
-Session = sessionmaker(bind=engine)
-
-def get_all_tickers():
-    session = Session()
-    try:
-        tickers = session.query(Ticker).order_by(Ticker.symbol).all()
-        return tickers
-    finally:
-        session.close()
-
 # ------------------------------------------------------------------
 # Main logic
 # ------------------------------------------------------------------
-tickers = get_all_tickers()
+# Cached per data generation (see page_cache.py), like the derived ranges below
+tickers = cached_tickers()
 
 if not tickers:
     st.info("No tickers in your portfolio yet. Head over to **Add Ticker** to get started!")
@@ -81,48 +74,32 @@ if not selected_tickers:
 # ------------------------------------------------------------------
 # Fetch price data
 # ------------------------------------------------------------------
-ids = [symbol_to_id[s] for s in selected_tickers]
+# Shared in-memory matrix (loaded once per process); slicing it needs no DB query
+matrix = get_price_matrix()
+ids = [symbol_to_id[s] for s in selected_tickers if symbol_to_id[s] in matrix.ticker_ids]
+prices = matrix.slice(start_date, end_date, ids)
 
-session = Session()
-try:
-    prices = session.query(Price).filter(
-        Price.ticker_id.in_(ids),
-        Price.date >= start_date,
-        Price.date <= end_date
-    ).order_by(Price.date).all()
-finally:
-    session.close()
-
-if not prices:
+if not prices.present.any():
     st.info("No price data available for the selected tickers and date range.")
     st.stop()
 
-# ------------------------------------------------------------------
-# Group prices by ticker
-# ------------------------------------------------------------------
-grouped = {}
-for p in prices:
-    grouped.setdefault(p.ticker_id, []).append(p)
-
 # ------------------------------------------------------------------
 # Build Plotly figure
 # ------------------------------------------------------------------
 fig = go.Figure()
 colors = px.colors.qualitative.Plotly
 
-for idx, (ticker_id, price_list) in enumerate(grouped.items()):
+for idx, ticker_id in enumerate(prices.ticker_ids):
     symbol = ticker_map.get(ticker_id, str(ticker_id))
-    
-    dates = [p.date for p in price_list]
-    closes = [p.close for p in price_list]
-    opens = [p.open_price or 0 for p in price_list]
-    highs = [p.high or 0 for p in price_list]
-    lows = [p.low or 0 for p in price_list]
-    volumes = [p.volume or 0 for p in price_list]
+    col = prices.column(ticker_id)
+    mask = prices.present[:, col]
+    if not mask.any():
+        continue
+    ohl = np.nan_to_num(np.column_stack([prices.fields[f][mask, col] for f in ('open', 'high', 'low')]))
 
     fig.add_trace(go.Scatter(
-        x=dates,
-        y=closes,
+        x=prices.dates[mask],
+        y=prices.fields['close'][mask, col],
         mode='lines',
         name=symbol,
         line=dict(width=2, color=colors[idx % len(colors)]),
@@ -134,7 +111,7 @@ for idx, (ticker_id, price_list) in enumerate(grouped.items()):
             'Low: $%{customdata[2]:.2f}<br>'
             'Volume: %{customdata[3]:,}<extra></extra>'
         ),
-        customdata=list(zip(opens, highs, lows, volumes))
+        customdata=np.column_stack([ohl, prices.fields['volume'][mask, col]])
     ))
 
 fig.update_layout(
@@ -149,22 +126,135 @@ fig.update_layout(
 
 st.plotly_chart(fig, use_container_width=True)
 
+# ------------------------------------------------------------------
+# Risk metrics (all selected tickers at once, see analytics.py)
+# ------------------------------------------------------------------
+st.markdown("### 📐 Risk Metrics")
+risk_cols = st.columns(2)
+with risk_cols[0]:
+    benchmark_symbol = st.selectbox("Benchmark for Beta:", options=ticker_symbols,
+                                    index=ticker_symbols.index(selected_tickers[0]))
+with risk_cols[1]:
+    vol_window = st.selectbox("Rolling Volatility Window (days)", options=DERIVED_WINDOWS)
+
+close = prices.fields['close']
+returns = simple_returns(close)
+benchmark_returns = None
+if symbol_to_id[benchmark_symbol] in matrix.ticker_ids:
+    # Same date rows as `prices`: slicing the shared matrix by date keeps its calendar
+    benchmark = matrix.slice(start_date, end_date, [symbol_to_id[benchmark_symbol]])
+    benchmark_returns = simple_returns(benchmark.fields['close'][:, 0])
+symbols = [ticker_map.get(t, str(t)) for t in prices.ticker_ids]
+risk = risk_summary(close, prices.dates, labels=symbols, benchmark_returns=benchmark_returns, returns=returns)
+st.dataframe(risk.style.format(
+    {'CAGR': '{:.2%}', 'Volatility': '{:.2%}', 'Sharpe': '{:.2f}', 'Sortino': '{:.2f}',
+     'Max Drawdown': '{:.2%}', 'Beta': '{:.2f}'}, na_rep="—"), use_container_width=True)
+
+# Rolling volatility is precomputed on ingest (derived_prices), so windows are full from the first day shown
+vol = cached_derived(list(prices.ticker_ids), start_date, end_date, columns=(f'vol_{vol_window}',), as_arrays=True)
+dd = drawdown(close)
+vol_fig, dd_fig = go.Figure(), go.Figure()
+for idx, symbol in enumerate(symbols):
+    mask = prices.present[:, idx]
+    color = colors[idx % len(colors)]
+    rows = vol['ticker_id'] == prices.ticker_ids[idx]
+    vol_fig.add_trace(go.Scatter(x=vol['date'][rows], y=vol[f'vol_{vol_window}'][rows], mode='lines', name=symbol,
+                                 line=dict(width=1.5, color=color)))
+    dd_fig.add_trace(go.Scatter(x=prices.dates[mask], y=dd[mask, idx], mode='lines', name=symbol,
+                                line=dict(width=1.5, color=color)))
+vol_fig.update_layout(title=f"Rolling {int(vol_window)}-Day Volatility (annualised)", yaxis_tickformat='.0%',
+                      hovermode="x unified", template="plotly_white", height=400)
+dd_fig.update_layout(title="Drawdown from Running Peak", yaxis_tickformat='.0%',
+                     hovermode="x unified", template="plotly_white", height=400)
+chart_cols = st.columns(2)
+chart_cols[0].plotly_chart(vol_fig, use_container_width=True)
+chart_cols[1].plotly_chart(dd_fig, use_container_width=True)
+
+# ------------------------------------------------------------------
+# Correlation of daily returns (cached per ticker set and window, see correlation.py)
+# ------------------------------------------------------------------
+if len(prices.ticker_ids) > 1:
+    st.markdown("### 🔗 Return Correlation")
+    corr_window = st.selectbox("Correlation Window (trading days up to End Date)", options=[63, 126, 252, 504], index=2)
+    corr = correlation_matrix(list(prices.ticker_ids), end=end_date, window=int(corr_window))
+    labels = [ticker_map.get(t, str(t)) for t in corr.index]
+    corr_fig = go.Figure(go.Heatmap(
+        z=corr.to_numpy(),
+        x=labels,
+        y=labels,
+        zmin=-1,
+        zmax=1,
+        colorscale='RdBu',
+        reversescale=True,
+        colorbar=dict(title="Correlation"),
+        hovertemplate='%{y} / %{x}: %{z:.2f}<extra></extra>'
+    ))
+    corr_fig.update_layout(title=f"Correlation of Daily Returns ({int(corr_window)} days)",
+                           template="plotly_white", height=max(400, 24 * len(labels)), yaxis_autorange='reversed')
+    st.plotly_chart(corr_fig, use_container_width=True)
+
+# ------------------------------------------------------------------
+# Suggested weights: long-only efficient frontier (one batched solve, cached, see optimizer.py)
+# ------------------------------------------------------------------
+if len(prices.ticker_ids) > 1:
+    st.markdown("### ⚖️ Suggested Weights")
+    opt_cols = st.columns(2)
+    with opt_cols[0]:
+        opt_window = st.selectbox("Estimation Window (trading days up to End Date)", options=[126, 252, 504], index=1)
+    with opt_cols[1]:
+        max_weight = st.slider("Max Weight per Ticker", min_value=round(1 / len(prices.ticker_ids), 2) + 0.01,
+                               max_value=1.0, value=1.0, step=0.01)
+    try:
+        frontier = efficient_frontier(list(prices.ticker_ids), end=end_date, window=int(opt_window),
+                                      max_weight=float(max_weight))
+    except ValueError as e:
+        st.info(f"Cannot build the efficient frontier: {e}")
+    else:
+        points = frontier.to_frame()
+        low, high = float(points['Return'].min()), float(points['Return'].max())
+        target = low
+        if high - low > 0.002:
+            target = st.slider("Target Annual Return (%)", min_value=round(low * 100, 2), max_value=round(high * 100, 2),
+                               value=round((low + high) * 50, 2), step=0.1) / 100
+        # Only the target changed between reruns: the cached frontier warm-starts this solve
+        weights = frontier.for_return(target)
+        port_return = float(weights.to_numpy() @ frontier.mean)
+        port_vol = float(np.sqrt(weights.to_numpy() @ frontier.cov @ weights.to_numpy()))
+
+        opt_symbols = [ticker_map.get(t, str(t)) for t in frontier.ticker_ids]
+        frontier_fig = go.Figure()
+        frontier_fig.add_trace(go.Scatter(x=points['Volatility'], y=points['Return'], mode='lines+markers',
+                                          name='Efficient Frontier', line=dict(width=2)))
+        frontier_fig.add_trace(go.Scatter(x=np.sqrt(np.diag(frontier.cov)), y=frontier.mean, mode='markers+text',
+                                          name='Tickers', text=opt_symbols, textposition='top center',
+                                          marker=dict(size=8, color='gray')))
+        frontier_fig.add_trace(go.Scatter(x=[port_vol], y=[port_return], mode='markers', name='Suggested',
+                                          marker=dict(size=14, symbol='star', color='red')))
+        frontier_fig.update_layout(title=f"Efficient Frontier ({int(opt_window)} days, annualised)",
+                                   xaxis_title="Volatility", yaxis_title="Expected Return",
+                                   xaxis_tickformat='.0%', yaxis_tickformat='.0%', template="plotly_white", height=450)
+        weight_cols = st.columns([2, 1])
+        weight_cols[0].plotly_chart(frontier_fig, use_container_width=True)
+        weight_table = pd.DataFrame({'Ticker': opt_symbols, 'Weight': weights.to_numpy()})
+        weight_table = weight_table[weight_table['Weight'] > 1e-4].sort_values('Weight', ascending=False)
+        weight_cols[1].dataframe(weight_table.style.format({'Weight': '{:.1%}'}), hide_index=True,
+                                 use_container_width=True)
+        weight_cols[1].caption(f"Expected return {port_return:.2%}, volatility {port_vol:.2%} "
+                               f"(estimates from past returns, not a forecast)")
+
 # ------------------------------------------------------------------
 # Optional: Show raw data table (expandable)
 # ------------------------------------------------------------------
 with st.expander("📋 View Raw Price Data"):
-    # Convert prices to a simple DataFrame for display
-    data = []
-    for p in prices:
-        data.append({
-            "Date": p.date,
-            "Ticker": ticker_map[p.ticker_id],
-            "Open": p.open_price,
-            "High": p.high,
-            "Low": p.low,
-            "Close": p.close,
-            "Volume": p.volume
-        })
-    df = pd.DataFrame(data)
+    rows, cols = np.nonzero(prices.present)
+    df = pd.DataFrame({
+        "Date": prices.dates[rows],
+        "Ticker": pd.Series(prices.ticker_ids[cols]).map(ticker_map),
+        "Open": prices.fields["open"][rows, cols],
+        "High": prices.fields["high"][rows, cols],
+        "Low": prices.fields["low"][rows, cols],
+        "Close": prices.fields["close"][rows, cols],
+        "Volume": prices.fields["volume"][rows, cols],
+    })
     df = df.sort_values(["Ticker", "Date"])
     st.dataframe(df, use_container_width=True)
\ No newline at end of file
@@ -1,6 +1,5 @@
 from datetime import datetime, timedelta
 import streamlit as st
-from sqlalchemy.orm import sessionmaker
 try:
     import plotly.graph_objects as go
 except Exception as e:
@@ -8,10 +7,18 @@ except Exception as e:
     st.error("Plotly is not installed in the environment. Make sure `requirements.txt` contains `plotly` and redeploy.")
     st.stop()
 import pandas as pd
+import numpy as np
 
 # Import your existing modules
-from data_layer import engine, Ticker, Price
-from trading_bot import run_simulation, trades_to_df, calculate_final_value
+from page_cache import cached_tickers, cached_sweep, cached_walk_forward
+from trading_bot import stream_simulation, max_drawdown_stop, calculate_final_value
+from robustness import run_robustness
+from strategies import (STRATEGIES, ThresholdStrategy, MovingAverageCross, RSIStrategy, BreakoutStrategy,
+                        ZScoreStrategy, run_strategy)
+from analytics import flow_adjusted_returns, simple_returns, risk_summary
+
+RISK_FORMAT = {'CAGR': '{:.2%}', 'Volatility': '{:.2%}', 'Sharpe': '{:.2f}', 'Sortino': '{:.2f}',
+               'Max Drawdown': '{:.2%}', 'Beta': '{:.2f}'}
 
 # ------------------------------------------------------------------
 # Page config (optional - you can also keep it only in the main app.py)
@@ -24,30 +31,19 @@ st.set_page_config(page_title="Trading Simulation", layout="wide")
 st.title("📈 View Portfolio")
 st.markdown("### Automated Trading Simulation")
 
-# ------------------------------------------------------------------
-# Database session helper
-# ------------------------------------------------------------------
-Session = sessionmaker(bind=engine)
-
-def get_all_tickers():
-    session = Session()
-    try:
-        tickers = session.query(Ticker).order_by(Ticker.symbol).all()
-        return tickers
-    finally:
-        session.close()
-
 # ------------------------------------------------------------------
 # Main Logic
 # ------------------------------------------------------------------
 
 
-tickers = get_all_tickers()
+# Cached per data generation; each ticker's data_version lets cached runs skip the DB entirely
+tickers = cached_tickers()
 if not tickers:
     st.info("No tickers in portfolio. Add one to run a simulation!")
 else:
     ticker_symbols = [t.symbol for t in tickers]
     ticker_map = {t.symbol: t.id for t in tickers}
+    ticker_by_symbol = {t.symbol: t for t in tickers}
 
     # --- Configuration Inputs ---
     col1, col2, col3 = st.columns(3)
@@ -55,6 +51,8 @@ else:
         selected_ticker_symbol = st.selectbox("Select Ticker for Simulation:", ticker_symbols)
         initial_cash = st.number_input("Initial Cash ($)", min_value=100.0, value=10000.0, step=100.0)
         monthly_investment = st.number_input("Monthly Investment ($)", min_value=0.0, value=0.0, step=10.0)
+        max_drawdown_pct = st.number_input("Stop if Drawdown Exceeds (%)", min_value=1.0, max_value=100.0, value=100.0, step=5.0,
+                                           help="End the run early once the portfolio falls this far below its peak (100 = never)")
         
     with col2:
         start_date = st.date_input("Start Date", datetime.now().date() - timedelta(days=365))
@@ -83,28 +81,42 @@ else:
         selected_ticker_id = ticker_map[selected_ticker_symbol]
         trade_percent_decimal = trade_percent_input / 100.0
 
-        with st.spinner(f"Running simulation for {selected_ticker_symbol} from {start_date} to {end_date}..."):
-            # Run the simulation
-            results = run_simulation(
-                ticker_id=selected_ticker_id,
-                start_date=start_date,
-                end_date=end_date,
-                initial_cash=initial_cash,
-                buy_threshold=buy_threshold,
-                sell_threshold=sell_threshold,
-                buy_slippage=buy_slippage,
-                sell_slippage=sell_slippage,
-                trade_percent=trade_percent_decimal,
-                monthly_investment=float(monthly_investment)
-            )
-            
-        if "error" in results:
-            st.error(results["error"])
+        # Stream the run so long backtests show progress and can stop early
+        progress_bar = st.progress(0.0, text=f"Running simulation for {selected_ticker_symbol} from {start_date} to {end_date}...")
+        live_chart = st.empty()
+        stop_when = max_drawdown_stop(max_drawdown_pct / 100.0) if max_drawdown_pct < 100 else None
+        for progress in stream_simulation(
+            ticker_id=selected_ticker_id,
+            start_date=start_date,
+            end_date=end_date,
+            initial_cash=initial_cash,
+            buy_threshold=buy_threshold,
+            sell_threshold=sell_threshold,
+            buy_slippage=buy_slippage,
+            sell_slippage=sell_slippage,
+            trade_percent=trade_percent_decimal,
+            monthly_investment=float(monthly_investment),
+            stop_when=stop_when,
+            data_version=ticker_by_symbol[selected_ticker_symbol].data_version,
+        ):
+            if progress.done:
+                progress_bar.progress(progress.fraction, text=f"Simulated to {progress.date} — portfolio ${progress.value:,.2f}")
+                if progress.fraction < 1.0:
+                    live_chart.line_chart(progress.result.history_df.set_index('Date')['Portfolio Value'], height=240)
+        progress_bar.empty()
+        live_chart.empty()
+        results = progress.result
+
+        if progress.stopped:
+            st.warning(f"Stopped early on {progress.date}: drawdown reached {progress.max_drawdown:.1%} "
+                       f"(limit {max_drawdown_pct:.0f}%). Results below cover the run up to that point.")
+        if results.error:
+            st.error(results.error)
         else:
-            history_df = results['history_df']
-            trades_list = results['trades']
-            final_cash = results['final_cash']
-            final_shares = results['final_shares']
+            history_df = results.history_df
+            trades_df = results.trades_df
+            final_cash = results.final_cash
+            final_shares = results.final_shares
                 
             final_value = calculate_final_value(history_df, final_cash, final_shares)
 
@@ -123,12 +135,22 @@ else:
             summary_cols[2].metric("Final Cash Balance", f"${final_cash:,.2f}") # <--- NEW
             final_asset_value = final_value - final_cash
             summary_cols[3].metric("Final Stock Value", f"${final_asset_value:,.2f}") # <--- NEW
-            summary_cols[4].metric("Total Trades", len(trades_list))
-            # total deposits
-            trades_df = trades_to_df(trades_list)
-            deposits_df = trades_df[trades_df['Action'] == 'DEPOSIT'] if not trades_df.empty else pd.DataFrame()
-            total_deposits = deposits_df['Cash Change'].sum() if not deposits_df.empty else 0.0
+            summary_cols[4].metric("Total Trades", len(trades_df))
+            total_deposits = results.total_deposits
             st.markdown(f"**Monthly deposit:** ${monthly_investment:,.2f} — Total deposited: ${total_deposits:,.2f}")
+
+            # --- Risk Metrics: strategy (deposits taken out of its returns) vs holding the ticker ---
+            strategy_returns = flow_adjusted_returns(results.portfolio_value, results.daily_deposits)
+            hold_returns = simple_returns(results.close)
+            risk = risk_summary(
+                np.column_stack([results.portfolio_value, results.close]),
+                results.dates,
+                labels=["Strategy", f"Buy & Hold {selected_ticker_symbol}"],
+                benchmark_returns=hold_returns,
+                returns=np.column_stack([strategy_returns, hold_returns]),
+            )
+            st.markdown("#### 📐 Risk Metrics")
+            st.dataframe(risk.style.format(RISK_FORMAT, na_rep="—"), use_container_width=True)
                 
             # --- Price History & Trades Graph ---
             fig = go.Figure()
@@ -152,10 +174,9 @@ else:
             ))
 
             # Add trade markers
-            trades_df = trades_to_df(trades_list)
             if not trades_df.empty:
-                buy_trades = trades_df[trades_df['Action'] == 'BUY']
-                sell_trades = trades_df[trades_df['Action'] == 'SELL']
+                buy_trades = trades_df[results.is_buy]
+                sell_trades = trades_df[results.is_sell]
 
                 # Buy markers (Green Up Arrow)
                 fig.add_trace(go.Scatter(
@@ -188,4 +209,252 @@ else:
 
             # --- Detailed History ---
             st.markdown("### 📋 Trade Log")
-            st.dataframe(trades_df.sort_values(by='Date', ascending=False), use_container_width=True)
\ No newline at end of file
+            st.dataframe(trades_df.sort_values(by='Date', ascending=False), use_container_width=True)
+    # ------------------------------------------------------------------
+    # Strategy comparison: other rules on the same ticker, dates, cash and trade settings
+    # ------------------------------------------------------------------
+    st.markdown("---")
+    st.markdown("### 🧩 Strategy Comparison")
+    st.caption("Signals are computed once per ticker and indicator from the full price history and cached, "
+               "so re-running with other settings only re-executes the trades.")
+
+    chosen = st.multiselect("Strategies", options=list(STRATEGIES), default=list(STRATEGIES)[:2])
+    strat_cols = st.columns(4)
+    with strat_cols[0]:
+        ma_fast = st.number_input("MA Fast (days)", min_value=2, max_value=250, value=50)
+        ma_slow = st.number_input("MA Slow (days)", min_value=3, max_value=500, value=200)
+    with strat_cols[1]:
+        rsi_window = st.number_input("RSI Window (days)", min_value=2, max_value=100, value=14)
+        rsi_band = st.slider("RSI Oversold / Overbought", min_value=0, max_value=100, value=(30, 70))
+    with strat_cols[2]:
+        breakout_window = st.number_input("Breakout Window (days)", min_value=2, max_value=250, value=20)
+    with strat_cols[3]:
+        z_window = st.number_input("Z-Score Window (days)", min_value=3, max_value=250, value=20)
+        z_entry = st.number_input("Z-Score Entry", min_value=0.5, max_value=5.0, value=2.0, step=0.25)
+
+    if st.button("Compare Strategies") and chosen:
+        settings = {
+            ThresholdStrategy.label: ThresholdStrategy(buy_threshold, sell_threshold),
+            MovingAverageCross.label: MovingAverageCross(ma_fast, ma_slow),
+            RSIStrategy.label: RSIStrategy(rsi_window, rsi_band[0], rsi_band[1]),
+            BreakoutStrategy.label: BreakoutStrategy(breakout_window),
+            ZScoreStrategy.label: ZScoreStrategy(z_window, z_entry),
+        }
+        runs = {label: run_strategy(ticker_map[selected_ticker_symbol], settings[label], start_date, end_date,
+                                    initial_cash, buy_slippage, sell_slippage, trade_percent_input / 100.0,
+                                    float(monthly_investment))
+                for label in chosen}
+        runs = {label: r for label, r in runs.items() if not r.error}
+        if not runs:
+            st.error("No price data available for the selected ticker and date range.")
+        else:
+            compare_fig = go.Figure()
+            for label, r in runs.items():
+                compare_fig.add_trace(go.Scatter(x=r.dates, y=r.portfolio_value, mode='lines', name=label))
+            compare_fig.update_layout(title=f"Portfolio Value by Strategy: {selected_ticker_symbol}",
+                                      xaxis_title="Date", yaxis_title="Value ($)", hovermode='x unified',
+                                      template='plotly_white', height=450)
+            st.plotly_chart(compare_fig, use_container_width=True)
+
+            first = next(iter(runs.values()))
+            values = np.column_stack([r.portfolio_value for r in runs.values()])
+            returns = np.column_stack([flow_adjusted_returns(r.portfolio_value, r.daily_deposits) for r in runs.values()])
+            comparison = risk_summary(values, first.dates, labels=list(runs), returns=returns)
+            comparison.insert(0, 'Final Value', [r.final_value for r in runs.values()])
+            comparison.insert(1, 'Buys', [int(r.is_buy.sum()) for r in runs.values()])
+            comparison.insert(2, 'Sells', [int(r.is_sell.sum()) for r in runs.values()])
+            st.dataframe(comparison.style.format({'Final Value': '${:,.2f}', **RISK_FORMAT}), use_container_width=True)
+
+    # ------------------------------------------------------------------
+    # Parameter sweep: whole threshold grid in one batched pass
+    # ------------------------------------------------------------------
+    st.markdown("---")
+    st.markdown("### 🔍 Parameter Sweep")
+    st.caption("Runs every Buy/Sell threshold combination below with the ticker, dates, cash, slippage and trade size chosen above.")
+
+    sweep_cols = st.columns(2)
+    with sweep_cols[0]:
+        buy_range = st.slider("Buy threshold range (%)", min_value=0.0, max_value=20.0, value=(0.5, 10.0), step=0.5)
+        buy_steps = st.number_input("Buy threshold steps", min_value=2, max_value=100, value=50)
+    with sweep_cols[1]:
+        sell_range = st.slider("Sell threshold range (%)", min_value=-20.0, max_value=0.0, value=(-10.0, -0.5), step=0.5)
+        sell_steps = st.number_input("Sell threshold steps", min_value=2, max_value=100, value=50)
+
+    if st.button("Run Sweep"):
+        buy_values = np.linspace(buy_range[0], buy_range[1], int(buy_steps))
+        sell_values = np.linspace(sell_range[0], sell_range[1], int(sell_steps))
+        with st.spinner(f"Sweeping {len(buy_values) * len(sell_values)} combinations for {selected_ticker_symbol}..."):
+            sweep_df = cached_sweep(
+                ticker_id=ticker_map[selected_ticker_symbol],
+                start_date=start_date,
+                end_date=end_date,
+                initial_cash=initial_cash,
+                buy_thresholds=buy_values,
+                sell_thresholds=sell_values,
+                trade_percents=[trade_percent_input / 100.0],
+                buy_slippages=[buy_slippage],
+                sell_slippages=[sell_slippage],
+                monthly_investment=float(monthly_investment),
+            )
+
+        if sweep_df.empty:
+            st.error("No price data available for the selected ticker and date range.")
+        else:
+            # Grid rows are ordered buy-major, so this reshapes to (buy, sell)
+            z = sweep_df['final_value'].to_numpy().reshape(len(buy_values), len(sell_values))
+            heatmap = go.Figure(go.Heatmap(
+                x=buy_values,
+                y=sell_values,
+                z=z.T,
+                colorscale='Viridis',
+                colorbar=dict(title="Final Value ($)"),
+                hovertemplate='Buy > %{x:.2f}%<br>Sell < %{y:.2f}%<br>Final: $%{z:,.2f}<extra></extra>'
+            ))
+            heatmap.update_layout(
+                title=f"Final Portfolio Value by Threshold: {selected_ticker_symbol}",
+                xaxis_title="Buy Threshold (%)",
+                yaxis_title="Sell Threshold (%)",
+                template='plotly_white',
+                height=560
+            )
+            st.plotly_chart(heatmap, use_container_width=True)
+
+            st.markdown("#### Best combinations")
+            best = sweep_df.sort_values('final_value', ascending=False).head(10)
+            st.dataframe(best[['buy_threshold', 'sell_threshold', 'final_value', 'trades', 'max_drawdown']],
+                         use_container_width=True)
+
+    # ------------------------------------------------------------------
+    # Walk-forward: pick thresholds on past data only, trade them on the next window
+    # ------------------------------------------------------------------
+    st.markdown("---")
+    st.markdown("### 🧭 Walk-Forward Optimization")
+    st.caption("Optimizes the sweep's threshold grid above on each training window, trades the winner on the "
+               "following test window, and chains the test windows into one out-of-sample run.")
+
+    wf_cols = st.columns(3)
+    with wf_cols[0]:
+        train_days = st.number_input("Training Window (trading days)", min_value=20, max_value=2520, value=504, step=21)
+    with wf_cols[1]:
+        test_days = st.number_input("Test Window (trading days)", min_value=5, max_value=504, value=63, step=21)
+    with wf_cols[2]:
+        wf_objective = st.selectbox("Optimize For", options=['final_value', 'return_over_drawdown'],
+                                    format_func=lambda o: {'final_value': 'Final Value',
+                                                           'return_over_drawdown': 'Return / Max Drawdown'}[o])
+        anchored = st.checkbox("Anchored (training always starts at Start Date)")
+
+    if st.button("Run Walk-Forward"):
+        with st.spinner(f"Optimizing {int(buy_steps) * int(sell_steps)} combinations per window..."):
+            walk = cached_walk_forward(
+                ticker_id=ticker_map[selected_ticker_symbol],
+                start_date=start_date,
+                end_date=end_date,
+                initial_cash=initial_cash,
+                buy_thresholds=np.linspace(buy_range[0], buy_range[1], int(buy_steps)),
+                sell_thresholds=np.linspace(sell_range[0], sell_range[1], int(sell_steps)),
+                trade_percents=[trade_percent_input / 100.0],
+                buy_slippages=[buy_slippage],
+                sell_slippages=[sell_slippage],
+                monthly_investment=float(monthly_investment),
+                train_days=int(train_days),
+                test_days=int(test_days),
+                anchored=anchored,
+                objective=wf_objective,
+            )
+
+        if walk is None:
+            st.error("The date range is shorter than one training window plus a test day.")
+        else:
+            oos = walk.result
+            w1, w2, w3 = st.columns(3)
+            w1.metric("Out-of-Sample Final Value", f"${oos.final_value:,.2f}")
+            w2.metric("Out-of-Sample Return", f"{walk.total_return:.2%}", help="Time-weighted, deposits removed")
+            w3.metric("Windows", f"{len(walk.windows)}")
+
+            history = oos.history_df
+            wf_fig = go.Figure()
+            wf_fig.add_trace(go.Scatter(x=history['Date'], y=history['Portfolio Value'], name='Walk-Forward Portfolio',
+                                        line=dict(color='#1f77b4', width=2)))
+            for start in walk.windows['Test Start'].iloc[1:]:
+                wf_fig.add_vline(x=pd.Timestamp(start), line=dict(color='lightgray', width=1, dash='dot'))
+            wf_fig.update_layout(title=f"Chained Out-of-Sample Equity: {selected_ticker_symbol}", xaxis_title="Date",
+                                 yaxis_title="Value ($)", hovermode='x unified', template='plotly_white', height=450)
+            st.plotly_chart(wf_fig, use_container_width=True)
+
+            st.dataframe(walk.windows[['Train Start', 'Test Start', 'Test End', 'buy_threshold', 'sell_threshold',
+                                       'In-Sample Score', 'Test Return']].style.format(
+                {'buy_threshold': '{:.2f}', 'sell_threshold': '{:.2f}', 'In-Sample Score': '{:,.2f}',
+                 'Test Return': '{:.2%}'}), use_container_width=True)
+
+    # ------------------------------------------------------------------
+    # Robustness: the same rules over thousands of bootstrapped future paths
+    # ------------------------------------------------------------------
+    st.markdown("---")
+    st.markdown("### 🎲 Robustness (Monte Carlo)")
+    st.caption("Resamples blocks of the ticker's daily returns between the dates above into future price paths "
+               "and runs the rules, cash, slippage and trade size chosen above on all of them.")
+
+    mc_cols = st.columns(3)
+    with mc_cols[0]:
+        n_paths = st.number_input("Paths", min_value=100, max_value=50000, value=10000, step=1000)
+    with mc_cols[1]:
+        mc_years = st.number_input("Years per Path", min_value=1, max_value=30, value=5)
+    with mc_cols[2]:
+        block_size = st.number_input("Block Length (days)", min_value=1, max_value=250, value=20,
+                                     help="Consecutive days copied together; 1 resamples days independently")
+
+    if st.button("Run Monte Carlo"):
+        mc_progress = st.progress(0.0, text="Simulating paths...")
+        robustness = run_robustness(
+            ticker_id=ticker_map[selected_ticker_symbol],
+            start_date=start_date,
+            end_date=end_date,
+            initial_cash=initial_cash,
+            buy_threshold=buy_threshold,
+            sell_threshold=sell_threshold,
+            trade_percent=trade_percent_input / 100.0,
+            buy_slippage=buy_slippage,
+            sell_slippage=sell_slippage,
+            monthly_investment=float(monthly_investment),
+            n_paths=int(n_paths),
+            years=float(mc_years),
+            block_size=int(block_size),
+            on_progress=lambda done, total: mc_progress.progress(done / total, text=f"Simulated {done:,} of {total:,} paths"),
+        )
+        mc_progress.empty()
+
+        if robustness is None:
+            st.error("Not enough price history for the selected ticker and date range.")
+        else:
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Median Final Value", f"${np.median(robustness.final_value):,.2f}")
+            m2.metric("Chance of Losing Money", f"{robustness.prob_loss:.1%}",
+                      help=f"Final value below the ${robustness.total_deposits:,.2f} put in")
+            m3.metric("Chance of Beating Buy & Hold", f"{robustness.prob_beat_buy_hold:.1%}")
+
+            fan = robustness.fan_df()
+            fan_fig = go.Figure()
+            fan_fig.add_trace(go.Scatter(x=fan.index, y=fan['P95'], line=dict(width=0), showlegend=False, hoverinfo='skip'))
+            fan_fig.add_trace(go.Scatter(x=fan.index, y=fan['P5'], fill='tonexty', line=dict(width=0),
+                                         fillcolor='rgba(31,119,180,0.15)', name='5-95%'))
+            fan_fig.add_trace(go.Scatter(x=fan.index, y=fan['P75'], line=dict(width=0), showlegend=False, hoverinfo='skip'))
+            fan_fig.add_trace(go.Scatter(x=fan.index, y=fan['P25'], fill='tonexty', line=dict(width=0),
+                                         fillcolor='rgba(31,119,180,0.35)', name='25-75%'))
+            fan_fig.add_trace(go.Scatter(x=fan.index, y=fan['P50'], line=dict(color='#1f77b4', width=2), name='Median'))
+            fan_fig.update_layout(title=f"Portfolio Value across {robustness.n_paths:,} Paths", xaxis_title="Date",
+                                  yaxis_title="Value ($)", hovermode='x unified', template='plotly_white', height=450)
+
+            hist_fig = go.Figure()
+            hist_fig.add_trace(go.Histogram(x=robustness.final_value, name='Strategy', opacity=0.6, nbinsx=80))
+            hist_fig.add_trace(go.Histogram(x=robustness.buy_hold_value, name='Buy & Hold', opacity=0.6, nbinsx=80))
+            hist_fig.update_layout(barmode='overlay', title="Distribution of Final Values", xaxis_title="Final Value ($)",
+                                   yaxis_title="Paths", template='plotly_white', height=450)
+
+            mc_chart_cols = st.columns(2)
+            mc_chart_cols[0].plotly_chart(fan_fig, use_container_width=True)
+            mc_chart_cols[1].plotly_chart(hist_fig, use_container_width=True)
+
+            summary = robustness.summary()
+            st.dataframe(summary.style.format({
+                'Final Value': '${:,.2f}', 'Buy & Hold Final Value': '${:,.2f}', 'Max Drawdown': '{:.2%}',
+                'Buy & Hold Max Drawdown': '{:.2%}', 'Trades': '{:,.0f}'}), use_container_width=True)
@@ -1,10 +1,8 @@
 from datetime import datetime, timedelta
 import streamlit as st
-from sqlalchemy.orm import sessionmaker
-from data_layer import fetch_and_store
 
 # Import your existing modules
-from data_layer import engine, Ticker, Price
+from data_layer import fetch_and_store
 
 # ------------------------------------------------------------------
 # Page config (optional - you can also keep it only in the main app.py)
@@ -17,25 +15,14 @@ st.set_page_config(page_title="View Portfolio", layout="wide")
 st.title("📈 View Portfolio")
 st.markdown("### Add New Ticker to Your Portfolio")
 
-# ------------------------------------------------------------------
-# Database session helper
-# ------------------------------------------------------------------
-Session = sessionmaker(bind=engine)
-
-def get_all_tickers():
-    session = Session()
-    try:
-        tickers = session.query(Ticker).order_by(Ticker.symbol).all()
-        return tickers
-    finally:
-        session.close()
-
 col1, col2 = st.columns(2)
 with col1:
     ticker_input = st.text_input("Ticker Symbol (e.g., AAPL)").upper()
     start_date = st.date_input("Start Date", datetime.now().date() - timedelta(days=365))
 with col2:
     end_date = st.date_input("End Date", datetime.now().date())
+    sync_only = st.checkbox("Only download missing bars", value=True,
+                            help="Skip dates already stored for this ticker (re-fetches the last few days to pick up revisions)")
 
 if st.button("Fetch & Add"):
     if not ticker_input:
@@ -43,7 +30,7 @@ if st.button("Fetch & Add"):
     else:
         with st.spinner(f"Fetching {ticker_input} data..."):
             try:
-                fetch_and_store(ticker_input, start_date=str(start_date), end_date=str(end_date))
+                fetch_and_store(ticker_input, start_date=str(start_date), end_date=str(end_date), sync=sync_only)
                 st.success(f"✅ {ticker_input} added successfully!")
             except Exception as e:
                 st.error(f"❌ Error: {e}")
\ No newline at end of file
@@ -1,9 +1,9 @@
 import streamlit as st
-from sqlalchemy.orm import sessionmaker
 import pandas as pd
 
 # Import your existing modules
-from data_layer import engine, Ticker, remove_ticker
+from data_layer import remove_ticker
+from page_cache import cached_tickers
 
 # ------------------------------------------------------------------
 # Page config (optional - you can also keep it only in the main app.py)
@@ -16,25 +16,14 @@ st.set_page_config(page_title="Trading Simulation", layout="wide")
 st.title("📈 View Portfolio")
 st.markdown("### Remove Ticker from Your Portfolio")
 
-# ------------------------------------------------------------------
-# Database session helper
-# ------------------------------------------------------------------
-Session = sessionmaker(bind=engine)
-
-def get_all_tickers():
-    session = Session()
-    try:
-        tickers = session.query(Ticker).order_by(Ticker.symbol).all()
-        return tickers
-    finally:
-        session.close()
-
-tickers = get_all_tickers()
+tickers = cached_tickers()
 if not tickers:
     st.info("No tickers to remove")
 else:
     ticker_symbols = [t.symbol for t in tickers]
     selected = st.multiselect("Select tickers to remove:", ticker_symbols)
+    reclaim = st.checkbox("Reclaim disk space afterwards", value=False,
+                          help="Vacuum the database file after deleting (the first run may take a while on a large DB)")
 
     if st.button("Remove Selected"):
         if not selected:
@@ -42,7 +31,7 @@ else:
         else:
             with st.spinner("Removing tickers..."):
                 try:
-                    remove_ticker(selected)
+                    remove_ticker(selected, reclaim=reclaim)
                     st.success(f"✅ Removed: {', '.join(selected)}")
                 except Exception as e:
                     st.error(f"❌ Error: {e}")
\ No newline at end of file
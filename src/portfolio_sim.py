@@ -0,0 +1,301 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+from typing import Any, Dict, Optional, Sequence, Union
+
+from trading_bot import ACTION_NAMES, DEPOSIT, BUY, SELL
+from price_matrix import get_price_matrix
+
+Rule = Union[float, Sequence[float]]
+
+# Like trading_bot.TRADE_DTYPE plus the asset's column (-1 and price 0 for deposits)
+PORTFOLIO_TRADE_DTYPE = np.dtype([
+    ('day', np.int64),
+    ('asset', np.int64),
+    ('action', np.int8),
+    ('shares', np.float64),
+    ('price', np.float64),
+    ('cash_change', np.float64),
+])
+_NO_ASSET = np.array([-1])
+_ZERO = np.zeros(1)
+
+
+def _build_log(entries) -> np.ndarray:
+    """One PORTFOLIO_TRADE_DTYPE array from per-day (day, action, assets, shares, price, cash_change) entries."""
+    counts = np.array([len(e[2]) for e in entries], dtype=np.int64)
+    out = np.empty(int(counts.sum()), dtype=PORTFOLIO_TRADE_DTYPE)
+    if len(out):
+        out['day'] = np.repeat([e[0] for e in entries], counts)
+        out['action'] = np.repeat([e[1] for e in entries], counts)
+        for k, name in enumerate(('asset', 'shares', 'price', 'cash_change'), start=2):
+            out[name] = np.concatenate([e[k] for e in entries])
+    return out
+
+
+def simulate_portfolio_arrays(
+    close: np.ndarray,
+    dates: np.ndarray,
+    initial_cash: float,
+    buy_threshold: Rule,
+    sell_threshold: Rule,
+    buy_slippage: Rule,
+    sell_slippage: Rule,
+    trade_percent: Rule,
+    monthly_investment: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    Run the threshold rules for N assets at once over a (dates x assets) close matrix
+    (NaN where an asset has no bar), drawing on one shared cash balance.
+
+    Rules are scalars or length-N arrays. Signals for the whole matrix are computed up front;
+    each asset's % change is against its own previous bar. Per day: the monthly deposit, then
+    sells, then buys, each buy sized off the post-sell cash (scaled down pro rata if the
+    requested trade percents add up to more than the cash). With a single asset this is
+    exactly trading_bot.simulate_arrays.
+
+    Returns 'cash' (T) and 'shares' (T x N) as recorded before each day's trades, the
+    PORTFOLIO_TRADE_DTYPE log, 'final_cash' and 'final_shares' (N).
+    """
+    t, n = close.shape
+    rules = {name: np.broadcast_to(np.asarray(value, dtype=float), (n,))
+             for name, value in (('buy', buy_threshold), ('sell', sell_threshold),
+                                 ('buy_slip', buy_slippage), ('sell_slip', sell_slippage),
+                                 ('pct', trade_percent))}
+    buy_factor = 1 + rules['buy_slip'] / 100
+    sell_factor = 1 - rules['sell_slip'] / 100
+    trade_percent = rules['pct']
+
+    # Previous bar per asset: forward-fill the closes, then shift down a day
+    present = ~np.isnan(close)
+    last_row = np.where(present, np.arange(t)[:, None], -1)
+    np.maximum.accumulate(last_row, axis=0, out=last_row)
+    prev = np.full((t, n), np.nan)
+    has_prev = last_row[:-1] >= 0
+    prev[1:][has_prev] = close[last_row[:-1][has_prev], np.nonzero(has_prev)[1]]
+    with np.errstate(invalid='ignore'):
+        pct_change = (close / prev - 1) * 100
+        buy_signal = pct_change > rules['buy']  # NaN (no bar / first bar) compares False
+        sell_signal = (pct_change < rules['sell']) & ~buy_signal
+    any_signal = (buy_signal | sell_signal).any(axis=1)
+
+    months = dates.astype('datetime64[M]')
+    new_month = np.ones(t, dtype=bool)
+    new_month[1:] = months[1:] != months[:-1]
+    deposit = monthly_investment > 0
+
+    cash_out = np.empty(t)
+    shares_out = np.empty((t, n))
+    cash = initial_cash
+    shares = np.zeros(n)
+    entries = []
+    for i in range(t):
+        if deposit and new_month[i]:
+            cash += monthly_investment
+            entries.append((i, DEPOSIT, _NO_ASSET, _ZERO, _ZERO, np.array([monthly_investment])))
+
+        cash_out[i] = cash
+        shares_out[i] = shares
+        if not any_signal[i]:
+            continue
+
+        sells = np.flatnonzero(sell_signal[i])
+        if len(sells):
+            sell_price = close[i, sells] * sell_factor[sells]
+            shares_to_sell = shares[sells] * trade_percent[sells]
+            ok = shares_to_sell > 0
+            if ok.any():
+                sells, sell_price, shares_to_sell = sells[ok], sell_price[ok], shares_to_sell[ok]
+                proceeds = shares_to_sell * sell_price
+                cash += proceeds.sum()
+                shares[sells] -= shares_to_sell
+                entries.append((i, SELL, sells, shares_to_sell, sell_price, proceeds))
+
+        buys = np.flatnonzero(buy_signal[i])
+        if len(buys):
+            buy_price = close[i, buys] * buy_factor[buys]
+            budget = cash * trade_percent[buys]
+            requested = budget.sum()
+            if requested > cash:
+                budget = budget * (cash / requested)
+            shares_to_buy = budget / buy_price
+            cost = shares_to_buy * buy_price
+            ok = cost <= cash
+            if ok.any():
+                buys, buy_price, shares_to_buy, cost = buys[ok], buy_price[ok], shares_to_buy[ok], cost[ok]
+                cash -= cost.sum()
+                if cash < 0:  # rounding after a pro-rata scale-down
+                    cash = 0.0
+                shares[buys] += shares_to_buy
+                entries.append((i, BUY, buys, shares_to_buy, buy_price, -cost))
+
+    trades = _build_log(entries)
+    return {
+        'cash': cash_out,
+        'shares': shares_out,
+        'trades': trades,
+        'final_cash': cash,
+        'final_shares': shares,
+    }
+
+
+class PortfolioResult:
+    """
+    Outcome of a portfolio run: the shared calendar, per-asset valuation prices (last known
+    close, 0 before an asset's first bar), daily cash and holdings, and the trade log.
+    DataFrame views are built on first access and kept.
+    """
+    __slots__ = ('dates', 'ticker_ids', 'prices', 'cash', 'shares', 'trades', 'final_cash',
+                 'final_shares', 'error', '_cache')
+
+    def __init__(self, dates=None, ticker_ids=None, prices=None, run: Optional[Dict[str, Any]] = None,
+                 error: Optional[str] = None):
+        self.dates = dates if dates is not None else np.empty(0, dtype='datetime64[D]')
+        self.ticker_ids = ticker_ids if ticker_ids is not None else np.empty(0, dtype=np.int64)
+        self.prices = prices if prices is not None else np.empty((0, 0))
+        run = run or {'cash': np.empty(0), 'shares': np.empty((0, 0)),
+                      'trades': np.empty(0, dtype=PORTFOLIO_TRADE_DTYPE), 'final_cash': 0.0,
+                      'final_shares': np.empty(0)}
+        self.cash = run['cash']
+        self.shares = run['shares']
+        self.trades = run['trades']
+        self.final_cash = float(run['final_cash'])
+        self.final_shares = run['final_shares']
+        self.error = error
+        self._cache = {}
+
+    def _cached(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    @property
+    def asset_value(self) -> np.ndarray:
+        return self._cached('asset_value', lambda: (self.shares * self.prices).sum(axis=1))
+
+    @property
+    def portfolio_value(self) -> np.ndarray:
+        return self._cached('portfolio_value', lambda: self.cash + self.asset_value)
+
+    @property
+    def total_deposits(self) -> float:
+        return float(self.trades['cash_change'][self.trades['action'] == DEPOSIT].sum())
+
+    @property
+    def final_value(self) -> float:
+        if len(self.dates) == 0:
+            return self.final_cash
+        return self.final_cash + float(self.final_shares @ self.prices[-1])
+
+    @property
+    def history_df(self) -> pd.DataFrame:
+        return self._cached('history_df', lambda: pd.DataFrame({
+            'Date': pd.to_datetime(self.dates),
+            'Cash': self.cash,
+            'Asset Value': self.asset_value,
+            'Portfolio Value': self.portfolio_value,
+        }))
+
+    @property
+    def holdings_df(self) -> pd.DataFrame:
+        """Final shares, last price and value per ticker."""
+        def build():
+            last = self.prices[-1] if len(self.dates) else np.zeros(len(self.ticker_ids))
+            return pd.DataFrame({'ticker_id': self.ticker_ids, 'Shares': self.final_shares,
+                                 'Price': last, 'Value': self.final_shares * last})
+        return self._cached('holdings_df', build)
+
+    @property
+    def trades_df(self) -> pd.DataFrame:
+        def build():
+            log = self.trades
+            return pd.DataFrame({
+                'Date': pd.to_datetime(self.dates[log['day']]),
+                # asset -1 (deposits) becomes <NA>
+                'ticker_id': pd.array(self.ticker_ids, dtype='Int64').take(log['asset'], allow_fill=True),
+                'Action': pd.Categorical.from_codes(log['action'], categories=ACTION_NAMES),
+                'Shares': log['shares'],
+                'Price': log['price'],
+                'Cash Change': log['cash_change'],
+            })
+        return self._cached('trades_df', build)
+
+
+def run_portfolio_simulation(
+    ticker_ids: Sequence[int],
+    start_date: date,
+    end_date: date,
+    initial_cash: float,
+    buy_threshold: Rule,
+    sell_threshold: Rule,
+    buy_slippage: Rule,
+    sell_slippage: Rule,
+    trade_percent: Rule,
+    monthly_investment: float = 0.0,
+) -> PortfolioResult:
+    """
+    Simulate several tickers as one portfolio with shared cash (see simulate_portfolio_arrays).
+
+    Rules are scalars, or one value per ticker in `ticker_ids` order. Prices come from the
+    shared PriceMatrix, aligned on the union of the tickers' trading days. Tickers without
+    stored prices are skipped.
+    """
+    if monthly_investment < 0:
+        raise ValueError("monthly_investment must be non-negative")
+    matrix = get_price_matrix()
+    keep = [i for i, t in enumerate(ticker_ids) if t in matrix.ticker_ids]
+    if not keep:
+        return PortfolioResult(error="No price data available for the selected tickers and date range.")
+    ticker_ids = [ticker_ids[i] for i in keep]
+
+    def per_asset(value):
+        value = np.asarray(value, dtype=float)
+        return value if value.ndim == 0 else value[keep]
+
+    view = matrix.slice(start_date, end_date, ticker_ids)
+    rows = view.present.any(axis=1)
+    if not rows.any():
+        return PortfolioResult(error="No price data available for the selected tickers and date range.")
+    close = np.ascontiguousarray(view.fields['close'][rows], dtype=np.float64)
+    dates = view.dates[rows]
+
+    run = simulate_portfolio_arrays(close, dates, initial_cash, per_asset(buy_threshold),
+                                    per_asset(sell_threshold), per_asset(buy_slippage),
+                                    per_asset(sell_slippage), per_asset(trade_percent),
+                                    monthly_investment)
+    prices = pd.DataFrame(close).ffill().fillna(0.0).to_numpy()
+    return PortfolioResult(dates, np.asarray(ticker_ids, dtype=np.int64), prices, run)
+
+
+# === CHECK / BENCHMARK ===
+if __name__ == "__main__":
+    import sys
+    import time
+    from trading_bot import prepare_signals, simulate_arrays
+
+    rng = np.random.default_rng(3)
+    dates = np.arange(np.datetime64('2004-01-01'), np.datetime64('2024-01-01'))
+    dates = dates[np.is_busday(dates)]
+    n_assets = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    close = 100 * np.exp(rng.normal(0, 0.02, (len(dates), n_assets)).cumsum(axis=0))
+    # Staggered listings and scattered missing bars
+    for j in range(n_assets):
+        close[:rng.integers(0, len(dates) // 2), j] = np.nan
+    close[rng.random(close.shape) < 0.01] = np.nan
+
+    # One asset on its own must reproduce the single-ticker kernel exactly
+    for j in range(5):
+        mask = ~np.isnan(close[:, j])
+        single_close, single_dates = close[mask, j], dates[mask]
+        pct_change, new_month = prepare_signals(single_close, single_dates)
+        ref = simulate_arrays(single_close, pct_change, new_month, 10000.0, 1.0, -1.0, 1.0, 0.5, 0.5, 100.0)
+        out = simulate_portfolio_arrays(single_close[:, None], single_dates, 10000.0, 1.0, -1.0, 1.0, 0.5, 0.5, 100.0)
+        assert out['final_cash'] == ref['final_cash'] and out['final_shares'][0] == ref['final_shares']
+        assert np.array_equal(out['cash'], ref['cash']) and np.array_equal(out['shares'][:, 0], ref['shares'])
+    print("single-asset check passed: matches trading_bot.simulate_arrays exactly")
+
+    t0 = time.perf_counter()
+    out = simulate_portfolio_arrays(close, dates, 1_000_000.0, rng.uniform(0.5, 3, n_assets),
+                                    rng.uniform(-3, -0.5, n_assets), 0.5, 0.5, 0.02, 1000.0)
+    print(f"{n_assets} assets x {len(dates)} days: {time.perf_counter() - t0:.2f}s, "
+          f"{len(out['trades'])} log entries, final cash ${out['final_cash']:,.0f}")
@@ -0,0 +1,263 @@
+import os
+import time
+import threading
+import logging
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from data_layer import get_data_versions, load_prices, on_prices_changed
+
+logger = logging.getLogger(__name__)
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+FIELDS = PRICE_FIELDS + ('volume',)
+# How often the shared matrix compares its data versions with the DB, to pick up writes
+# made by other processes (in-process writes are applied at once via on_prices_changed)
+PRICE_MATRIX_CHECK_SECONDS = int(os.getenv("PRICE_MATRIX_CHECK_SECONDS", "60"))
+
+
+def _to_day(value) -> np.datetime64:
+    return np.datetime64(pd.Timestamp(value).date(), 'D')
+
+
+class PriceMatrix:
+    """
+    Prices for many tickers aligned on one shared, sorted date index.
+
+    Each field is a (dates x tickers) array: float OHLC (NaN where a ticker has no bar) and
+    int64 volume (0 where missing), plus a boolean `present` mask. Arrays are column-major,
+    so one ticker's series is contiguous. `slice()` by date range is always a view; a ticker
+    subset is a view when the tickers are adjacent columns (or a single ticker), and
+    otherwise a gather copy.
+
+    A matrix is never modified once built: patch() and drop() return new arrays, so views
+    handed out earlier (and results cached from them) stay consistent. `versions` maps each
+    loaded ticker to the data_version its column was read at (None when built from bare
+    arrays, e.g. in checks).
+    """
+
+    def __init__(self, dates: np.ndarray, ticker_ids: np.ndarray, fields: Dict[str, np.ndarray],
+                 present: np.ndarray, versions: Optional[Dict[int, int]] = None):
+        self.dates = dates
+        self.ticker_ids = ticker_ids
+        self.fields = fields
+        self.present = present
+        self.versions = versions
+        self._columns = {int(t): i for i, t in enumerate(ticker_ids)}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], dtype=np.float64,
+                    versions: Optional[Dict[int, int]] = None) -> 'PriceMatrix':
+        """Build from load_prices(..., as_arrays=True) output (long format, any order)."""
+        dates = np.unique(arrays['date'])
+        ticker_ids = np.unique(arrays['ticker_id'])
+        rows = np.searchsorted(dates, arrays['date'])
+        cols = np.searchsorted(ticker_ids, arrays['ticker_id'])
+        shape = (len(dates), len(ticker_ids))
+
+        fields = {}
+        for name in FIELDS:
+            if name not in arrays:
+                continue
+            if name == 'volume':
+                out = np.zeros(shape, dtype=np.int64, order='F')
+            else:
+                out = np.full(shape, np.nan, dtype=dtype, order='F')
+            out[rows, cols] = arrays[name]
+            fields[name] = out
+        present = np.zeros(shape, dtype=bool, order='F')
+        present[rows, cols] = True
+        return cls(dates, ticker_ids, fields, present, versions)
+
+    @classmethod
+    def load(cls, ticker_ids=None, start=None, end=None, fields: Sequence[str] = FIELDS,
+             dtype=np.float64) -> 'PriceMatrix':
+        # Versions are read first: a write landing in between leaves a column newer than its
+        # recorded version, which the next check reloads, never the other way round
+        versions = get_data_versions(ticker_ids)
+        return cls.from_arrays(load_prices(ticker_ids, start, end, columns=tuple(fields), as_arrays=True),
+                               dtype=dtype, versions=versions)
+
+    # --- shape / lookup ---
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.fields.values()) + self.present.nbytes + self.dates.nbytes
+
+    def column(self, ticker_id: int) -> int:
+        return self._columns[int(ticker_id)]
+
+    def version(self, ticker_id: int) -> Optional[int]:
+        """data_version of the ticker's column, or None if unknown."""
+        return None if self.versions is None else self.versions.get(int(ticker_id))
+
+    def _rows(self, start, end) -> slice:
+        lo = 0 if start is None else int(np.searchsorted(self.dates, _to_day(start), side='left'))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, _to_day(end), side='right'))
+        return slice(lo, hi)
+
+    def _cols(self, ticker_ids):
+        if ticker_ids is None:
+            return slice(None)
+        cols = [self.column(t) for t in ticker_ids]
+        if cols and cols == list(range(cols[0], cols[0] + len(cols))):
+            return slice(cols[0], cols[0] + len(cols))
+        return np.array(cols, dtype=np.intp)
+
+    # --- views ---
+    def slice(self, start=None, end=None, ticker_ids=None) -> 'PriceMatrix':
+        """Inclusive date range and optional ticker subset (in the given order)."""
+        rows, cols = self._rows(start, end), self._cols(ticker_ids)
+        return PriceMatrix(
+            self.dates[rows],
+            self.ticker_ids[cols],
+            {name: arr[rows, cols] for name, arr in self.fields.items()},
+            self.present[rows, cols],
+            self.versions,
+        )
+
+    def series(self, ticker_id: int, field: str = 'close', start=None, end=None, dropna: bool = True):
+        """(dates, values) for one ticker; views unless dropna has to remove missing days."""
+        rows, col = self._rows(start, end), self.column(ticker_id)
+        dates, values = self.dates[rows], self.fields[field][rows, col]
+        if dropna:
+            mask = self.present[rows, col]
+            if not mask.all():
+                return dates[mask], values[mask]
+        return dates, values
+
+    def to_frame(self, field: str = 'close') -> pd.DataFrame:
+        """Wide DataFrame (index = dates, columns = ticker ids) over the field array, without copying."""
+        return pd.DataFrame(self.fields[field], index=pd.DatetimeIndex(self.dates, name='date'),
+                            columns=pd.Index(self.ticker_ids, name='ticker_id'), copy=False)
+
+    # --- maintenance ---
+    def _with_versions(self, versions) -> Optional[Dict[int, int]]:
+        return None if self.versions is None else {**self.versions, **(versions or {})}
+
+    def patch(self, arrays: Dict[str, np.ndarray], versions: Optional[Dict[int, int]] = None) -> 'PriceMatrix':
+        """
+        Apply freshly loaded long-format rows (and the data versions they were read at).
+
+        Copy-on-write: returns a new matrix holding the old cells plus the new rows, growing
+        it for new dates or tickers; this one is left as it was.
+        """
+        versions = self._with_versions(versions)
+        if len(arrays['date']) == 0:
+            return PriceMatrix(self.dates, self.ticker_ids, self.fields, self.present, versions)
+        new_dates = np.setdiff1d(arrays['date'], self.dates, assume_unique=False)
+        new_tickers = np.setdiff1d(arrays['ticker_id'], self.ticker_ids)
+        if len(new_dates) == 0 and len(new_tickers) == 0:
+            dates, ticker_ids = self.dates, self.ticker_ids
+            fields = {name: arr.copy(order='F') for name, arr in self.fields.items()}
+            present = self.present.copy(order='F')
+        else:
+            dates = np.union1d(self.dates, new_dates)
+            ticker_ids = np.union1d(self.ticker_ids, new_tickers)
+            row_map = np.searchsorted(dates, self.dates)
+            col_map = np.searchsorted(ticker_ids, self.ticker_ids)
+            shape = (len(dates), len(ticker_ids))
+            fields = {}
+            for name, old in self.fields.items():
+                out = (np.zeros(shape, dtype=old.dtype, order='F') if name == 'volume'
+                       else np.full(shape, np.nan, dtype=old.dtype, order='F'))
+                out[np.ix_(row_map, col_map)] = old
+                fields[name] = out
+            present = np.zeros(shape, dtype=bool, order='F')
+            present[np.ix_(row_map, col_map)] = self.present
+
+        rows = np.searchsorted(dates, arrays['date'])
+        cols = np.searchsorted(ticker_ids, arrays['ticker_id'])
+        for name, arr in fields.items():
+            if name in arrays:
+                arr[rows, cols] = arrays[name]
+        present[rows, cols] = True
+        return PriceMatrix(dates, ticker_ids, fields, present, versions)
+
+    def drop(self, ticker_ids) -> 'PriceMatrix':
+        ticker_ids = {int(t) for t in ticker_ids}
+        versions = None if self.versions is None else {t: v for t, v in self.versions.items()
+                                                       if t not in ticker_ids}
+        keep = ~np.isin(self.ticker_ids, list(ticker_ids))
+        if keep.all():
+            return PriceMatrix(self.dates, self.ticker_ids, self.fields, self.present, versions)
+        # Also drop dates only the removed tickers had, so the calendar matches a fresh load()
+        rows = self.present[:, keep].any(axis=1)
+        index = np.ix_(rows, keep)
+        return PriceMatrix(self.dates[rows], self.ticker_ids[keep],
+                           {name: np.asfortranarray(arr[index]) for name, arr in self.fields.items()},
+                           np.asfortranarray(self.present[index]), versions)
+
+
+# === PROCESS-WIDE SHARED MATRIX ===
+# One matrix per process: Streamlit serves every browser session from the same process,
+# so all sessions read the same arrays. Data writes replace it (copy-on-write) via
+# on_prices_changed; writes from other processes are found by comparing data versions.
+_shared: Optional[PriceMatrix] = None
+_shared_lock = threading.Lock()
+_checked_at = 0.0
+
+
+def _load_changes(changes: dict) -> Dict[str, np.ndarray]:
+    """Rows of each {ticker_id: since} change (since None = whole history), as one long array set."""
+    parts = [load_prices([ticker_id], since, columns=FIELDS, as_arrays=True) for ticker_id, since in changes.items()]
+    return {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+
+
+def _reload_stale(matrix: PriceMatrix) -> PriceMatrix:
+    """Drop removed tickers and reload every column whose data_version no longer matches the DB."""
+    current = get_data_versions()
+    gone = [t for t in matrix.versions if t not in current]
+    stale = [t for t, version in current.items() if matrix.versions.get(t) != version]
+    if not gone and not stale:
+        return matrix
+    matrix = matrix.drop(gone + stale)
+    if stale:
+        matrix = matrix.patch(load_prices(stale, columns=FIELDS, as_arrays=True), {t: current[t] for t in stale})
+    logger.info(f"Price matrix: reloaded {len(stale)} changed and dropped {len(gone)} removed tickers")
+    return matrix
+
+
+def get_price_matrix() -> PriceMatrix:
+    """
+    The shared matrix of every stored price, loaded on first use. At most every
+    PRICE_MATRIX_CHECK_SECONDS one query compares its data versions with the DB and
+    columns written by other processes are reloaded.
+    """
+    global _shared, _checked_at
+    with _shared_lock:
+        now = time.monotonic()
+        if _shared is None:
+            _shared = PriceMatrix.load()
+            _checked_at = now
+            logger.info(f"Loaded price matrix: {len(_shared.dates)} dates x {len(_shared.ticker_ids)} tickers "
+                        f"({_shared.nbytes / 1e6:.1f} MB)")
+        elif _shared.versions is not None and now - _checked_at >= PRICE_MATRIX_CHECK_SECONDS:
+            _checked_at = now
+            _shared = _reload_stale(_shared)
+        return _shared
+
+
+def invalidate_price_matrix():
+    global _shared
+    with _shared_lock:
+        _shared = None
+
+
+@on_prices_changed
+def _refresh_shared_matrix(changes: dict):
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            return
+        removed = [t for t, since in changes.items() if since is None]
+        matrix = _shared.drop(removed) if removed else _shared
+        written = {t: since for t, since in changes.items() if since is not None}
+        if written:
+            versions = get_data_versions(written)  # before the rows, as in PriceMatrix.load
+            matrix = matrix.patch(_load_changes(written), {t: versions.get(t) for t in written})
+        _shared = matrix
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+class PriceProvider(ABC):
+    """
+    Source of daily OHLCV bars.
+
+    `history()` returns a yfinance-style frame: a DatetimeIndex plus Open/High/Low/Close/Volume
+    columns, covering start <= date < end (end=None means "up to today").
+    """
+
+    @abstractmethod
+    def history(self, symbol: str, start, end=None, interval: str = '1d') -> pd.DataFrame:
+        ...
+
+
+class YahooProvider(PriceProvider):
+    """Live data from Yahoo Finance via yfinance."""
+
+    def history(self, symbol, start, end=None, interval='1d'):
+        import yfinance as yf
+        return yf.Ticker(symbol).history(start=start, end=end, interval=interval,
+                                         actions=False, auto_adjust=False)
+
+
+class DirectoryProvider(PriceProvider):
+    """
+    Reads `<root>/<SYMBOL>.parquet` or `<root>/<SYMBOL>.csv` files.
+
+    Each file needs a date column (or index) named Date plus the OHLCV columns. Parsed files
+    are kept in memory and re-read when their modification time changes; only daily bars
+    are supported.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _load(self, symbol):
+        parquet, csv = self.root / f"{symbol}.parquet", self.root / f"{symbol}.csv"
+        path = parquet if parquet.exists() else csv if csv.exists() else None
+        mtime = path.stat().st_mtime_ns if path is not None else None
+        with self._lock:
+            cached = self._frames.get(symbol)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        if path is parquet:
+            df = pd.read_parquet(parquet)
+        elif path is csv:
+            df = pd.read_csv(csv)
+        else:
+            df = pd.DataFrame(columns=['Date'] + OHLCV_COLUMNS)
+        if 'Date' in df.columns:
+            df = df.set_index('Date')
+        df.index = pd.to_datetime(df.index)
+        df = df.sort_index()
+        with self._lock:
+            self._frames[symbol] = (mtime, df)
+        return df
+
+    def history(self, symbol, start, end=None, interval='1d'):
+        if interval != '1d':
+            raise ValueError(f"DirectoryProvider only serves daily bars, not {interval!r}")
+        df = self._load(symbol)
+        naive = df.index.tz_localize(None) if df.index.tz is not None else df.index
+        mask = naive >= pd.Timestamp(start)
+        if end is not None:
+            mask &= naive < pd.Timestamp(end)
+        return df.loc[mask, [c for c in OHLCV_COLUMNS if c in df.columns]]
+
+
+class CachingProvider(PriceProvider):
+    """
+    Record/replay wrapper: stores each raw response under `cache_dir`, keyed by
+    (symbol, start, end, interval), and replays it while younger than `ttl` seconds
+    (ttl=None never expires). With offline=True a cache miss raises instead of
+    calling the wrapped provider, which keeps CI runs reproducible and network-free.
+    """
+
+    def __init__(self, inner: PriceProvider, cache_dir, ttl: Optional[float] = None, offline: bool = False):
+        self.inner = inner
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, symbol, start, end, interval):
+        key = f"{symbol}|{start}|{end}|{interval}"
+        digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+        safe = re.sub(r'[^A-Za-z0-9._-]', '_', symbol)
+        return self.cache_dir / f"{safe}_{interval}_{digest}.pkl"
+
+    def history(self, symbol, start, end=None, interval='1d'):
+        path = self._path(symbol, start, end, interval)
+        if path.exists() and (self.offline or self.ttl is None or time.time() - path.stat().st_mtime < self.ttl):
+            self.hits += 1
+            return pd.read_pickle(path)
+        if self.offline:
+            raise LookupError(f"No cached response for {symbol} {start}..{end} ({interval}) in {self.cache_dir}")
+
+        self.misses += 1
+        df = self.inner.history(symbol, start, end, interval)
+        # Write to a temp file and rename so concurrent readers never see a partial file
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        df.to_pickle(tmp)
+        os.replace(tmp, path)
+        return df
+
+
+class FakeProvider(PriceProvider):
+    """
+    Offline stand-in for Yahoo: synthetic business-day bars with injected latency and failures.
+
+    `failure_rate` is the probability that any single call raises; `latency` is seconds per call.
+    """
+
+    _CALENDAR = None
+
+    def __init__(self, latency: float = 0.05, failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._paths = {}
+
+    @staticmethod
+    def _calendar() -> pd.DatetimeIndex:
+        if FakeProvider._CALENDAR is None:
+            FakeProvider._CALENDAR = pd.bdate_range('2000-01-03', pd.Timestamp.today().normalize())
+        return FakeProvider._CALENDAR
+
+    def history(self, symbol, start, end=None, interval='1d'):
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.failure_rate
+        time.sleep(self.latency)
+        if fail:
+            raise ConnectionError(f"injected failure for {symbol}")
+
+        # One fixed path per symbol over a shared calendar, sliced per request, so
+        # overlapping requests agree on every bar
+        calendar = self._calendar()
+        end = end if end is not None else calendar[-1] + pd.Timedelta(days=1)
+        with self._lock:
+            if symbol not in self._paths:
+                rng = np.random.default_rng(sum(map(ord, symbol)))
+                self._paths[symbol] = 100 * np.exp(rng.normal(0, 0.01, len(calendar)).cumsum())
+            path = self._paths[symbol]
+        lo, hi = calendar.searchsorted([pd.Timestamp(start), pd.Timestamp(end)])
+        idx = calendar[lo:hi].tz_localize('America/New_York')
+        close = path[lo:hi]
+        return pd.DataFrame({
+            'Open': close, 'High': close * 1.01, 'Low': close * 0.99, 'Close': close,
+            'Volume': np.full(len(idx), 1_000_000.0),
+        }, index=idx)
+
+
+# The default provider is built once per environment setting and reused by every fetch, so
+# DirectoryProvider's parsed files and CachingProvider's state survive between calls
+_default_provider = None
+_default_provider_key = None
+_default_provider_lock = threading.Lock()
+
+
+def get_default_provider() -> PriceProvider:
+    """
+    Provider chosen from the environment (built once, then reused while it is unchanged):
+
+    - PRICE_DATA_DIR: serve bars from a local CSV/Parquet directory instead of Yahoo.
+    - PRICE_CACHE_DIR: record/replay responses there (PRICE_CACHE_TTL seconds, default 12h;
+      PRICE_CACHE_OFFLINE=1 to never touch the network).
+    """
+    global _default_provider, _default_provider_key
+    key = tuple(os.getenv(name) for name in
+                ("PRICE_DATA_DIR", "PRICE_CACHE_DIR", "PRICE_CACHE_TTL", "PRICE_CACHE_OFFLINE"))
+    with _default_provider_lock:
+        if _default_provider is None or key != _default_provider_key:
+            _default_provider, _default_provider_key = _build_default_provider(), key
+        return _default_provider
+
+
+def _build_default_provider() -> PriceProvider:
+    data_dir = os.getenv("PRICE_DATA_DIR")
+    provider = DirectoryProvider(data_dir) if data_dir else YahooProvider()
+    cache_dir = os.getenv("PRICE_CACHE_DIR")
+    if cache_dir:
+        ttl = float(os.getenv("PRICE_CACHE_TTL", str(12 * 3600)))
+        offline = os.getenv("PRICE_CACHE_OFFLINE", "0") == "1"
+        provider = CachingProvider(provider, cache_dir, ttl=ttl or None, offline=offline)
+    return provider
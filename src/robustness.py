@@ -0,0 +1,282 @@
+import os
+import numpy as np
+import pandas as pd
+from datetime import date
+from typing import Callable, Dict, Optional
+
+from analytics import simple_returns, TRADING_DAYS
+from price_matrix import get_price_matrix
+
+MC_CHUNK_PATHS = int(os.getenv("MC_CHUNK_PATHS", "2500"))  # paths simulated together; bounds memory
+FAN_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+# === PATHS ===
+def bootstrap_paths(returns: np.ndarray, n_paths: int, n_days: int, block_size: int = 1,
+                    start_price: float = 1.0, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    (n_days + 1) x n_paths close prices built from resampled daily `returns` (NaN-free).
+
+    block_size 1 draws days independently; larger blocks copy runs of consecutive days
+    (moving-block bootstrap), keeping volatility clustering and short-term momentum that the
+    threshold rules react to. Row 0 is `start_price` on every path. Days run down axis 0 so
+    each simulated day is one contiguous row.
+    """
+    rng = rng or np.random.default_rng()
+    returns = np.asarray(returns, dtype=np.float64)
+    block_size = max(1, min(int(block_size), len(returns)))
+    n_blocks = -(-n_days // block_size)
+    starts = rng.integers(0, len(returns) - block_size + 1, size=(n_blocks, 1, n_paths))
+    idx = (starts + np.arange(block_size)[None, :, None]).reshape(n_blocks * block_size, n_paths)[:n_days]
+    close = np.empty((n_days + 1, n_paths))
+    close[0] = start_price
+    np.cumprod(1 + returns[idx], axis=0, out=close[1:])
+    close[1:] *= start_price
+    return close
+
+
+def business_days(after, n_days: int) -> np.ndarray:
+    """The first n_days weekdays after `after`, as datetime64[D]."""
+    first = np.busday_offset(np.datetime64(after, 'D'), 1, roll='forward')
+    return np.busday_offset(first, np.arange(n_days), roll='forward')
+
+
+# === KERNEL ===
+def simulate_paths(
+    close: np.ndarray,
+    dates: np.ndarray,
+    initial_cash: float,
+    buy_threshold: float,
+    sell_threshold: float,
+    buy_slippage: float,
+    sell_slippage: float,
+    trade_percent: float,
+    monthly_investment: float = 0.0,
+    record_every: int = 5,
+) -> Dict[str, np.ndarray]:
+    """
+    Run the threshold rules over every column of a (days x paths) close matrix at once.
+
+    Portfolio state is a length-P vector advanced day by day, as in sweep.sweep_arrays, and
+    per path the arithmetic is exactly that of trading_bot.simulate_arrays, so a path's
+    final cash and shares match a single run on it. A buy-and-hold investor putting the initial
+    cash and each deposit into the asset at the close runs alongside as the benchmark.
+
+    Returns length-P arrays (final_cash, final_shares, final_value, trades, max_drawdown,
+    buy_hold_value, buy_hold_drawdown), total_deposits, and portfolio values every
+    `record_every` days ('recorded_days' x P in 'recorded_values') for fan charts.
+    """
+    n, p = close.shape
+    buy_factor = 1 + buy_slippage / 100
+    sell_factor = 1 - sell_slippage / 100
+    months = dates.astype('datetime64[M]')
+    new_month = np.ones(n, dtype=bool)
+    new_month[1:] = months[1:] != months[:-1]
+    deposit = monthly_investment > 0
+
+    cash = np.full(p, float(initial_cash))
+    shares = np.zeros(p)
+    trades = np.zeros(p, dtype=np.int64)
+    peak = np.full(p, -np.inf)
+    max_drawdown = np.zeros(p)
+    # The day-0 deposit is invested together with the initial cash
+    hold_shares = (initial_cash + (monthly_investment if deposit else 0.0)) / close[0]
+    hold_peak = np.full(p, -np.inf)
+    hold_drawdown = np.zeros(p)
+    total_deposits = float(initial_cash)
+    recorded_days = np.arange(0, n, max(1, record_every))
+    recorded = np.empty((len(recorded_days), p))
+    value = np.empty(p)
+    hold_value = np.empty(p)
+    change = np.empty(p)
+    mask = np.empty(p, dtype=bool)
+
+    for i in range(n):
+        price = close[i]
+        if deposit and new_month[i]:
+            cash += monthly_investment
+            total_deposits += monthly_investment
+            if i:
+                hold_shares += monthly_investment / price
+
+        np.multiply(shares, price, out=value)
+        value += cash
+        np.maximum(peak, value, out=peak)
+        np.maximum(max_drawdown, (peak - value) / peak, out=max_drawdown)
+        np.multiply(hold_shares, price, out=hold_value)
+        np.maximum(hold_peak, hold_value, out=hold_peak)
+        np.maximum(hold_drawdown, (hold_peak - hold_value) / hold_peak, out=hold_drawdown)
+        if i % max(1, record_every) == 0:
+            recorded[i // max(1, record_every)] = value
+
+        if i == 0:  # no day-over-day change on the first day
+            continue
+        np.divide(price, close[i - 1], out=change)
+        change -= 1
+        change *= 100
+
+        # BUY where the price grew over the threshold (and the cost is covered, as in simulate_arrays)
+        np.greater(change, buy_threshold, out=mask)
+        buying = np.flatnonzero(mask)
+        if len(buying):
+            buy_price = price[buying] * buy_factor
+            shares_to_buy = (cash[buying] * trade_percent) / buy_price
+            cost = shares_to_buy * buy_price
+            ok = cost <= cash[buying]
+            idx = buying[ok]
+            cash[idx] -= cost[ok]
+            shares[idx] += shares_to_buy[ok]
+            trades[idx] += 1
+
+        # SELL where it fell below the threshold (and did not buy)
+        selling = np.flatnonzero((change < sell_threshold) & ~mask)
+        if len(selling):
+            sell_price = price[selling] * sell_factor
+            shares_to_sell = shares[selling] * trade_percent
+            ok = shares_to_sell > 0
+            idx = selling[ok]
+            cash[idx] += shares_to_sell[ok] * sell_price[ok]
+            shares[idx] -= shares_to_sell[ok]
+            trades[idx] += 1
+
+    return {
+        'final_cash': cash,
+        'final_shares': shares,
+        'final_value': cash + shares * close[-1],
+        'trades': trades,
+        'max_drawdown': max_drawdown,
+        'buy_hold_value': hold_shares * close[-1],
+        'buy_hold_drawdown': hold_drawdown,
+        'total_deposits': total_deposits,
+        'recorded_days': recorded_days,
+        'recorded_values': recorded,
+    }
+
+
+# === RESULTS ===
+class RobustnessResult:
+    """Per-path outcomes of a Monte Carlo run plus distribution summaries."""
+
+    def __init__(self, run: Dict[str, np.ndarray], dates: np.ndarray, block_size: int):
+        self.dates = dates
+        self.block_size = block_size
+        self.final_value = run['final_value']
+        self.max_drawdown = run['max_drawdown']
+        self.trades = run['trades']
+        self.buy_hold_value = run['buy_hold_value']
+        self.buy_hold_drawdown = run['buy_hold_drawdown']
+        self.total_deposits = run['total_deposits']
+        self.recorded_days = run['recorded_days']
+        self.recorded_values = run['recorded_values']
+
+    @property
+    def n_paths(self) -> int:
+        return len(self.final_value)
+
+    @property
+    def prob_loss(self) -> float:
+        """Share of paths ending below the money put in."""
+        return float((self.final_value < self.total_deposits).mean())
+
+    @property
+    def prob_beat_buy_hold(self) -> float:
+        return float((self.final_value > self.buy_hold_value).mean())
+
+    def summary(self) -> pd.DataFrame:
+        """Mean and FAN_QUANTILES of final value and max drawdown, strategy vs buy & hold."""
+        columns = {
+            'Final Value': self.final_value,
+            'Buy & Hold Final Value': self.buy_hold_value,
+            'Max Drawdown': self.max_drawdown,
+            'Buy & Hold Max Drawdown': self.buy_hold_drawdown,
+            'Trades': self.trades.astype(np.float64),
+        }
+        index = ['Mean'] + [f"P{round(q * 100)}" for q in FAN_QUANTILES]
+        return pd.DataFrame({name: np.concatenate([[v.mean()], np.quantile(v, FAN_QUANTILES)])
+                             for name, v in columns.items()}, index=index)
+
+    def fan_df(self) -> pd.DataFrame:
+        """Portfolio value quantiles across paths on the recorded days (one column per quantile)."""
+        q = np.quantile(self.recorded_values, FAN_QUANTILES, axis=1).T
+        return pd.DataFrame(q, index=pd.Index(self.dates[self.recorded_days], name='Date'),
+                            columns=[f"P{round(x * 100)}" for x in FAN_QUANTILES])
+
+
+def run_robustness(
+    ticker_id: int,
+    start_date: date,
+    end_date: date,
+    initial_cash: float,
+    buy_threshold: float,
+    sell_threshold: float,
+    trade_percent: float = 0.5,
+    buy_slippage: float = 1.0,
+    sell_slippage: float = 1.0,
+    monthly_investment: float = 0.0,
+    n_paths: int = 10000,
+    years: float = 5.0,
+    block_size: int = 20,
+    seed: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Optional[RobustnessResult]:
+    """
+    Bootstrap `n_paths` future price paths of `years` from the ticker's daily returns between
+    start_date and end_date, and run the threshold rules over all of them. Paths start the
+    business day after end_date at the last close and are simulated MC_CHUNK_PATHS at a
+    time; on_progress(done, total) is called after each chunk. None if there is no history.
+    """
+    matrix = get_price_matrix()
+    if ticker_id not in matrix.ticker_ids:
+        return None
+    _, close = matrix.series(ticker_id, 'close', start_date, end_date)
+    returns = simple_returns(np.asarray(close, dtype=np.float64))[1:]
+    returns = returns[~np.isnan(returns)]
+    if len(returns) < 2:
+        return None
+
+    n_days = max(1, int(round(years * TRADING_DAYS)))
+    dates = business_days(end_date, n_days + 1)
+    rng = np.random.default_rng(seed)
+    parts = []
+    for lo in range(0, n_paths, MC_CHUNK_PATHS):
+        size = min(MC_CHUNK_PATHS, n_paths - lo)
+        paths = bootstrap_paths(returns, size, n_days, block_size, float(close[-1]), rng)
+        parts.append(simulate_paths(paths, dates, initial_cash, buy_threshold, sell_threshold,
+                                    buy_slippage, sell_slippage, trade_percent, monthly_investment))
+        if on_progress:
+            on_progress(lo + size, n_paths)
+
+    run = {name: np.concatenate([part[name] for part in parts], axis=-1)
+           for name in ('final_cash', 'final_shares', 'final_value', 'trades', 'max_drawdown',
+                        'buy_hold_value', 'buy_hold_drawdown', 'recorded_values')}
+    run['total_deposits'] = parts[0]['total_deposits']
+    run['recorded_days'] = parts[0]['recorded_days']
+    return RobustnessResult(run, dates, block_size)
+
+
+# === CHECK / BENCHMARK ===
+if __name__ == "__main__":
+    import time
+    from trading_bot import prepare_signals, simulate_arrays
+
+    rng = np.random.default_rng(22)
+    history = rng.standard_t(4, 2520) * 0.012 + 0.0003  # ten years of fat-tailed daily returns
+
+    n_paths, n_days = 10000, 5 * TRADING_DAYS
+    dates = business_days('2024-01-01', n_days + 1)
+    t0 = time.perf_counter()
+    paths = bootstrap_paths(history, n_paths, n_days, block_size=20, start_price=100.0, rng=rng)
+    generated = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    out = simulate_paths(paths, dates, 10000.0, 2.0, -2.0, 1.0, 1.0, 0.5, monthly_investment=100.0)
+    simulated = time.perf_counter() - t0
+    print(f"{n_paths} paths x {n_days} days: bootstrap {generated:.2f}s, rules {simulated:.2f}s")
+
+    for j in rng.choice(n_paths, 20, replace=False):
+        pct_change, new_month = prepare_signals(paths[:, j], dates)
+        single = simulate_arrays(paths[:, j], pct_change, new_month, 10000.0, 2.0, -2.0, 1.0, 1.0, 0.5, 100.0)
+        assert single['final_cash'] == out['final_cash'][j] and single['final_shares'] == out['final_shares'][j]
+        assert (single['trades']['action'] != 0).sum() == out['trades'][j]
+        hold = (10000.0 + 100.0) / paths[0, j] + (100.0 / paths[1:, j][new_month[1:]]).sum()
+        assert np.isclose(out['buy_hold_value'][j], hold * paths[-1, j])
+    print("spot check passed: paths match individual simulate_arrays runs exactly")
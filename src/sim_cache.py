@@ -0,0 +1,145 @@
+import os
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from data_layer import on_prices_changed
+
+logger = logging.getLogger(__name__)
+
+SIM_CACHE_MAX_BYTES = int(os.getenv("SIM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SIM_CACHE_DIR = os.getenv("SIM_CACHE_DIR")  # unset = memory only
+INDICATOR_CACHE_MAX_BYTES = int(os.getenv("INDICATOR_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class SimulationCache:
+    """
+    Two-tier cache of simulation outputs (dicts of NumPy arrays).
+
+    Keys are tuples starting with (ticker_id, data_version, ...), so a write to a ticker
+    (which bumps its data_version) makes its old entries unreachable; they are also purged
+    eagerly via on_prices_changed. The memory tier is an LRU bounded by total array bytes;
+    the optional disk tier stores one uncompressed .npz per entry and survives restarts.
+    """
+
+    def __init__(self, max_bytes: int = SIM_CACHE_MAX_BYTES, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+
+    @staticmethod
+    def _nbytes(arrays: Dict[str, np.ndarray]) -> int:
+        return sum(np.asarray(a).nbytes for a in arrays.values())
+
+    def _path(self, key: tuple) -> Path:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return self.disk_dir / f"{key[0]}_{digest}.npz"
+
+    def get(self, key: tuple) -> Optional[Dict[str, np.ndarray]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        if self.disk_dir:
+            path = self._path(key)
+            if path.exists():
+                with np.load(path, allow_pickle=False) as npz:
+                    arrays = {name: npz[name] for name in npz.files}
+                self.disk_hits += 1
+                self._remember(key, arrays)
+                return arrays
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, arrays: Dict[str, np.ndarray]):
+        self._remember(key, arrays)
+        if self.disk_dir:
+            self._write(self._path(key), arrays)
+
+    @staticmethod
+    def _write(path: Path, arrays: Dict[str, np.ndarray]):
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    def _remember(self, key, arrays):
+        size = self._nbytes(arrays)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (arrays, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def discard_ticker(self, ticker_id: int):
+        """Drop every entry (memory and disk) for a ticker."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == ticker_id]:
+                self._bytes -= self._entries.pop(key)[1]
+        if self.disk_dir:
+            for path in self.disk_dir.glob(f"{ticker_id}_*.npz"):
+                path.unlink(missing_ok=True)
+
+    def rewrite_ticker(self, ticker_id: int, fn: Callable[[Dict[str, np.ndarray]], Optional[Dict[str, np.ndarray]]]):
+        """Replace every entry (memory and disk) for a ticker with fn(arrays); None drops it."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == ticker_id]:
+                arrays, size = self._entries.pop(key)
+                self._bytes -= size
+                arrays = fn(arrays)
+                if arrays is not None:
+                    size = self._nbytes(arrays)
+                    self._entries[key] = (arrays, size)
+                    self._bytes += size
+        if self.disk_dir:
+            for path in self.disk_dir.glob(f"{ticker_id}_*.npz"):
+                with np.load(path, allow_pickle=False) as npz:
+                    arrays = fn({name: npz[name] for name in npz.files})
+                if arrays is None:
+                    path.unlink(missing_ok=True)
+                else:
+                    self._write(path, arrays)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+simulation_cache = SimulationCache(disk_dir=SIM_CACHE_DIR)
+# Resumable runs (see trading_bot.run_simulation), keyed without end_date. These are rewound,
+# not purged, when prices change, so trading_bot maintains them itself.
+checkpoint_cache = SimulationCache(disk_dir=os.path.join(SIM_CACHE_DIR, "checkpoints") if SIM_CACHE_DIR else None)
+# Full-history indicator arrays (see strategies.py), shared by every run on the ticker; memory only
+indicator_cache = SimulationCache(max_bytes=INDICATOR_CACHE_MAX_BYTES)
+
+
+@on_prices_changed
+def _purge_changed_tickers(changes: dict):
+    for ticker_id in changes:
+        simulation_cache.discard_ticker(ticker_id)
+        indicator_cache.discard_ticker(ticker_id)
@@ -0,0 +1,340 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from price_matrix import get_price_matrix
+from sim_cache import indicator_cache, simulation_cache
+from trading_bot import SimulationResult, execute_signals, prepare_signals
+
+Signals = Tuple[np.ndarray, np.ndarray]  # (buy, sell) boolean arrays, one entry per bar
+
+
+# === INDICATORS ===
+# Each takes a 1-D close series and returns an array of the same length, NaN until the
+# window is full. They run over a ticker's whole history once, so windows are warm on the
+# first bar of any run.
+def _windows(close: np.ndarray, window: int) -> np.ndarray:
+    return np.lib.stride_tricks.sliding_window_view(close, window)
+
+
+def _padded(values: np.ndarray, n: int) -> np.ndarray:
+    out = np.full(n, np.nan)
+    out[n - len(values):] = values
+    return out
+
+
+def pct_change(close: np.ndarray) -> np.ndarray:
+    """Day-over-day % change, NaN on the first bar (the same float ops as prepare_signals)."""
+    out = np.full(len(close), np.nan)
+    out[1:] = (close[1:] / close[:-1] - 1) * 100
+    return out
+
+
+def sma(close: np.ndarray, window: int) -> np.ndarray:
+    if len(close) < window:
+        return np.full(len(close), np.nan)
+    return _padded(_windows(close, window).mean(axis=1), len(close))
+
+
+def rolling_std(close: np.ndarray, window: int) -> np.ndarray:
+    if len(close) < window:
+        return np.full(len(close), np.nan)
+    return _padded(_windows(close, window).std(axis=1, ddof=1), len(close))
+
+
+def zscore(close: np.ndarray, window: int) -> np.ndarray:
+    """Distance of the close from its `window`-bar mean, in standard deviations."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (close - sma(close, window)) / rolling_std(close, window)
+
+
+def rsi(close: np.ndarray, window: int = 14) -> np.ndarray:
+    """Wilder's relative strength index (0-100), seeded with the mean of the first `window` moves."""
+    out = np.full(len(close), np.nan)
+    if len(close) <= window:
+        return out
+    moves = np.diff(close)
+    gains, losses = np.maximum(moves, 0.0).tolist(), np.maximum(-moves, 0.0).tolist()
+    avg_gain, avg_loss = sum(gains[:window]) / window, sum(losses[:window]) / window
+    smoothed = np.empty((len(moves) - window + 1, 2))
+    smoothed[0] = (avg_gain, avg_loss)
+    for i in range(window, len(moves)):
+        avg_gain = (avg_gain * (window - 1) + gains[i]) / window
+        avg_loss = (avg_loss * (window - 1) + losses[i]) / window
+        smoothed[i - window + 1] = (avg_gain, avg_loss)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[window:] = 100 - 100 / (1 + smoothed[:, 0] / smoothed[:, 1])
+    out[window:][smoothed[:, 1] == 0] = 100.0
+    return out
+
+
+def prior_high(close: np.ndarray, window: int) -> np.ndarray:
+    """Highest close of the `window` bars before each bar (today excluded)."""
+    if len(close) <= window:
+        return np.full(len(close), np.nan)
+    return _padded(_windows(close[:-1], window).max(axis=1), len(close))
+
+
+def prior_low(close: np.ndarray, window: int) -> np.ndarray:
+    """Lowest close of the `window` bars before each bar (today excluded)."""
+    if len(close) <= window:
+        return np.full(len(close), np.nan)
+    return _padded(_windows(close[:-1], window).min(axis=1), len(close))
+
+
+INDICATORS = {
+    'pct_change': pct_change,
+    'sma': sma,
+    'rolling_std': rolling_std,
+    'zscore': zscore,
+    'rsi': rsi,
+    'prior_high': prior_high,
+    'prior_low': prior_low,
+}
+
+
+class IndicatorSource:
+    """
+    Indicators over one ticker's full close history. Results are kept in
+    sim_cache.indicator_cache under (ticker_id, data_version, name, params), so every run
+    and strategy on the same data shares them; data_version None computes without caching.
+    """
+
+    def __init__(self, ticker_id: int, close: np.ndarray, data_version: Optional[int] = None):
+        self.ticker_id = ticker_id
+        self.close = close
+        self.data_version = data_version
+
+    def __call__(self, name: str, **params) -> np.ndarray:
+        if self.data_version is None:
+            return INDICATORS[name](self.close, **params)
+        key = (int(self.ticker_id), int(self.data_version), name, tuple(sorted(params.items())))
+        cached = indicator_cache.get(key)
+        if cached is None:
+            cached = {'values': INDICATORS[name](self.close, **params)}
+            indicator_cache.put(key, cached)
+        return cached['values']
+
+
+def _crosses_above(a: np.ndarray, b) -> np.ndarray:
+    out = np.zeros(len(a), dtype=bool)
+    b = np.broadcast_to(b, a.shape)
+    out[1:] = (a[1:] > b[1:]) & (a[:-1] <= b[:-1])
+    return out
+
+
+def _crosses_below(a: np.ndarray, b) -> np.ndarray:
+    out = np.zeros(len(a), dtype=bool)
+    b = np.broadcast_to(b, a.shape)
+    out[1:] = (a[1:] < b[1:]) & (a[:-1] >= b[:-1])
+    return out
+
+
+# === STRATEGIES ===
+class Strategy:
+    """
+    A trading rule as whole-array signals. Subclasses keep their parameters in `params`
+    and implement signals(), which reads indicators from an IndicatorSource and returns
+    (buy, sell) boolean arrays over the ticker's full history; execute_signals only
+    consumes them.
+    """
+    label = 'Strategy'
+
+    def __init__(self, **params):
+        self.params = params
+
+    def signals(self, indicators: IndicatorSource) -> Signals:
+        raise NotImplementedError
+
+    def key(self) -> tuple:
+        return (type(self).__name__, tuple(sorted(self.params.items())))
+
+    def __repr__(self):
+        args = ', '.join(f"{k}={v}" for k, v in self.params.items())
+        return f"{type(self).__name__}({args})"
+
+
+class ThresholdStrategy(Strategy):
+    """The original rule: buy after a daily gain over buy_threshold %, sell after a move under sell_threshold %."""
+    label = 'Daily % Change'
+
+    def __init__(self, buy_threshold: float = 5.0, sell_threshold: float = -10.0):
+        super().__init__(buy_threshold=float(buy_threshold), sell_threshold=float(sell_threshold))
+
+    def signals(self, indicators):
+        change = indicators('pct_change')
+        return change > self.params['buy_threshold'], change < self.params['sell_threshold']
+
+
+class MovingAverageCross(Strategy):
+    """Buy when the fast moving average crosses above the slow one, sell when it crosses below."""
+    label = 'Moving Average Cross'
+
+    def __init__(self, fast: int = 50, slow: int = 200):
+        super().__init__(fast=int(fast), slow=int(slow))
+
+    def signals(self, indicators):
+        fast, slow = indicators('sma', window=self.params['fast']), indicators('sma', window=self.params['slow'])
+        return _crosses_above(fast, slow), _crosses_below(fast, slow)
+
+
+class RSIStrategy(Strategy):
+    """Buy when RSI climbs back above `oversold`, sell when it drops back below `overbought`."""
+    label = 'RSI'
+
+    def __init__(self, window: int = 14, oversold: float = 30.0, overbought: float = 70.0):
+        super().__init__(window=int(window), oversold=float(oversold), overbought=float(overbought))
+
+    def signals(self, indicators):
+        value = indicators('rsi', window=self.params['window'])
+        return _crosses_above(value, self.params['oversold']), _crosses_below(value, self.params['overbought'])
+
+
+class BreakoutStrategy(Strategy):
+    """Buy on a close above the prior `window`-bar high, sell on a close below the prior low."""
+    label = 'Breakout'
+
+    def __init__(self, window: int = 20):
+        super().__init__(window=int(window))
+
+    def signals(self, indicators):
+        close = indicators.close
+        return (close > indicators('prior_high', window=self.params['window']),
+                close < indicators('prior_low', window=self.params['window']))
+
+
+class ZScoreStrategy(Strategy):
+    """Mean reversion: buy when the z-score falls through -entry, sell when it rises through +entry."""
+    label = 'Z-Score Reversion'
+
+    def __init__(self, window: int = 20, entry: float = 2.0):
+        super().__init__(window=int(window), entry=float(entry))
+
+    def signals(self, indicators):
+        z = indicators('zscore', window=self.params['window'])
+        return _crosses_below(z, -self.params['entry']), _crosses_above(z, self.params['entry'])
+
+
+STRATEGIES: Dict[str, type] = {cls.label: cls for cls in
+                               (ThresholdStrategy, MovingAverageCross, RSIStrategy, BreakoutStrategy, ZScoreStrategy)}
+
+
+def run_strategy(
+    ticker_id: int,
+    strategy: Strategy,
+    start_date: date,
+    end_date: date,
+    initial_cash: float,
+    buy_slippage: float = 1.0,
+    sell_slippage: float = 1.0,
+    trade_percent: float = 0.5,
+    monthly_investment: float = 0.0,
+    use_cache: bool = True,
+) -> SimulationResult:
+    """
+    Run any Strategy on one ticker between start_date and end_date.
+
+    Signals are computed over the ticker's whole history in the shared PriceMatrix (indicators
+    cached per data version) and sliced to the range; as in run_simulation, the first bar of
+    the range never trades. Results are memoized in sim_cache.simulation_cache under the
+    data_version of the matrix column they were computed from, which can lag the DB until
+    the matrix's next check, so no lookup query is needed either.
+    ThresholdStrategy gives exactly run_simulation's result.
+    """
+    if monthly_investment < 0:
+        raise ValueError("monthly_investment must be non-negative")
+    matrix = get_price_matrix()
+    if ticker_id not in matrix.ticker_ids:
+        return SimulationResult(error="No price data available for the selected ticker and date range.")
+    version = matrix.version(ticker_id) if use_cache else None
+    key = None
+    if version is not None:
+        # 'strategy-run': entries older code stored under the DB's version may hold older bars
+        key = (int(ticker_id), int(version), 'strategy-run', strategy.key(), str(start_date), str(end_date),
+               float(initial_cash), float(buy_slippage), float(sell_slippage), float(trade_percent),
+               float(monthly_investment))
+        out = simulation_cache.get(key)
+        if out is not None:
+            return SimulationResult(out)
+
+    all_dates, all_close = matrix.series(ticker_id, 'close')
+    all_close = np.ascontiguousarray(all_close, dtype=np.float64)
+    lo = 0 if start_date is None else int(np.searchsorted(all_dates, np.datetime64(pd.Timestamp(start_date).date(), 'D')))
+    hi = len(all_dates) if end_date is None else int(np.searchsorted(
+        all_dates, np.datetime64(pd.Timestamp(end_date).date(), 'D'), side='right'))
+    if hi <= lo:
+        return SimulationResult(error="No price data available for the selected ticker and date range.")
+
+    buy, sell = strategy.signals(IndicatorSource(ticker_id, all_close, version))
+    buy, sell = buy[lo:hi].copy(), sell[lo:hi].copy()
+    buy[0] = sell[0] = False
+    dates, close = all_dates[lo:hi], all_close[lo:hi]
+    _, new_month = prepare_signals(close, dates)
+    out = execute_signals(close, buy, sell, new_month, initial_cash, buy_slippage, sell_slippage,
+                          trade_percent, monthly_investment)
+    out = {
+        'dates': dates,
+        'close': close,
+        'cash': out['cash'],
+        'shares': out['shares'],
+        'trades': out['trades'],
+        'final_cash': np.float64(out['final_cash']),
+        'final_shares': np.float64(out['final_shares']),
+    }
+    if key is not None:
+        simulation_cache.put(key, out)
+    return SimulationResult(out)
+
+
+# === CHECK / BENCHMARK ===
+if __name__ == "__main__":
+    import time
+    import price_matrix
+    from trading_bot import simulate_arrays
+
+    rng = np.random.default_rng(24)
+    dates = np.arange(np.datetime64('2004-01-01'), np.datetime64('2024-01-01'))
+    dates = dates[np.is_busday(dates)]
+    close = 100 * np.exp(rng.normal(0.0002, 0.015, len(dates)).cumsum())
+    price_matrix._shared = price_matrix.PriceMatrix.from_arrays(
+        {'ticker_id': np.ones(len(dates), dtype=np.int64), 'date': dates, 'close': close})
+
+    # Indicators against pandas
+    s = pd.Series(close)
+    assert np.allclose(sma(close, 50), s.rolling(50).mean(), equal_nan=True)
+    assert np.allclose(zscore(close, 20), (s - s.rolling(20).mean()) / s.rolling(20).std(), equal_nan=True)
+    assert np.allclose(prior_high(close, 20), s.shift(1).rolling(20).max(), equal_nan=True)
+    gain, loss = s.diff().clip(lower=0), (-s.diff()).clip(lower=0)
+    ref_rsi = np.full(len(s), np.nan)
+    ag, al = gain[1:15].mean(), loss[1:15].mean()
+    ref_rsi[14] = 100 - 100 / (1 + ag / al)
+    for i in range(15, len(s)):
+        ag, al = (ag * 13 + gain[i]) / 14, (al * 13 + loss[i]) / 14
+        ref_rsi[i] = 100 - 100 / (1 + ag / al)
+    assert np.allclose(rsi(close, 14), ref_rsi, equal_nan=True)
+
+    # The threshold strategy reproduces the original kernel exactly on any sub-range
+    lo, hi = 1000, 3500
+    result = run_strategy(1, ThresholdStrategy(1.0, -1.0), dates[lo], dates[hi - 1], 10000.0, 1.0, 0.5, 0.5, 100.0,
+                          use_cache=False)
+    pct, months = prepare_signals(close[lo:hi], dates[lo:hi])
+    ref = simulate_arrays(close[lo:hi], pct, months, 10000.0, 1.0, -1.0, 1.0, 0.5, 0.5, 100.0)
+    assert result.final_cash == ref['final_cash'] and result.final_shares == ref['final_shares']
+    assert np.array_equal(result.trades, ref['trades'])
+
+    strategies = [ThresholdStrategy(1.0, -1.0), MovingAverageCross(20, 100), RSIStrategy(), BreakoutStrategy(55),
+                  ZScoreStrategy(20, 2.0)]
+    t0 = time.perf_counter()
+    for strategy in strategies:
+        strategy.signals(IndicatorSource(1, close, data_version=1))
+    cold = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for strategy in strategies:
+        strategy.signals(IndicatorSource(1, close, data_version=1))
+    warm = time.perf_counter() - t0
+    print(f"5 strategies' signals over {len(close)} bars: {cold * 1000:.1f} ms cold, {warm * 1000:.2f} ms from the indicator cache")
+    for strategy in strategies:
+        r = run_strategy(1, strategy, None, None, 10000.0, use_cache=False)
+        print(f"  {strategy!r}: {int(r.is_buy.sum())} buys, {int(r.is_sell.sum())} sells, final ${r.final_value:,.2f}")
+    print("check passed: indicators match pandas and ThresholdStrategy matches simulate_arrays exactly")
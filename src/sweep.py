@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+from typing import Sequence
+
+from trading_bot import prepare_signals
+from price_matrix import get_price_matrix
+
+SWEEP_PARAMS = ('buy_threshold', 'sell_threshold', 'trade_percent', 'buy_slippage', 'sell_slippage')
+
+
+def parameter_grid(**axes: Sequence[float]) -> pd.DataFrame:
+    """Cartesian product of the given parameter axes, one row per combination (first axis varies slowest)."""
+    names = list(axes)
+    mesh = np.meshgrid(*[np.asarray(axes[n], dtype=float) for n in names], indexing='ij')
+    return pd.DataFrame({n: m.ravel() for n, m in zip(names, mesh)})
+
+
+def sweep_arrays(
+    close: np.ndarray,
+    dates: np.ndarray,
+    initial_cash: float,
+    buy_threshold: np.ndarray,
+    sell_threshold: np.ndarray,
+    trade_percent: np.ndarray,
+    buy_slippage: np.ndarray,
+    sell_slippage: np.ndarray,
+    monthly_investment: float = 0.0,
+    signals=None,
+) -> dict:
+    """
+    Evaluate many parameter combinations over one price series in a single pass.
+
+    Each parameter is a length-P array (one entry per combination); portfolio state is a
+    length-P vector advanced day by day, so the per-day work is a handful of vector ops
+    regardless of P. Per combination it applies exactly the scalar arithmetic of
+    trading_bot.simulate_arrays, so final values agree with individual runs.
+
+    `signals` is an optional precomputed (pct_change, new_month) pair, as prepare_signals
+    returns, for callers that sweep many windows of one series.
+
+    Returns length-P arrays: final_cash, final_shares, final_value, trades (buys + sells)
+    and max_drawdown (largest peak-to-trough fall of portfolio value, deposits included).
+    """
+    buy_threshold = np.asarray(buy_threshold, dtype=float)
+    p = len(buy_threshold)
+    sell_threshold = np.broadcast_to(np.asarray(sell_threshold, dtype=float), (p,))
+    trade_percent = np.broadcast_to(np.asarray(trade_percent, dtype=float), (p,))
+    buy_factor = 1 + np.broadcast_to(np.asarray(buy_slippage, dtype=float), (p,)) / 100
+    sell_factor = 1 - np.broadcast_to(np.asarray(sell_slippage, dtype=float), (p,)) / 100
+
+    pct_change, new_month = prepare_signals(close, dates) if signals is None else signals
+    deposit = monthly_investment > 0
+
+    cash = np.full(p, float(initial_cash))
+    shares = np.zeros(p)
+    trades = np.zeros(p, dtype=np.int64)
+    peak = np.full(p, -np.inf)
+    max_drawdown = np.zeros(p)
+
+    for i, (close_price, change) in enumerate(zip(close.tolist(), pct_change.tolist())):
+        if deposit and new_month[i]:
+            cash += monthly_investment
+
+        value = cash + shares * close_price
+        np.maximum(peak, value, out=peak)
+        np.maximum(max_drawdown, (peak - value) / peak, out=max_drawdown)
+
+        if change != change:  # NaN on the first day
+            continue
+
+        buying = change > buy_threshold
+        if buying.any():
+            buy_price = close_price * buy_factor[buying]
+            shares_to_buy = (cash[buying] * trade_percent[buying]) / buy_price
+            cost = shares_to_buy * buy_price
+            ok = cost <= cash[buying]
+            idx = np.flatnonzero(buying)[ok]
+            cash[idx] -= cost[ok]
+            shares[idx] += shares_to_buy[ok]
+            trades[idx] += 1
+
+        selling = (change < sell_threshold) & ~buying
+        if selling.any():
+            sell_price = close_price * sell_factor[selling]
+            shares_to_sell = shares[selling] * trade_percent[selling]
+            ok = shares_to_sell > 0
+            idx = np.flatnonzero(selling)[ok]
+            cash[idx] += shares_to_sell[ok] * sell_price[ok]
+            shares[idx] -= shares_to_sell[ok]
+            trades[idx] += 1
+
+    return {
+        'final_cash': cash,
+        'final_shares': shares,
+        'final_value': cash + shares * close[-1],
+        'trades': trades,
+        'max_drawdown': max_drawdown,
+    }
+
+
+def run_sweep(
+    ticker_id: int,
+    start_date: date,
+    end_date: date,
+    initial_cash: float,
+    buy_thresholds: Sequence[float],
+    sell_thresholds: Sequence[float],
+    trade_percents: Sequence[float] = (0.5,),
+    buy_slippages: Sequence[float] = (1.0,),
+    sell_slippages: Sequence[float] = (1.0,),
+    monthly_investment: float = 0.0,
+) -> pd.DataFrame:
+    """
+    Run the full grid of threshold / trade-size / slippage settings for one ticker.
+
+    Prices come from the shared PriceMatrix, so no DB query is made. Returns one row per
+    combination with the parameters and the sweep_arrays results (empty if there is no data).
+    """
+    grid = parameter_grid(buy_threshold=buy_thresholds, sell_threshold=sell_thresholds,
+                          trade_percent=trade_percents, buy_slippage=buy_slippages,
+                          sell_slippage=sell_slippages)
+    matrix = get_price_matrix()
+    if ticker_id not in matrix.ticker_ids:
+        return grid.iloc[0:0]
+    dates, close = matrix.series(ticker_id, 'close', start_date, end_date)
+    if len(close) == 0:
+        return grid.iloc[0:0]
+
+    results = sweep_arrays(np.ascontiguousarray(close, dtype=float), dates, initial_cash,
+                           monthly_investment=monthly_investment, **{n: grid[n].to_numpy() for n in SWEEP_PARAMS})
+    for name, values in results.items():
+        grid[name] = values
+    return grid
+
+
+# === CHECK / BENCHMARK ===
+if __name__ == "__main__":
+    import time
+    from trading_bot import simulate_arrays
+
+    rng = np.random.default_rng(7)
+    dates = np.arange(np.datetime64('2014-01-01'), np.datetime64('2024-01-01'))
+    dates = dates[np.is_busday(dates)]
+    close = 100 * np.exp(rng.normal(0, 0.02, len(dates)).cumsum())
+
+    grid = parameter_grid(buy_threshold=np.linspace(0, 5, 50), sell_threshold=np.linspace(-5, 0, 50),
+                          trade_percent=[0.5], buy_slippage=[1.0], sell_slippage=[0.5])
+    t0 = time.perf_counter()
+    out = sweep_arrays(close, dates, 10000.0, monthly_investment=100.0, **{n: grid[n].to_numpy() for n in SWEEP_PARAMS})
+    print(f"50x50 grid over {len(close)} days: {time.perf_counter() - t0:.2f}s")
+
+    pct_change, new_month = prepare_signals(close, dates)
+    for j in rng.choice(len(grid), 25, replace=False):
+        row = grid.iloc[j]
+        single = simulate_arrays(close, pct_change, new_month, 10000.0, row.buy_threshold, row.sell_threshold,
+                                 row.buy_slippage, row.sell_slippage, row.trade_percent, 100.0)
+        assert single['final_cash'] == out['final_cash'][j] and single['final_shares'] == out['final_shares'][j]
+        assert (single['trades']['action'] != 0).sum() == out['trades'][j]
+    print("spot check passed: sweep matches individual simulate_arrays runs exactly")
@@ -1,10 +1,9 @@
 import pandas as pd
-from data_layer import engine, Price
-from sqlalchemy.orm import sessionmaker
+import numpy as np
+from data_layer import load_prices, get_data_version, on_prices_changed
+from sim_cache import simulation_cache, checkpoint_cache
 from datetime import date, timedelta
-from typing import List, Dict, Any
-
-Session = sessionmaker(bind=engine)
+from typing import List, Dict, Any, Optional, Callable, Iterator, Sequence, Union
 
 # Define a class for the trade records for clarity
 class Trade:
@@ -24,136 +23,605 @@ class Trade:
             'Cash Change': self.cash_change
         }
 
-def run_simulation(
-    ticker_id: int,
-    start_date: date,
-    end_date: date,
+# === SIMULATION KERNEL ===
+# Trade log rows: day index into the price arrays, action code, shares, price, cash change.
+ACTION_NAMES = ('DEPOSIT', 'BUY', 'SELL')
+DEPOSIT, BUY, SELL = 0, 1, 2
+TRADE_DTYPE = np.dtype([
+    ('day', np.int64),
+    ('action', np.int8),
+    ('shares', np.float64),
+    ('price', np.float64),
+    ('cash_change', np.float64),
+])
+
+def prepare_signals(close: np.ndarray, dates: np.ndarray, prev_close: Optional[float] = None,
+                    prev_month: Optional[np.datetime64] = None):
+    """
+    Vectorised inputs for the kernel: day-over-day % change (NaN on day 0, same float ops
+    as pandas pct_change() * 100) and a mask of the first trading day of each calendar month.
+
+    When continuing a run, pass the checkpoint's last close and last deposit month so day 0
+    is treated exactly as it would be mid-series.
+    """
+    pct_change = np.full(len(close), np.nan)
+    pct_change[1:] = (close[1:] / close[:-1] - 1) * 100
+    months = dates.astype('datetime64[M]')
+    new_month = np.ones(len(dates), dtype=bool)
+    new_month[1:] = months[1:] != months[:-1]
+    if len(close):
+        if prev_close is not None:
+            pct_change[0] = (close[0] / prev_close - 1) * 100
+        if prev_month is not None:
+            new_month[0] = months[0] != np.datetime64(prev_month, 'M')
+    return pct_change, new_month
+
+def execute_signals(
+    close: np.ndarray,
+    buy: np.ndarray,
+    sell: np.ndarray,
+    new_month: np.ndarray,
     initial_cash: float,
-    buy_threshold: float,
-    sell_threshold: float,
     buy_slippage: float,
     sell_slippage: float,
     trade_percent: float,
     monthly_investment: float = 0.0,
+    initial_shares: float = 0.0,
 ) -> Dict[str, Any]:
     """
-    Runs a trading simulation based on simple percentage-based rules.
-    
-    Returns: A dictionary with 'history_df' (portfolio value/cash/shares over time) 
-             and 'trades' (list of Trade objects).
+    Execution loop shared by every strategy: consumes precomputed boolean buy/sell arrays
+    (buy wins when both are set) and applies deposits, slippage and trade sizing.
+
+    Returns 'cash' and 'shares' per day (after that day's deposit, before its trade, as
+    recorded in the history), the structured TRADE_DTYPE log, and the end state.
     """
-    session = Session()
-    try:
-        # 1. Fetch Price Data
-        prices_db = session.query(Price).filter(
-            Price.ticker_id == ticker_id,
-            Price.date >= start_date,
-            Price.date <= end_date
-        ).order_by(Price.date).all()
-    finally:
-        session.close()
-
-    if not prices_db:
-        return {"error": "No price data available for the selected ticker and date range."}
+    n = len(close)
+    cash_out = np.empty(n)
+    shares_out = np.empty(n)
+    # At most one deposit and one trade per day
+    trades = np.empty(2 * n, dtype=TRADE_DTYPE)
+    k = 0
 
-    # Validate monthly_investment
-    if monthly_investment < 0:
-        raise ValueError("monthly_investment must be non-negative")
+    buy_factor = 1 + buy_slippage / 100
+    sell_factor = 1 - sell_slippage / 100
+    deposit = monthly_investment > 0
 
-    # Convert to DataFrame for easier manipulation and adding calculated fields
-    prices = pd.DataFrame([
-        {'date': p.date, 'close': p.close, 'open': p.open_price, 'high': p.high, 'low': p.low} 
-        for p in prices_db
-    ])
-    prices.set_index('date', inplace=True)
-    
-    # Calculate daily percentage change
-    prices['pct_change'] = prices['close'].pct_change() * 100
-
-    # 2. Initialize Portfolio
     cash = initial_cash
-    shares = 0.0
-    trades: List[Trade] = []
-    history: List[Dict[str, Any]] = []
-    
-    # Track the last investment date so we deposit on the first trading day of a new month
-    last_investment_date = start_date - timedelta(days=31)
-
-    # 3. Run Simulation Day by Day
-    for current_date, row in prices.iterrows():
-        close_price = row['close']
-        daily_pct_change = row['pct_change']
-        
-        # --- Monthly Investment (Revised Logic) ---
-        # Deposit once per calendar month on the first observed trading day for that month.
-        if monthly_investment > 0 and (current_date.year, current_date.month) != (last_investment_date.year, last_investment_date.month):
+    shares = initial_shares
+    closes = close.tolist()
+    buys = buy.tolist()
+    sells = sell.tolist()
+    month_starts = new_month.tolist()
+    for i in range(n):
+        close_price = closes[i]
+
+        # Deposit once per calendar month on the first observed trading day for that month
+        if deposit and month_starts[i]:
             cash += monthly_investment
-            last_investment_date = current_date
-            trades.append(Trade(current_date, 'DEPOSIT', 0.0, close_price, monthly_investment))
-
-        # --- Calculate Current Value ---
-        asset_value = shares * close_price
-        portfolio_value = cash + asset_value
-        
-        history.append({
-            'Date': current_date,
-            'Cash': cash,
-            'Shares': shares,
-            'Asset Value': asset_value,
-            'Portfolio Value': portfolio_value,
-            'Price': close_price
-        })
-
-        # Skip the first day as pct_change is NaN
-        if pd.isna(daily_pct_change):
-            continue
+            trades[k] = (i, DEPOSIT, 0.0, close_price, monthly_investment)
+            k += 1
+
+        cash_out[i] = cash
+        shares_out[i] = shares
 
-        # --- Trading Logic ---
-        
-        # BUY signal: Price grew over the threshold
-        if daily_pct_change > buy_threshold:
-            # Calculate actual buy price with slippage
-            buy_price = close_price * (1 + buy_slippage / 100)
-            
-            # Amount to spend: trade_percent of current cash
-            amount_to_spend = cash * trade_percent
-            
-            # Shares to buy
-            shares_to_buy = amount_to_spend / buy_price
-            
-            if shares_to_buy * buy_price <= cash:
-                cash -= shares_to_buy * buy_price
+        if buys[i]:
+            buy_price = close_price * buy_factor
+            shares_to_buy = (cash * trade_percent) / buy_price
+            cost = shares_to_buy * buy_price
+            if cost <= cash:
+                cash -= cost
                 shares += shares_to_buy
-                trades.append(Trade(current_date, 'BUY', shares_to_buy, buy_price, -(shares_to_buy * buy_price)))
-
-        # SELL signal: Price fell below the threshold (or negative threshold)
-        elif daily_pct_change < sell_threshold:
-            # Calculate actual sell price with slippage
-            sell_price = close_price * (1 - sell_slippage / 100)
-            
-            # Shares to sell: trade_percent of current shares
+                trades[k] = (i, BUY, shares_to_buy, buy_price, -cost)
+                k += 1
+
+        elif sells[i]:
+            sell_price = close_price * sell_factor
             shares_to_sell = shares * trade_percent
-            
             if shares_to_sell > 0:
-                cash += shares_to_sell * sell_price
+                proceeds = shares_to_sell * sell_price
+                cash += proceeds
                 shares -= shares_to_sell
-                trades.append(Trade(current_date, 'SELL', shares_to_sell, sell_price, shares_to_sell * sell_price))
+                trades[k] = (i, SELL, shares_to_sell, sell_price, proceeds)
+                k += 1
 
-    # Final History DataFrame
-    history_df = pd.DataFrame(history)
-    history_df['Date'] = pd.to_datetime(history_df['Date'])
-
-    # Calculate final asset value based on the final price
-    final_asset_value = history_df['Price'].iloc[-1] * shares
-    
     return {
-        'history_df': history_df, 
-        'trades': [t.to_dict() for t in trades],
+        'cash': cash_out,
+        'shares': shares_out,
+        'trades': trades[:k].copy(),
         'final_cash': cash,
         'final_shares': shares,
-        'final_asset_value': final_asset_value
     }
 
+def simulate_arrays(
+    close: np.ndarray,
+    pct_change: np.ndarray,
+    new_month: np.ndarray,
+    initial_cash: float,
+    buy_threshold: float,
+    sell_threshold: float,
+    buy_slippage: float,
+    sell_slippage: float,
+    trade_percent: float,
+    monthly_investment: float = 0.0,
+    initial_shares: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    Run the threshold rules over contiguous arrays: BUY when the day's % change is over
+    buy_threshold, SELL when it is under sell_threshold (never on the NaN first day).
+
+    The scalar arithmetic is the same, in the same order, as the original per-row loop,
+    so results match it bit for bit. See execute_signals for the outputs.
+    """
+    return execute_signals(close, pct_change > buy_threshold, pct_change < sell_threshold, new_month,
+                           initial_cash, buy_slippage, sell_slippage, trade_percent,
+                           monthly_investment, initial_shares)
+
+# === CHECKPOINTS ===
+# A run's history for an earlier end_date is a prefix of the longer run, and its end state
+# is all the kernel needs to carry on. So runs are kept per (ticker, start, parameters) and
+# extended or cut to the requested end_date instead of replayed from start_date.
+class SimulationCheckpoint:
+    """End state of a run: enough to continue it over later bars. to_dict() is JSON-safe."""
+    def __init__(self, last_date: date, last_close: float, cash: float, shares: float,
+                 last_deposit_month: Optional[str] = None):
+        self.last_date = last_date
+        self.last_close = last_close
+        self.cash = cash
+        self.shares = shares
+        self.last_deposit_month = last_deposit_month  # 'YYYY-MM', None before any deposit
+
+    @classmethod
+    def from_run(cls, run: Dict[str, np.ndarray]) -> 'SimulationCheckpoint':
+        log = run['trades']
+        deposits = log['day'][log['action'] == DEPOSIT]
+        month = str(run['dates'][deposits[-1]].astype('datetime64[M]')) if len(deposits) else None
+        return cls(run['dates'][-1].item(), float(run['close'][-1]), float(run['final_cash']),
+                   float(run['final_shares']), month)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'last_date': self.last_date.isoformat(),
+            'last_close': self.last_close,
+            'cash': self.cash,
+            'shares': self.shares,
+            'last_deposit_month': self.last_deposit_month,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> 'SimulationCheckpoint':
+        return cls(date.fromisoformat(d['last_date']), d['last_close'], d['cash'], d['shares'],
+                   d.get('last_deposit_month'))
+
+def continue_simulation(checkpoint: SimulationCheckpoint, close: np.ndarray, dates: np.ndarray,
+                        buy_threshold: float, sell_threshold: float, buy_slippage: float,
+                        sell_slippage: float, trade_percent: float,
+                        monthly_investment: float = 0.0) -> Dict[str, Any]:
+    """simulate_arrays over bars after checkpoint.last_date, starting from its end state."""
+    prev_month = (np.datetime64(checkpoint.last_deposit_month, 'M')
+                  if checkpoint.last_deposit_month else None)
+    pct_change, new_month = prepare_signals(close, dates, checkpoint.last_close, prev_month)
+    return simulate_arrays(close, pct_change, new_month, checkpoint.cash, buy_threshold,
+                           sell_threshold, buy_slippage, sell_slippage, trade_percent,
+                           monthly_investment, initial_shares=checkpoint.shares)
+
+def _truncate_run(run: Dict[str, np.ndarray], n_bars: int) -> Optional[Dict[str, np.ndarray]]:
+    """The run as if it had stopped after its first n_bars bars (None if n_bars is 0)."""
+    if n_bars >= len(run['dates']):
+        return run
+    if n_bars == 0:
+        return None
+    log = run['trades']
+    log = log[log['day'] < n_bars]
+    # Recorded cash/shares are before the day's trade; replay that one trade to get the end state
+    cash, shares = run['cash'][n_bars - 1], run['shares'][n_bars - 1]
+    for trade in log[(log['day'] == n_bars - 1) & (log['action'] != DEPOSIT)]:
+        cash = cash + trade['cash_change']
+        shares = (shares + trade['shares']) if trade['action'] == BUY else (shares - trade['shares'])
+    return {
+        'dates': run['dates'][:n_bars],
+        'close': run['close'][:n_bars],
+        'cash': run['cash'][:n_bars],
+        'shares': run['shares'][:n_bars],
+        'trades': log,
+        'final_cash': np.float64(cash),
+        'final_shares': np.float64(shares),
+    }
+
+def _extend_run(run: Dict[str, np.ndarray], close: np.ndarray, dates: np.ndarray, *rules) -> Dict[str, np.ndarray]:
+    out = continue_simulation(SimulationCheckpoint.from_run(run), close, dates, *rules)
+    trades = out['trades']
+    trades['day'] += len(run['dates'])
+    return {
+        'dates': np.concatenate([run['dates'], dates]),
+        'close': np.concatenate([run['close'], close]),
+        'cash': np.concatenate([run['cash'], out['cash']]),
+        'shares': np.concatenate([run['shares'], out['shares']]),
+        'trades': np.concatenate([run['trades'], trades]),
+        'final_cash': np.float64(out['final_cash']),
+        'final_shares': np.float64(out['final_shares']),
+    }
+
+def checkpoint_key(ticker_id: int, start_date, initial_cash: float, buy_threshold: float,
+                   sell_threshold: float, buy_slippage: float, sell_slippage: float,
+                   trade_percent: float, monthly_investment: float) -> tuple:
+    return (int(ticker_id), str(start_date), float(initial_cash), float(buy_threshold),
+            float(sell_threshold), float(buy_slippage), float(sell_slippage),
+            float(trade_percent), float(monthly_investment))
+
+def _resume_or_simulate(ticker_id, version, start_date, end_date, initial_cash, *rules):
+    """
+    Serve a run from its stored checkpoint when it was built on the current data: cut it
+    if end_date is earlier, or simulate only the bars after it. Otherwise run in full.
+    """
+    key = checkpoint_key(ticker_id, start_date, initial_cash, *rules)
+    saved = checkpoint_cache.get(key)
+    if saved is not None and int(saved['data_version']) != version:
+        saved = None  # prices were written by another process; we can't tell which bars changed
+    if saved is None:
+        run = _simulate_ticker(ticker_id, start_date, end_date, initial_cash, *rules)
+    else:
+        run = {name: arr for name, arr in saved.items() if name != 'data_version'}
+        last_date = run['dates'][-1]
+        end = None if end_date is None else np.datetime64(pd.Timestamp(end_date).date(), 'D')
+        if end is not None and end <= last_date:
+            return _truncate_run(run, int(np.searchsorted(run['dates'], end, side='right')))
+        data = load_prices([ticker_id], (last_date + 1).item(), end_date, columns=('close',), as_arrays=True)
+        if len(data['date']) == 0:
+            return run
+        run = _extend_run(run, data['close'], data['date'], *rules)
+    if run is not None:
+        checkpoint_cache.put(key, {**run, 'data_version': np.int64(version)})
+    return run
+
+@on_prices_changed
+def _rewind_checkpoints(changes: dict):
+    # Keep each stored run up to the bar before the earliest rewritten date, so the next
+    # request only re-simulates from there.
+    for ticker_id, since in changes.items():
+        version = get_data_version(ticker_id) if since is not None else None
+        if version is None:
+            checkpoint_cache.discard_ticker(ticker_id)
+            continue
+        since = np.datetime64(pd.Timestamp(since).date(), 'D')
+
+        def rewind(saved, since=since, version=version):
+            run = {name: arr for name, arr in saved.items() if name != 'data_version'}
+            run = _truncate_run(run, int(np.searchsorted(run['dates'], since, side='left')))
+            return None if run is None else {**run, 'data_version': np.int64(version)}
+        checkpoint_cache.rewrite_ticker(ticker_id, rewind)
+
+def simulation_key(ticker_id: int, data_version: int, start_date, end_date, initial_cash: float,
+                   buy_threshold: float, sell_threshold: float, buy_slippage: float,
+                   sell_slippage: float, trade_percent: float, monthly_investment: float) -> tuple:
+    """Cache key for one run: every input that affects the result, plus the ticker's data version."""
+    return (int(ticker_id), int(data_version), str(start_date), str(end_date), float(initial_cash),
+            float(buy_threshold), float(sell_threshold), float(buy_slippage), float(sell_slippage),
+            float(trade_percent), float(monthly_investment))
+
+def _simulate_ticker(ticker_id, start_date, end_date, initial_cash, buy_threshold, sell_threshold,
+                     buy_slippage, sell_slippage, trade_percent, monthly_investment):
+    """Load one ticker's closes and run the kernel; returns the raw arrays, or None without data."""
+    # Only the close is used by the rules
+    data = load_prices([ticker_id], start_date, end_date, columns=('close',), as_arrays=True)
+    if len(data['date']) == 0:
+        return None
+
+    # Validate monthly_investment
+    if monthly_investment < 0:
+        raise ValueError("monthly_investment must be non-negative")
+
+    close, dates = data['close'], data['date']
+    pct_change, new_month = prepare_signals(close, dates)
+    out = simulate_arrays(close, pct_change, new_month, initial_cash, buy_threshold, sell_threshold,
+                          buy_slippage, sell_slippage, trade_percent, monthly_investment)
+    return {
+        'dates': dates,
+        'close': close,
+        'cash': out['cash'],
+        'shares': out['shares'],
+        'trades': out['trades'],
+        'final_cash': np.float64(out['final_cash']),
+        'final_shares': np.float64(out['final_shares']),
+    }
+
+# === RESULTS ===
+TRADE_COLUMNS = ['Date', 'Action', 'Shares', 'Price', 'Cash Change']
+
+class SimulationResult:
+    """
+    Columnar outcome of one run: per-day NumPy columns, the TRADE_DTYPE trade log and the
+    end state. The arrays may be shared with the result caches, so they are read-only views.
+    DataFrame views and summaries are computed on first access and kept.
+    A run without data has `error` set and empty columns.
+    """
+    __slots__ = ('dates', 'close', 'cash', 'shares', 'trades', 'final_cash', 'final_shares',
+                 'error', '_cache')
+
+    def __init__(self, run: Optional[Dict[str, np.ndarray]] = None, error: Optional[str] = None):
+        if run is None:
+            run = {
+                'dates': np.empty(0, dtype='datetime64[D]'), 'close': np.empty(0),
+                'cash': np.empty(0), 'shares': np.empty(0), 'trades': np.empty(0, dtype=TRADE_DTYPE),
+                'final_cash': 0.0, 'final_shares': 0.0,
+            }
+        for name in ('dates', 'close', 'cash', 'shares', 'trades'):
+            view = run[name].view()
+            view.flags.writeable = False
+            setattr(self, name, view)
+        self.final_cash = float(run['final_cash'])
+        self.final_shares = float(run['final_shares'])
+        self.error = error
+        self._cache = {}
+
+    def _cached(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    def __len__(self):
+        return len(self.dates)
+
+    # --- summaries ---
+    @property
+    def asset_value(self) -> np.ndarray:
+        return self._cached('asset_value', lambda: self.shares * self.close)
+
+    @property
+    def portfolio_value(self) -> np.ndarray:
+        return self._cached('portfolio_value', lambda: self.cash + self.asset_value)
+
+    @property
+    def is_deposit(self) -> np.ndarray:
+        return self._cached('is_deposit', lambda: self.trades['action'] == DEPOSIT)
+
+    @property
+    def is_buy(self) -> np.ndarray:
+        return self._cached('is_buy', lambda: self.trades['action'] == BUY)
+
+    @property
+    def is_sell(self) -> np.ndarray:
+        return self._cached('is_sell', lambda: self.trades['action'] == SELL)
+
+    @property
+    def total_deposits(self) -> float:
+        return self._cached('total_deposits', lambda: float(self.trades['cash_change'][self.is_deposit].sum()))
+
+    @property
+    def daily_deposits(self) -> np.ndarray:
+        """Cash deposited on each day (0 on most days), for flow-adjusted returns."""
+        def build():
+            flows = np.zeros(len(self.dates))
+            np.add.at(flows, self.trades['day'][self.is_deposit], self.trades['cash_change'][self.is_deposit])
+            return flows
+        return self._cached('daily_deposits', build)
+
+    @property
+    def final_asset_value(self) -> float:
+        # Kept as a NumPy scalar: the same value history_df['Price'].iloc[-1] * shares gives
+        return self.close[-1] * self.final_shares if len(self.close) else 0.0
+
+    @property
+    def final_value(self) -> float:
+        return self.final_cash + self.final_asset_value
+
+    @property
+    def checkpoint(self) -> SimulationCheckpoint:
+        return self._cached('checkpoint', lambda: SimulationCheckpoint.from_run({
+            name: getattr(self, name) for name in ('dates', 'close', 'trades', 'final_cash', 'final_shares')}))
+
+    # --- DataFrame views ---
+    @property
+    def history_df(self) -> pd.DataFrame:
+        """Portfolio value/cash/shares per day."""
+        return self._cached('history_df', lambda: pd.DataFrame({
+            'Date': pd.to_datetime(self.dates),
+            'Cash': self.cash,
+            'Shares': self.shares,
+            'Asset Value': self.asset_value,
+            'Portfolio Value': self.portfolio_value,
+            'Price': self.close,
+        }))
+
+    @property
+    def trades_df(self) -> pd.DataFrame:
+        """Trade log with TRADE_COLUMNS (always present, even with no trades)."""
+        return self._cached('trades_df', lambda: pd.DataFrame({
+            'Date': pd.to_datetime(self.dates[self.trades['day']]),
+            'Action': pd.Categorical.from_codes(self.trades['action'], categories=ACTION_NAMES),
+            'Shares': self.trades['shares'],
+            'Price': self.trades['price'],
+            'Cash Change': self.trades['cash_change'],
+        }, columns=TRADE_COLUMNS))
+
+    def trade_records(self) -> List[Dict[str, Any]]:
+        """The trade log as Trade.to_dict()-shaped dicts."""
+        log = self.trades
+        return [dict(zip(TRADE_COLUMNS, row)) for row in zip(
+            self.dates[log['day']].tolist(), [ACTION_NAMES[a] for a in log['action'].tolist()],
+            log['shares'].tolist(), log['price'].tolist(), log['cash_change'].tolist())]
+
+    def to_legacy_dict(self) -> Dict[str, Any]:
+        """The dict run_simulation used to return ({'error': ...} for a run without data)."""
+        if self.error:
+            return {'error': self.error}
+        return {
+            'history_df': self.history_df,
+            'trades': self.trade_records(),
+            'final_cash': self.final_cash,
+            'final_shares': self.final_shares,
+            'final_asset_value': self.final_asset_value,
+        }
+
+def _current_version(ticker_id: int, data_version: Optional[int] = None):
+    """The caller's known data_version, else a lookup (None if the ticker doesn't exist)."""
+    return data_version if data_version is not None else get_data_version(ticker_id)
+
+def run_simulation(
+    ticker_id: int,
+    start_date: date,
+    end_date: date,
+    initial_cash: float,
+    buy_threshold: float,
+    sell_threshold: float,
+    buy_slippage: float,
+    sell_slippage: float,
+    trade_percent: float,
+    monthly_investment: float = 0.0,
+    use_cache: bool = True,
+    on_progress: Optional[Callable[['SimulationProgress'], None]] = None,
+    stop_when=None,
+    data_version: Optional[int] = None,
+) -> SimulationResult:
+    """
+    Runs a trading simulation based on simple percentage-based rules.
+
+    Results are memoized in sim_cache.simulation_cache, keyed on every argument plus the
+    ticker's data_version, so repeat runs skip both the query and the loop and new data is
+    never served stale. A run with the same parameters but a different end_date resumes
+    from the stored checkpoint and only simulates bars it hasn't seen (see CHECKPOINTS).
+
+    Passing on_progress and/or stop_when runs it through stream_simulation instead:
+    on_progress gets each SimulationProgress, and the result may end early. A known
+    data_version (e.g. from page_cache's ticker list) saves the version lookup query.
+
+    Returns: A SimulationResult; its `error` is set when there is no price data in range.
+    """
+    params = (start_date, end_date, initial_cash, buy_threshold, sell_threshold,
+              buy_slippage, sell_slippage, trade_percent, monthly_investment)
+    if on_progress is not None or stop_when is not None:
+        for progress in stream_simulation(ticker_id, *params, stop_when=stop_when, use_cache=use_cache,
+                                          data_version=data_version):
+            if on_progress is not None:
+                on_progress(progress)
+        return progress.result
+    version = _current_version(ticker_id, data_version) if use_cache else None
+    key = simulation_key(ticker_id, version, *params) if version is not None else None
+
+    out = simulation_cache.get(key) if key is not None else None
+    if out is None:
+        if version is None:
+            out = _simulate_ticker(ticker_id, *params)
+        else:
+            out = _resume_or_simulate(ticker_id, version, *params)
+        if out is None:
+            return SimulationResult(error="No price data available for the selected ticker and date range.")
+        if key is not None:
+            simulation_cache.put(key, out)
+    return SimulationResult(out)
+
+# === STREAMING ===
+STREAM_CHUNK_BARS = 250  # about one trading year per update
+
+class SimulationProgress:
+    """Partial state yielded by stream_simulation after each chunk of bars."""
+    __slots__ = ('result', 'done', 'total', 'stopped')
+
+    def __init__(self, result: SimulationResult, done: int, total: int, stopped: bool = False):
+        self.result = result  # SimulationResult over the bars processed so far
+        self.done = done
+        self.total = total
+        self.stopped = stopped
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total else 1.0
+
+    @property
+    def date(self) -> Optional[date]:
+        return self.result.dates[-1].item() if self.done else None
+
+    @property
+    def value(self) -> float:
+        return float(self.result.portfolio_value[-1]) if self.done else self.result.final_cash
+
+    @property
+    def max_drawdown(self) -> float:
+        """Largest peak-to-trough fall of portfolio value so far, as a fraction (deposits included)."""
+        if not self.done:
+            return 0.0
+        value = self.result.portfolio_value
+        peak = np.maximum.accumulate(value)
+        return float(((peak - value) / peak).max())
+
+def max_drawdown_stop(limit: float) -> Callable[[SimulationProgress], bool]:
+    """Early-stop predicate: stop once the drawdown so far exceeds `limit` (e.g. 0.5 = 50%)."""
+    return lambda progress: progress.max_drawdown > limit
+
+def stream_simulation(
+    ticker_id: int,
+    start_date: date,
+    end_date: date,
+    initial_cash: float,
+    buy_threshold: float,
+    sell_threshold: float,
+    buy_slippage: float,
+    sell_slippage: float,
+    trade_percent: float,
+    monthly_investment: float = 0.0,
+    chunk_bars: int = STREAM_CHUNK_BARS,
+    stop_when: Optional[Union[Callable[[SimulationProgress], bool], Sequence[Callable]]] = None,
+    use_cache: bool = True,
+    data_version: Optional[int] = None,
+) -> Iterator[SimulationProgress]:
+    """
+    run_simulation, one chunk of bars at a time: yields a SimulationProgress after each
+    chunk, and stops early (progress.stopped) as soon as any `stop_when` predicate is true.
+
+    Chunks run the same kernel with the state carried over, so a run that isn't stopped
+    ends with exactly run_simulation's result; that result is cached like run_simulation's.
+    A cached result is yielded at once. Without data, one progress with result.error set
+    is yielded.
+    """
+    predicates = [] if stop_when is None else [stop_when] if callable(stop_when) else list(stop_when)
+    params = (start_date, end_date, initial_cash, buy_threshold, sell_threshold,
+              buy_slippage, sell_slippage, trade_percent, monthly_investment)
+    version = _current_version(ticker_id, data_version) if use_cache else None
+    key = simulation_key(ticker_id, version, *params) if version is not None else None
+    cached = simulation_cache.get(key) if key is not None else None
+    if cached is not None:
+        yield SimulationProgress(SimulationResult(cached), len(cached['dates']), len(cached['dates']))
+        return
+
+    data = load_prices([ticker_id], start_date, end_date, columns=('close',), as_arrays=True)
+    if len(data['date']) == 0:
+        yield SimulationProgress(SimulationResult(error="No price data available for the selected ticker and date range."), 0, 0)
+        return
+    if monthly_investment < 0:
+        raise ValueError("monthly_investment must be non-negative")
+
+    close, dates = data['close'], data['date']
+    n = len(close)
+    pct_change, new_month = prepare_signals(close, dates)
+    cash_out, shares_out = np.empty(n), np.empty(n)
+    logs = []
+    cash, shares = initial_cash, 0.0
+    for lo in range(0, n, max(1, chunk_bars)):
+        hi = min(lo + max(1, chunk_bars), n)
+        out = simulate_arrays(close[lo:hi], pct_change[lo:hi], new_month[lo:hi], cash, buy_threshold,
+                              sell_threshold, buy_slippage, sell_slippage, trade_percent,
+                              monthly_investment, initial_shares=shares)
+        cash, shares = out['final_cash'], out['final_shares']
+        cash_out[lo:hi], shares_out[lo:hi] = out['cash'], out['shares']
+        out['trades']['day'] += lo
+        logs.append(out['trades'])
+        run = {
+            'dates': dates[:hi],
+            'close': close[:hi],
+            'cash': cash_out[:hi],
+            'shares': shares_out[:hi],
+            'trades': np.concatenate(logs),
+            'final_cash': np.float64(cash),
+            'final_shares': np.float64(shares),
+        }
+        progress = SimulationProgress(SimulationResult(run), hi, n)
+        if hi < n and any(stop(progress) for stop in predicates):
+            progress.stopped = True
+            yield progress
+            return
+        if hi == n and key is not None:
+            simulation_cache.put(key, run)
+        yield progress
+
 # Convert Trade list to a DataFrame for display
 def trades_to_df(trades: List[Dict[str, Any]]) -> pd.DataFrame:
     return pd.DataFrame(trades)
@@ -163,4 +631,105 @@ def calculate_final_value(history_df: pd.DataFrame, final_cash: float, final_sha
     if history_df.empty:
         return final_cash
     last_price = history_df['Price'].iloc[-1]
-    return final_cash + (final_shares * last_price)
\ No newline at end of file
+    return final_cash + (final_shares * last_price)
+
+
+# === GOLDEN CHECK / BENCHMARK ===
+if __name__ == "__main__":
+    import time
+    import itertools
+
+    def reference_simulation(prices, start_date, initial_cash, buy_threshold, sell_threshold,
+                             buy_slippage, sell_slippage, trade_percent, monthly_investment):
+        """The original iterrows() loop, kept verbatim as the golden reference for the kernel."""
+        prices = prices.copy()
+        prices['pct_change'] = prices['close'].pct_change() * 100
+        cash, shares, trades, history = initial_cash, 0.0, [], []
+        last_investment_date = start_date - timedelta(days=31)
+        for current_date, row in prices.iterrows():
+            close_price = row['close']
+            daily_pct_change = row['pct_change']
+            if monthly_investment > 0 and (current_date.year, current_date.month) != (last_investment_date.year, last_investment_date.month):
+                cash += monthly_investment
+                last_investment_date = current_date
+                trades.append(Trade(current_date, 'DEPOSIT', 0.0, close_price, monthly_investment))
+            asset_value = shares * close_price
+            history.append({'Date': current_date, 'Cash': cash, 'Shares': shares, 'Asset Value': asset_value,
+                            'Portfolio Value': cash + asset_value, 'Price': close_price})
+            if pd.isna(daily_pct_change):
+                continue
+            if daily_pct_change > buy_threshold:
+                buy_price = close_price * (1 + buy_slippage / 100)
+                shares_to_buy = cash * trade_percent / buy_price
+                if shares_to_buy * buy_price <= cash:
+                    cash -= shares_to_buy * buy_price
+                    shares += shares_to_buy
+                    trades.append(Trade(current_date, 'BUY', shares_to_buy, buy_price, -(shares_to_buy * buy_price)))
+            elif daily_pct_change < sell_threshold:
+                sell_price = close_price * (1 - sell_slippage / 100)
+                shares_to_sell = shares * trade_percent
+                if shares_to_sell > 0:
+                    cash += shares_to_sell * sell_price
+                    shares -= shares_to_sell
+                    trades.append(Trade(current_date, 'SELL', shares_to_sell, sell_price, shares_to_sell * sell_price))
+        history_df = pd.DataFrame(history)
+        history_df['Date'] = pd.to_datetime(history_df['Date'])
+        return history_df, [t.to_dict() for t in trades], cash, shares
+
+    def kernel_simulation(close, dates, **params):
+        pct_change, new_month = prepare_signals(close, dates)
+        return simulate_arrays(close, pct_change, new_month, **params)
+
+    rng = np.random.default_rng(42)
+    dates = np.arange(np.datetime64('2010-01-04'), np.datetime64('2020-01-01'))
+    dates = dates[np.is_busday(dates)]
+    close = 100 * np.exp(rng.normal(0, 0.02, len(dates)).cumsum())
+    prices = pd.DataFrame({'close': close}, index=pd.Index(dates.tolist(), name='date'))
+
+    # Golden check: kernel history/trades must equal the reference exactly
+    grid = itertools.product([0.5, 2.0, 5.0], [-0.5, -2.0, -10.0], [0.1, 0.5, 1.0], [0.0, 100.0])
+    for buy_t, sell_t, pct, monthly in grid:
+        params = dict(initial_cash=10000.0, buy_threshold=buy_t, sell_threshold=sell_t, buy_slippage=1.0,
+                      sell_slippage=0.5, trade_percent=pct, monthly_investment=monthly)
+        ref_history, ref_trades, ref_cash, ref_shares = reference_simulation(prices, dates[0].item(), **params)
+        out = kernel_simulation(close, dates, **params)
+        assert out['final_cash'] == ref_cash and out['final_shares'] == ref_shares, params
+        assert np.array_equal(out['cash'], ref_history['Cash'].to_numpy()), params
+        assert np.array_equal(out['shares'], ref_history['Shares'].to_numpy()), params
+        asset = out['shares'] * close
+        assert np.array_equal(out['cash'] + asset, ref_history['Portfolio Value'].to_numpy()), params
+        log = out['trades']
+        assert [ACTION_NAMES[a] for a in log['action']] == [t['Action'] for t in ref_trades], params
+        assert log['cash_change'].tolist() == [t['Cash Change'] for t in ref_trades], params
+        assert log['shares'].tolist() == [t['Shares'] for t in ref_trades], params
+    print("golden check passed: kernel matches the reference loop bit for bit")
+
+    # Resume check: stopping anywhere and continuing from the checkpoint changes nothing
+    params = dict(initial_cash=10000.0, buy_threshold=0.5, sell_threshold=-0.5, buy_slippage=1.0,
+                  sell_slippage=0.5, trade_percent=0.5, monthly_investment=100.0)
+    rules = [params[n] for n in ('buy_threshold', 'sell_threshold', 'buy_slippage', 'sell_slippage',
+                                 'trade_percent', 'monthly_investment')]
+    full = kernel_simulation(close, dates, **params)
+    full = {'dates': dates, 'close': close, **full}
+    for split in rng.integers(1, len(close), 20):
+        head = _truncate_run(full, split)
+        resumed = _extend_run(head, close[split:], dates[split:], *rules)
+        assert resumed['final_cash'] == full['final_cash'] and resumed['final_shares'] == full['final_shares']
+        assert np.array_equal(resumed['cash'], full['cash']) and np.array_equal(resumed['trades'], full['trades'])
+        checkpoint = SimulationCheckpoint.from_dict(SimulationCheckpoint.from_run(head).to_dict())
+        tail = continue_simulation(checkpoint, close[split:], dates[split:], *rules)
+        assert tail['final_cash'] == full['final_cash']
+    print("resume check passed: checkpoint + new bars matches the full run bit for bit")
+
+    params = dict(initial_cash=10000.0, buy_threshold=0.5, sell_threshold=-0.5, buy_slippage=1.0,
+                  sell_slippage=0.5, trade_percent=0.5, monthly_investment=100.0)
+    t0 = time.perf_counter()
+    reference_simulation(prices, dates[0].item(), **params)
+    ref_seconds = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    repeats = 20
+    for _ in range(repeats):
+        kernel_simulation(close, dates, **params)
+    kernel_seconds = (time.perf_counter() - t0) / repeats
+    print(f"{len(close)} days: reference {ref_seconds * 1000:.1f} ms, kernel {kernel_seconds * 1000:.2f} ms "
+          f"({ref_seconds / kernel_seconds:.0f}x)")
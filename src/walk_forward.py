@@ -0,0 +1,241 @@
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from multiprocessing import shared_memory
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from analytics import flow_adjusted_returns
+from backtest_runner import BACKTEST_WORKERS, pool_context, share_array
+from price_matrix import get_price_matrix
+from sweep import SWEEP_PARAMS, parameter_grid, sweep_arrays
+from trading_bot import TRADE_DTYPE, SimulationResult, prepare_signals, simulate_arrays
+
+logger = logging.getLogger(__name__)
+
+WALK_FORWARD_OBJECTIVES = ('final_value', 'return_over_drawdown')
+
+# Set in each pool process by _attach_series: numpy views over the parent's shared memory.
+# Only pool processes use it; in-process runs pass their series explicitly.
+_worker = {}
+
+
+def walk_forward_windows(n_bars: int, train_bars: int, test_bars: int,
+                         anchored: bool = False) -> List[Tuple[int, int, int]]:
+    """
+    (train_start, test_start, test_end) bar indices: train on [train_start, test_start), then
+    trade [test_start, test_end). Test windows tile the bars after the first training window;
+    anchored=True grows every training window from bar 0 instead of rolling it.
+    """
+    windows = []
+    for test_start in range(train_bars, n_bars, test_bars):
+        train_start = 0 if anchored else test_start - train_bars
+        windows.append((train_start, test_start, min(test_start + test_bars, n_bars)))
+    return windows
+
+
+def _score(out: dict, objective: str, deposits: float) -> np.ndarray:
+    if objective == 'return_over_drawdown':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (out['final_value'] / deposits - 1) / np.maximum(out['max_drawdown'], 1e-6)
+    return out['final_value']
+
+
+def _attach_series(specs, dates):
+    blocks = []
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        blocks.append(shm)  # keep the mapping alive for the worker's lifetime
+        _worker[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    _worker.update(blocks=blocks, dates=dates)
+
+
+def _optimize_window(job, series):
+    """Sweep the whole grid over one training window; returns (window, best row, best score)."""
+    k, lo, hi, params, initial_cash, monthly_investment, objective = job
+    # Train as a fresh run starting at `lo`: no signal and a deposit on its first bar
+    pct_change = series['pct_change'][lo:hi].copy()
+    new_month = series['new_month'][lo:hi].copy()
+    pct_change[0], new_month[0] = np.nan, True
+    out = sweep_arrays(series['close'][lo:hi], series['dates'][lo:hi], initial_cash,
+                       monthly_investment=monthly_investment, signals=(pct_change, new_month), **params)
+    deposits = initial_cash + monthly_investment * int(new_month.sum())
+    score = _score(out, objective, deposits)
+    best = int(np.nanargmax(score)) if not np.isnan(score).all() else 0
+    return k, best, float(score[best])
+
+
+def _optimize_pooled_window(job):
+    return _optimize_window(job, _worker)
+
+
+class WalkForwardResult:
+    """
+    Out-of-sample outcome of a walk-forward run: `windows` has one row per window (dates,
+    chosen parameters, in-sample score, out-of-sample return) and `result` is the chained
+    out-of-sample run as a SimulationResult (history_df, trades_df, final_value, ...).
+    """
+
+    def __init__(self, windows: pd.DataFrame, result: SimulationResult):
+        self.windows = windows
+        self.result = result
+
+    @property
+    def total_return(self) -> float:
+        """Time-weighted out-of-sample return (deposits removed)."""
+        r = flow_adjusted_returns(self.result.portfolio_value, self.result.daily_deposits)
+        return float(np.prod(1 + np.nan_to_num(r)) - 1)
+
+
+def run_walk_forward(
+    ticker_id: int,
+    start_date: date,
+    end_date: date,
+    initial_cash: float,
+    buy_thresholds: Sequence[float],
+    sell_thresholds: Sequence[float],
+    trade_percents: Sequence[float] = (0.5,),
+    buy_slippages: Sequence[float] = (1.0,),
+    sell_slippages: Sequence[float] = (1.0,),
+    monthly_investment: float = 0.0,
+    train_days: int = 504,
+    test_days: int = 63,
+    anchored: bool = False,
+    objective: str = 'final_value',
+    workers: Optional[int] = None,
+) -> Optional[WalkForwardResult]:
+    """
+    Walk-forward optimisation of the threshold rules for one ticker.
+
+    The range is split into rolling training windows of `train_days` bars, each followed by
+    `test_days` untouched bars. On every training window the full parameter grid runs as one
+    batched sweep and the best set by `objective` is kept; that set then trades the next
+    test window, carrying cash and shares over from the previous one, so the test windows
+    chain into one out-of-sample run.
+
+    Prices come from the shared PriceMatrix and daily signals are computed once for the
+    whole range; windows only slice them. Training windows are independent and run on a
+    process pool (`workers`, default BACKTEST_WORKERS) over shared memory; with 0 or 1
+    workers they run in this process. None if the range has no test window.
+    """
+    if objective not in WALK_FORWARD_OBJECTIVES:
+        raise ValueError(f"objective must be one of {WALK_FORWARD_OBJECTIVES}")
+    workers = BACKTEST_WORKERS if workers is None else workers
+    matrix = get_price_matrix()
+    if ticker_id not in matrix.ticker_ids:
+        return None
+    dates, close = matrix.series(ticker_id, 'close', start_date, end_date)
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    windows = walk_forward_windows(len(close), train_days, test_days, anchored)
+    if not windows:
+        return None
+
+    grid = parameter_grid(buy_threshold=buy_thresholds, sell_threshold=sell_thresholds,
+                          trade_percent=trade_percents, buy_slippage=buy_slippages,
+                          sell_slippage=sell_slippages)
+    params = {n: grid[n].to_numpy() for n in SWEEP_PARAMS}
+    pct_change, new_month = prepare_signals(close, dates)
+    jobs = [(k, lo, hi, params, initial_cash, monthly_investment, objective)
+            for k, (lo, hi, _) in enumerate(windows)]
+
+    t0 = time.perf_counter()
+    if workers <= 1 or len(jobs) == 1:
+        series = {'close': close, 'pct_change': pct_change, 'new_month': new_month, 'dates': dates}
+        picks = [_optimize_window(job, series) for job in jobs]
+    else:
+        shared = {name: share_array(array) for name, array in
+                  (('close', close), ('pct_change', pct_change), ('new_month', new_month))}
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(), initializer=_attach_series,
+                                     initargs=({n: spec for n, (_, spec) in shared.items()}, dates)) as pool:
+                picks = list(pool.map(_optimize_pooled_window, jobs))
+        finally:
+            for shm, _ in shared.values():
+                shm.close()
+                shm.unlink()
+    logger.info(f"Walk-forward: {len(windows)} windows x {len(grid)} parameter sets "
+                f"on {max(workers, 1)} processes: {time.perf_counter() - t0:.2f}s")
+
+    # Chain the test windows: each continues from the previous one's cash and shares
+    cash, shares = float(initial_cash), 0.0
+    parts, rows = [], []
+    first_test = windows[0][1]
+    for (lo, hi, end), (k, best, score) in zip(windows, picks):
+        chosen = grid.iloc[best]
+        segment_month = new_month[hi:end].copy()
+        if k == 0:
+            segment_month[0] = True  # the out-of-sample run starts here, like any fresh run
+        out = simulate_arrays(close[hi:end], pct_change[hi:end], segment_month, cash,
+                              chosen.buy_threshold, chosen.sell_threshold, chosen.buy_slippage,
+                              chosen.sell_slippage, chosen.trade_percent, monthly_investment,
+                              initial_shares=shares)
+        out['trades']['day'] += hi - first_test
+        parts.append(out)
+        cash, shares = out['final_cash'], out['final_shares']
+        rows.append({'Train Start': dates[lo], 'Test Start': dates[hi], 'Test End': dates[end - 1],
+                     **chosen.to_dict(), 'In-Sample Score': score})
+
+    run = {
+        'dates': dates[first_test:],
+        'close': close[first_test:],
+        'cash': np.concatenate([p['cash'] for p in parts]),
+        'shares': np.concatenate([p['shares'] for p in parts]),
+        'trades': np.concatenate([p['trades'] for p in parts]) if parts else np.empty(0, dtype=TRADE_DTYPE),
+        'final_cash': cash,
+        'final_shares': shares,
+    }
+    result = SimulationResult(run)
+    window_df = pd.DataFrame(rows)
+    # Time-weighted return of each test window, chained across window boundaries
+    growth = 1 + np.nan_to_num(flow_adjusted_returns(result.portfolio_value, result.daily_deposits))
+    bounds = np.array([hi for _, hi, _ in windows] + [len(close)]) - first_test
+    window_df['Test Return'] = [np.prod(growth[a:b]) - 1 for a, b in zip(bounds[:-1], bounds[1:])]
+    return WalkForwardResult(window_df, result)
+
+
+# === CHECK / BENCHMARK ===
+if __name__ == "__main__":
+    import os
+    import price_matrix
+
+    logging.basicConfig(level=logging.INFO)
+    rng = np.random.default_rng(23)
+    dates = np.arange(np.datetime64('2004-01-01'), np.datetime64('2024-01-01'))
+    dates = dates[np.is_busday(dates)]
+    close = 100 * np.exp(rng.normal(0.0002, 0.02, len(dates)).cumsum())
+    price_matrix._shared = price_matrix.PriceMatrix.from_arrays(
+        {'ticker_id': np.ones(len(dates), dtype=np.int64), 'date': dates, 'close': close})
+    buys, sells = np.linspace(0.5, 5, 10), np.linspace(-5, -0.5, 10)
+    args = (1, None, None, 10000.0, buys, sells)
+
+    for workers in sorted({0, 2, os.cpu_count() or 1}):
+        t0 = time.perf_counter()
+        wf = run_walk_forward(*args, monthly_investment=100.0, workers=workers)
+        print(f"workers={workers}: {len(wf.windows)} windows x {len(buys) * len(sells)} parameter sets "
+              f"in {time.perf_counter() - t0:.2f}s, out-of-sample return {wf.total_return:.2%}")
+
+    # Naive walk-forward: every (window, parameter set) as its own run on freshly sliced data
+    t0 = time.perf_counter()
+    cash, shares = 10000.0, 0.0
+    grid = parameter_grid(buy_threshold=buys, sell_threshold=sells, trade_percent=[0.5],
+                          buy_slippage=[1.0], sell_slippage=[1.0])
+    for k, (lo, hi, end) in enumerate(walk_forward_windows(len(close), 504, 63)):
+        pct, months = prepare_signals(close[lo:hi], dates[lo:hi])
+        finals = []
+        for row in grid.itertuples():
+            out = simulate_arrays(close[lo:hi], pct, months, 10000.0, row.buy_threshold, row.sell_threshold,
+                                  row.buy_slippage, row.sell_slippage, row.trade_percent, 100.0)
+            finals.append(out['final_cash'] + out['final_shares'] * close[hi - 1])
+        row = grid.iloc[int(np.argmax(finals))]
+        assert (row.buy_threshold, row.sell_threshold) == tuple(wf.windows.iloc[k][['buy_threshold', 'sell_threshold']])
+        pct, months = prepare_signals(close[hi:end], dates[hi:end], prev_close=close[hi - 1],
+                                      prev_month=None if k == 0 else dates[hi - 1])
+        out = simulate_arrays(close[hi:end], pct, months, cash, row.buy_threshold, row.sell_threshold,
+                              row.buy_slippage, row.sell_slippage, row.trade_percent, 100.0, initial_shares=shares)
+        cash, shares = out['final_cash'], out['final_shares']
+    print(f"naive per-run walk-forward: {time.perf_counter() - t0:.2f}s")
+    assert (cash, shares) == (wf.result.final_cash, wf.result.final_shares)
+    print("check passed: same parameter picks and out-of-sample end state as the naive loop")